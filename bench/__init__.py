@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Performance benchmarks
+
+They run against an in-memory stand-in of the directory (see
+bench.directory) and a SQLite database seeded with a fixed set of
+members (see bench.fixtures), so no LDAP server is needed and runs on
+the same machine are comparable.
+
+ - python -m bench.load: concurrent HTTP requests on the main pages
+ - python -m bench.models: micro-benchmarks of the model code
+ - python -m bench.compare: compare results with a stored baseline
+'''
+
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import multiprocessing
+
+
+def percentile(values, p):
+  '''The p-th percentile of sorted values, by the nearest-rank method'''
+  if not values:
+    return None
+
+  rank = max(int(-(-len(values) * p // 100)), 1)
+
+  return values[rank - 1]
+
+
+def summarize(seconds):
+  '''Statistics of a list of durations, in milliseconds'''
+  values = sorted(seconds)
+  ms = lambda v: round(v * 1000, 3) if v is not None else None
+
+  return {'mean': ms(sum(values) / len(values) if values else None),
+          'p50': ms(percentile(values, 50)),
+          'p90': ms(percentile(values, 90)),
+          'p99': ms(percentile(values, 99)),
+          'max': ms(values[-1] if values else None),
+          }
+
+
+def _revision():
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  try:
+    with open(os.devnull, 'w') as devnull:
+      return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, stderr=devnull).strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def environment():
+  '''What a result depends on besides the parameters of the run'''
+  return {'python': platform.python_version(),
+          'platform': platform.platform(),
+          'cpus': multiprocessing.cpu_count(),
+          'revision': _revision(),
+          'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+          }
+
+
+def write_results(results, path=None):
+  '''Write results as JSON to path, or to stdout'''
+  data = json.dumps(results, indent=2, sort_keys=True)
+  if path is None:
+    sys.stdout.write(data + '\n')
+  else:
+    with open(path, 'w') as f:
+      f.write(data + '\n')
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Compare benchmark results with a stored baseline
+
+  python -m bench.compare baseline.json results.json [--threshold 10]
+
+Lists the change of every measurement and exits with status 1 if one of
+them got worse by more than threshold percent. Results of runs with
+other parameters or on another machine are compared all the same, with
+a warning.
+'''
+
+import sys
+import json
+import argparse
+
+
+def measurements(results):
+  '''(label, value, higher is better) of every measurement in results'''
+  if results['benchmark'] == 'models':
+    for name, result in sorted(results['benchmarks'].items()):
+      yield name, result['best_us'], False
+  elif results['benchmark'] == 'load':
+    for name, result in sorted(results['scenarios'].items()):
+      yield name + ' p50', result['latency_ms']['p50'], False
+      yield name + ' p99', result['latency_ms']['p99'], False
+      yield name + ' throughput', result['throughput'], True
+  else:
+    raise ValueError('Unknown benchmark ' + results['benchmark'])
+
+
+def compare(baseline, current, threshold):
+  '''Return (label, baseline value, current value, change in percent,
+  regressed) for the measurements found in both results'''
+  if not baseline['benchmark'] == current['benchmark']:
+    raise ValueError('Results of different benchmarks')
+
+  old = dict((label, value) for label, value, higher in measurements(baseline))
+  rows = []
+
+  for label, value, higher_is_better in measurements(current):
+    before = old.get(label)
+    if not before or value is None:
+      continue
+
+    change = (value - before) * 100.0 / before
+    worse = -change if higher_is_better else change
+    rows.append((label, before, value, change, worse > threshold))
+
+  return rows
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Compare benchmark results with a baseline')
+  parser.add_argument('baseline')
+  parser.add_argument('current')
+  parser.add_argument('--threshold', type=float, default=10, help='percent, default: 10')
+  args = parser.parse_args(argv)
+
+  with open(args.baseline) as f:
+    baseline = json.load(f)
+  with open(args.current) as f:
+    current = json.load(f)
+
+  for key in ('parameters', 'environment'):
+    for k, v in sorted(current.get(key, {}).items()):
+      if k in ('time', 'revision'):
+        continue
+
+      if not baseline.get(key, {}).get(k) == v:
+        sys.stderr.write('warning: {0} differs: {1} was {2}\n'.format(k, v, baseline.get(key, {}).get(k)))
+
+  rows = compare(baseline, current, args.threshold)
+  for label, before, value, change, regressed in rows:
+    print '{0:<32} {1:>12} {2:>12} {3:>+8.1f}%{4}'.format(label, before, value, change, '  REGRESSION' if regressed else '')
+
+  return 1 if any(r[4] for r in rows) else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''In-memory stand-in of the LDAP directory
+
+Directory keeps the entries in a dict and answers the operations
+LdapModelFactory uses through DirectoryConnection, which has the
+interface of a python-ldap connection. Searches are evaluated by walking
+all entries, much like an LDAP server without indexes. An optional
+latency is added to every operation to stand for the round trip to the
+server.
+'''
+
+import re
+import time
+import itertools
+import threading
+import ldap
+
+
+def _parse_filter(text):
+  '''Parse an LDAP filter into nested tuples:
+  ('&', [f, ...]), ('|', [f, ...]), ('!', f), ('present', attr) and
+  ('match', attr, regex)'''
+  text = text.strip()
+  if not text.startswith('('):
+    # python-ldap accepts a bare item
+    text = '(' + text + ')'
+
+  f, end = _parse(text, 0)
+  if not end == len(text):
+    raise ldap.FILTER_ERROR('Trailing characters in ' + text)
+
+  return f
+
+
+def _parse(text, pos):
+  if not text[pos] == '(':
+    raise ldap.FILTER_ERROR('Expected ( in ' + text)
+
+  op = text[pos + 1]
+  if op in '&|':
+    items = []
+    pos += 2
+    while text[pos] == '(':
+      f, pos = _parse(text, pos)
+      items.append(f)
+
+    return (op, items), pos + 1
+  elif op == '!':
+    f, pos = _parse(text, pos + 2)
+    return ('!', f), pos + 1
+
+  end = text.index(')', pos)
+  attr, value = text[pos + 1:end].split('=', 1)
+  attr = attr.lower()
+  if value == '*':
+    return ('present', attr), end + 1
+
+  pattern = '.*'.join(re.escape(p) for p in value.split('*'))
+
+  return ('match', attr, re.compile('^' + pattern + '$', re.I)), end + 1
+
+
+def _matches(f, attrs):
+  kind = f[0]
+  if kind == '&':
+    return all(_matches(i, attrs) for i in f[1])
+  elif kind == '|':
+    return any(_matches(i, attrs) for i in f[1])
+  elif kind == '!':
+    return not _matches(f[1], attrs)
+  elif kind == 'present':
+    return f[1] in attrs
+
+  return any(f[2].match(v) for v in attrs.get(f[1], ()))
+
+
+def _values(value):
+  if value is None:
+    return []
+
+  return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+class Entry(object):
+  def __init__(self, dn, attributes):
+    self.dn = dn
+    # lower case name -> (name, values)
+    self.attributes = {}
+    for k, v in attributes.items():
+      self.attributes[k.lower()] = (k, _values(v))
+
+  def values(self):
+    '''lower case name -> values, for matching filters'''
+    return dict((k, v[1]) for k, v in self.attributes.items())
+
+  def select(self, attrlist):
+    if attrlist is None or '*' in attrlist:
+      return dict((k, list(v)) for k, v in self.attributes.values())
+
+    selected = {}
+    for name in attrlist:
+      found = self.attributes.get(name.lower())
+      if found is not None:
+        selected[found[0]] = list(found[1])
+
+    return selected
+
+
+class Directory(object):
+  '''The entries of the stand-in, shared by all its connections'''
+  def __init__(self, latency=0):
+    self.entries = {}
+    # bind DN -> password
+    self.passwords = {}
+    self.latency = latency
+    self.lock = threading.Lock()
+
+  @staticmethod
+  def _key(dn):
+    return ','.join(p.strip() for p in dn.lower().split(','))
+
+  def add(self, dn, attributes, password=None):
+    with self.lock:
+      self.entries[self._key(dn)] = Entry(dn, attributes)
+      if password is not None:
+        self.passwords[self._key(dn)] = password
+
+  def connect(self):
+    return DirectoryConnection(self)
+
+  def initialize(self, uri, *args, **kwargs):
+    '''Replacement of ldap.initialize'''
+    return self.connect()
+
+
+class DirectoryConnection(object):
+  def __init__(self, directory):
+    self.directory = directory
+    self.bound = None
+    self.msgids = itertools.count(1)
+    self.pending = {}
+
+  def _wait(self):
+    if self.directory.latency:
+      time.sleep(self.directory.latency)
+
+  def _entry(self, dn):
+    entry = self.directory.entries.get(Directory._key(dn))
+    if entry is None:
+      raise ldap.NO_SUCH_OBJECT({'desc': 'No such object', 'matched': dn})
+
+    return entry
+
+  def start_tls_s(self):
+    pass
+
+  def simple_bind_s(self, who='', cred=''):
+    self._wait()
+    if not self.directory.passwords.get(Directory._key(who)) == cred:
+      raise ldap.INVALID_CREDENTIALS({'desc': 'Invalid credentials'})
+
+    self.bound = who
+
+  def whoami_s(self):
+    return 'dn:' + (self.bound or '')
+
+  def unbind_s(self):
+    self.bound = None
+
+  def search_s(self, base, scope, filterstr='(objectClass=*)', attrlist=None, attrsonly=0):
+    self._wait()
+    f = _parse_filter(filterstr)
+    base = Directory._key(base)
+
+    with self.directory.lock:
+      if not base in self.directory.entries:
+        raise ldap.NO_SUCH_OBJECT({'desc': 'No such object', 'matched': base})
+
+      entries = list(self.directory.entries.items())
+
+    if scope == ldap.SCOPE_BASE:
+      entries = [(k, e) for k, e in entries if k == base]
+    else:
+      entries = [(k, e) for k, e in entries if k == base or k.endswith(',' + base)]
+      if scope == ldap.SCOPE_ONELEVEL:
+        entries = [(k, e) for k, e in entries if k.count(',') == base.count(',') + 1]
+
+    return [(e.dn, e.select(attrlist)) for k, e in sorted(entries) if _matches(f, e.values())]
+
+  def search(self, base, scope, filterstr='(objectClass=*)', attrlist=None, attrsonly=0):
+    msgid = next(self.msgids)
+    self.pending[msgid] = self.search_s(base, scope, filterstr, attrlist, attrsonly)
+
+    return msgid
+
+  def result(self, msgid, all=1, timeout=None):
+    results = self.pending.get(msgid, [])
+    if all or not results:
+      self.pending.pop(msgid, None)
+      return ldap.RES_SEARCH_RESULT, results
+
+    return ldap.RES_SEARCH_ENTRY, [results.pop(0)]
+
+  def add_s(self, dn, modlist):
+    self._wait()
+    with self.directory.lock:
+      if Directory._key(dn) in self.directory.entries:
+        raise ldap.ALREADY_EXISTS({'desc': 'Already exists'})
+
+      self.directory.entries[Directory._key(dn)] = Entry(dn, dict(modlist))
+
+  def delete_s(self, dn):
+    self._wait()
+    with self.directory.lock:
+      self._entry(dn)
+      del self.directory.entries[Directory._key(dn)]
+
+  def modify_s(self, dn, modlist):
+    self._wait()
+    with self.directory.lock:
+      entry = self._entry(dn)
+      for op, name, value in modlist:
+        key = name.lower()
+        current = entry.attributes.get(key, (name, []))[1]
+
+        if op == ldap.MOD_REPLACE:
+          current = _values(value)
+        elif op == ldap.MOD_ADD:
+          for v in _values(value):
+            if v in current:
+              raise ldap.TYPE_OR_VALUE_EXISTS({'desc': 'Type or value exists'})
+          current = current + _values(value)
+        elif op == ldap.MOD_DELETE:
+          if value is None:
+            if not current:
+              raise ldap.NO_SUCH_ATTRIBUTE({'desc': 'No such attribute'})
+            current = []
+          else:
+            for v in _values(value):
+              if not v in current:
+                raise ldap.NO_SUCH_ATTRIBUTE({'desc': 'No such attribute'})
+            current = [v for v in current if not v in _values(value)]
+
+        if current:
+          entry.attributes[key] = (name, current)
+        else:
+          entry.attributes.pop(key, None)
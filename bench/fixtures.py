@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Seeded data and an application booted against it
+
+Everything is derived from a random seed and a member count, so two runs
+with the same parameters work on the same data.
+'''
+
+import os
+import imp
+import random
+import datetime
+import cStringIO
+from ConfigParser import ConfigParser
+import ldap
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from bench.directory import Directory
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BASEDN = 'dc=example,dc=com'
+USERS = 'ou=People,' + BASEDN
+GROUPS = 'ou=Group,' + BASEDN
+DOMAINS = ['example.org', 'example.net', 'example.lu']
+
+ADMIN = 'bench_admin'
+PASSWORD = 'bench_password'
+
+FULL_MEMBERS = 'grp_full_member'
+LOCKED_MEMBERS = 'grp_locked_member'
+ADMINS = 'grp_admin'
+
+# a photo for every n-th member
+PHOTO_EVERY = 4
+
+
+def uid(i):
+  return 'member{0:04d}'.format(i)
+
+
+def write_config(workdir):
+  '''Write mematool.conf and cherrypy.conf for a run in workdir, from the
+  samples; return their paths'''
+  relative = lambda *p: os.path.relpath(os.path.join(workdir, *p), ROOT)
+
+  config = ConfigParser()
+  config.optionxform = str
+  config.read(os.path.join(ROOT, 'config', 'mematool.conf_sample'))
+
+  overrides = {'mematool': {'admin_user': '[{0}]'.format(ADMIN),
+                            'admin_group': '[{0}]'.format(ADMINS),
+                            'admin_finance': '[{0}]'.format(ADMIN),
+                            'vgroup_superadmin': '[{0}]'.format(ADMINS),
+                            'group_fullmember': FULL_MEMBERS,
+                            'group_lockedmember': LOCKED_MEMBERS,
+                            'debug': 'false',
+                            'session_store': 'lru',
+                            'cache': 'lru',
+                            'photo_dir': relative('photos'),
+                            'avatar_dir': relative('avatars'),
+                            'profile_dir': relative('profiles'),
+                            'cache_path': relative('cache.sqlite'),
+                            },
+               'db': {'protocol': 'sqlite',
+                      'db': relative('bench.sqlite'),
+                      },
+               'mako': {'precompile': 'true'},
+               'ldap': {'server': 'ldap://bench',
+                        'basedn': BASEDN,
+                        'basedn_users': USERS,
+                        'basedn_groups': GROUPS,
+                        },
+               }
+
+  for section, values in overrides.items():
+    for k, v in values.items():
+      config.set(section, k, v)
+
+  config_file = os.path.join(workdir, 'mematool.conf')
+  with open(config_file, 'w') as f:
+    config.write(f)
+
+  wsgi_config = os.path.join(workdir, 'cherrypy.conf')
+  with open(os.path.join(ROOT, 'config', 'cherrypy.conf_sample')) as src:
+    with open(wsgi_config, 'w') as f:
+      f.write(src.read())
+
+  return config_file, wsgi_config
+
+
+def _photo(rng):
+  img = Image.new('RGB', (480, 480), tuple(rng.randint(0, 255) for i in range(3)))
+  for i in range(20):
+    x, y = rng.randint(0, 400), rng.randint(0, 400)
+    img.paste(tuple(rng.randint(0, 255) for j in range(3)), (x, y, x + 80, y + 80))
+
+  out = cStringIO.StringIO()
+  img.save(out, format='JPEG', quality=90)
+
+  return out.getvalue()
+
+
+def seed_directory(directory, members, seed=0, photos=True):
+  '''Fill the stand-in with members, groups, domains and aliases; return
+  the uids of the members'''
+  from mematool.helpers import avatars
+  from mematool.helpers import blobstore
+
+  rng = random.Random(seed)
+  uids = [uid(i) for i in range(1, members + 1)]
+
+  directory.add(BASEDN, {'objectClass': ['dcObject', 'organization'], 'dc': 'example'})
+  directory.add(USERS, {'objectClass': 'organizationalUnit', 'ou': 'People'})
+  directory.add(GROUPS, {'objectClass': 'organizationalUnit', 'ou': 'Group'})
+
+  store = blobstore.get_photo_store()
+  avatar_dir = avatars.get_avatar_dir()
+
+  for i, u in enumerate([ADMIN] + uids):
+    attributes = {'objectClass': ['inetOrgPerson', 'posixAccount', 'syn2catPerson'],
+                  'uid': u,
+                  'cn': 'Bench {0}'.format(u),
+                  'sn': u.capitalize(),
+                  'givenName': 'Bench',
+                  'mail': '{0}@example.org'.format(u),
+                  'uidNumber': str(1000 + i),
+                  'gidNumber': '100',
+                  'homeDirectory': '/home/' + u,
+                  'loginShell': '/bin/bash',
+                  'homePostalAddress': '{0} Rue de la Gare, Luxembourg'.format(rng.randint(1, 200)),
+                  'arrivalDate': '20{0:02d}-{1:02d}-01'.format(rng.randint(5, 13), rng.randint(1, 12)),
+                  'nationality': 'LU',
+                  'conventionSigner': ADMIN,
+                  'userPassword': '{SSHA}bench',
+                  }
+
+    if photos and i % PHOTO_EVERY == 1:
+      data = _photo(rng)
+      key = store.put(data)
+      avatars.render(data, avatar_dir, key)
+      attributes['jpegPhoto'] = blobstore.make_ref(key)
+
+    directory.add('uid={0},{1}'.format(u, USERS), attributes, password=PASSWORD if u == ADMIN else None)
+
+  locked = [u for u in uids if rng.random() < 0.15]
+  full = [u for u in uids if not u in locked and rng.random() < 0.8]
+  groups = [(ADMINS, [ADMIN]), (FULL_MEMBERS, full), (LOCKED_MEMBERS, locked)]
+  for i, (cn, memberUids) in enumerate(groups):
+    directory.add('cn={0},{1}'.format(cn, GROUPS), {'objectClass': 'posixGroup',
+                                                    'cn': cn,
+                                                    'gidNumber': str(2000 + i),
+                                                    'memberUid': memberUids})
+
+  for domain in DOMAINS:
+    domain_dn = 'dc={0},{1}'.format(domain, BASEDN)
+    directory.add(domain_dn, {'objectClass': 'mailDomain', 'dc': domain})
+
+    for i in range(max(members / 10, 1)):
+      mail = 'alias{0:03d}@{1}'.format(i, domain)
+      directory.add('mail={0},{1}'.format(mail, domain_dn), {'objectClass': 'mailAlias',
+                                                             'mail': mail,
+                                                             'maildrop': rng.sample(uids, min(3, len(uids)))})
+
+  return uids
+
+
+def seed_database(uids, seed=0):
+  '''Payments of the last two years and the language preference of every
+  member, in the configured database'''
+  from mematool.model.satool import get_connection_string
+  from mematool.model.dbmodel import Base, Payment, Preferences
+
+  rng = random.Random(seed)
+  engine = create_engine(get_connection_string())
+  Base.metadata.drop_all(engine)
+  Base.metadata.create_all(engine)
+  db = sessionmaker(bind=engine)()
+
+  today = datetime.date.today()
+  now = datetime.datetime.now()
+  for i, u in enumerate([ADMIN] + uids):
+    db.add(Preferences(uidNumber=1000 + i, last_change=now, key='language', value='en'))
+
+    # members are up to date, or stopped paying some months ago
+    paid_months = 24 - (rng.randint(1, 12) if rng.random() < 0.3 else 0)
+    first = today.year * 12 + today.month - 24
+    for m in range(paid_months):
+      month = first + m
+      db.add(Payment(uid=u, date=datetime.date(month / 12, month % 12 + 1, 1), verified=True, status=0))
+
+  db.commit()
+  db.close()
+  engine.dispose()
+
+
+def load_app():
+  '''mematool-run.py as a module'''
+  return imp.load_source('mematool_run', os.path.join(ROOT, 'mematool-run.py'))
+
+
+def boot(workdir, members, seed=0, latency=0):
+  '''Configure the application for a run in workdir and seed its data;
+  return (mematool-run module, Directory, uids). The engine isn't started.'''
+  directory = Directory(latency)
+  ldap.initialize = directory.initialize
+
+  config_file, wsgi_config = write_config(workdir)
+  app = load_app()
+  app.bootstap(embedded=True, config_file=config_file, wsgi_config=wsgi_config)
+
+  uids = seed_directory(directory, members, seed)
+  seed_database(uids, seed)
+
+  return app, directory, uids
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Concurrent HTTP load test of the main pages
+
+Boots the application in this process, on a free local port, against
+the directory stand-in and a seeded SQLite database, then runs every
+scenario in turn: `concurrency` clients, each logged in as an admin with
+its own session and connection, send `requests` requests in total. The
+first request of every client isn't measured.
+
+  python -m bench.load [--concurrency 8] [--requests 400] [--members 200]
+                       [--ldap-latency 0.5] [--output results.json]
+
+The results (throughput, latency percentiles in milliseconds, errors)
+are written as JSON along with the parameters and the environment; runs
+with the same parameters on the same machine are comparable. Pages kept
+in the page cache are measured as served from it.
+'''
+
+import sys
+import time
+import random
+import socket
+import shutil
+import urllib
+import httplib
+import argparse
+import tempfile
+import threading
+import cherrypy
+import bench
+from bench import fixtures
+
+
+class Client(object):
+  '''One browser: a keep-alive connection and a session cookie'''
+  def __init__(self, port):
+    self.port = port
+    self.con = None
+    self.cookie = None
+
+  def request(self, method, path, params=None):
+    '''Return the status and the length of the body'''
+    headers = {}
+    body = None
+    if params is not None:
+      body = urllib.urlencode(params)
+      headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+    if self.cookie is not None:
+      headers['Cookie'] = self.cookie
+
+    if self.con is None:
+      self.con = httplib.HTTPConnection('127.0.0.1', self.port, timeout=60)
+
+    try:
+      self.con.request(method, path, body, headers)
+      response = self.con.getresponse()
+      length = len(response.read())
+    except (httplib.HTTPException, socket.error):
+      self.con.close()
+      self.con = None
+      raise
+
+    cookie = response.getheader('Set-Cookie')
+    if cookie is not None:
+      self.cookie = cookie.split(';', 1)[0]
+
+    if response.getheader('Connection', '').lower() == 'close':
+      self.con.close()
+      self.con = None
+
+    return response.status, length
+
+  def login(self):
+    return self.request('POST', '/doLogin', {'username': fixtures.ADMIN, 'password': fixtures.PASSWORD})
+
+
+def _login(client, rng, uids):
+  client.cookie = None
+  return client.login(), (302, 303)
+
+
+def _get(path):
+  def run(client, rng, uids):
+    return client.request('GET', path), (200,)
+
+  return run
+
+
+def _list_payments(client, rng, uids):
+  return client.request('GET', '/payments/listPayments?member_id=' + rng.choice(uids)), (200,)
+
+
+def _list_aliases(client, rng, uids):
+  return client.request('GET', '/mails/listAliases?domain=' + rng.choice(fixtures.DOMAINS)), (200,)
+
+
+def _avatar(client, rng, uids):
+  with_photo = uids[::fixtures.PHOTO_EVERY]
+  path = '/profile/getAvatar?member_id={0}&size=48'.format(rng.choice(with_photo))
+
+  return client.request('GET', path), (200,)
+
+
+# name -> request(client, random, uids) returning ((status, length), expected statuses)
+SCENARIOS = [('login', _login),
+             ('showAllMembers', _get('/members/showAllMembers')),
+             ('showOutstanding', _get('/payments/showOutstanding')),
+             ('listPayments', _list_payments),
+             ('statistics', _get('/statistics/')),
+             ('listAliases', _list_aliases),
+             ('avatar', _avatar),
+             ]
+
+
+def run_scenario(port, request, uids, concurrency, requests, seed=0):
+  '''Send `requests` requests from `concurrency` clients, return the
+  durations of the successful ones, the number of errors and the wall
+  time'''
+  durations = []
+  errors = [0]
+  remaining = [requests]
+  lock = threading.Lock()
+  start = threading.Event()
+  warm = threading.Semaphore(0)
+
+  def client_thread(i):
+    rng = random.Random(seed * 1000 + i)
+    client = Client(port)
+    try:
+      client.login()
+      request(client, rng, uids)
+    except (httplib.HTTPException, socket.error):
+      # counted when it happens again while measuring
+      pass
+    finally:
+      warm.release()
+
+    start.wait()
+    while True:
+      with lock:
+        if remaining[0] <= 0:
+          return
+        remaining[0] -= 1
+
+      t = time.time()
+      try:
+        (status, length), expected = request(client, rng, uids)
+        ok = status in expected
+      except (httplib.HTTPException, socket.error):
+        ok = False
+      elapsed = time.time() - t
+
+      with lock:
+        if ok:
+          durations.append(elapsed)
+        else:
+          errors[0] += 1
+
+  threads = [threading.Thread(target=client_thread, args=(i,)) for i in range(concurrency)]
+  for t in threads:
+    t.daemon = True
+    t.start()
+
+  for t in threads:
+    warm.acquire()
+
+  began = time.time()
+  start.set()
+  for t in threads:
+    t.join()
+
+  return durations, errors[0], time.time() - began
+
+
+def _free_port():
+  s = socket.socket()
+  s.bind(('127.0.0.1', 0))
+  port = s.getsockname()[1]
+  s.close()
+
+  return port
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Concurrent HTTP load test of the main pages')
+  parser.add_argument('--concurrency', type=int, default=8)
+  parser.add_argument('--requests', type=int, default=400, help='per scenario')
+  parser.add_argument('--members', type=int, default=200)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--ldap-latency', type=float, default=0, help='milliseconds added to every LDAP operation')
+  parser.add_argument('--scenario', action='append', choices=[n for n, r in SCENARIOS], help='default: all')
+  parser.add_argument('--output', help='file for the JSON results, default: stdout')
+  args = parser.parse_args(argv)
+
+  workdir = tempfile.mkdtemp(prefix='mematool-bench-')
+  try:
+    app, directory, uids = fixtures.boot(workdir, args.members, args.seed, args.ldap_latency / 1000.0)
+
+    port = _free_port()
+    cherrypy.config.update({'server.socket_host': '127.0.0.1',
+                            'server.socket_port': port,
+                            'server.thread_pool': max(10, args.concurrency),
+                            'engine.autoreload.on': False,
+                            'log.screen': False,
+                            'checker.on': False,
+                            })
+    cherrypy.engine.start()
+
+    try:
+      results = {'benchmark': 'load',
+                 'parameters': {'concurrency': args.concurrency,
+                                'requests': args.requests,
+                                'members': args.members,
+                                'seed': args.seed,
+                                'ldap_latency_ms': args.ldap_latency,
+                                },
+                 'environment': bench.environment(),
+                 'scenarios': {},
+                 }
+
+      for name, request in SCENARIOS:
+        if args.scenario and not name in args.scenario:
+          continue
+
+        durations, errors, wall = run_scenario(port, request, uids, args.concurrency, args.requests, args.seed)
+        result = {'requests': len(durations) + errors,
+                  'errors': errors,
+                  'seconds': round(wall, 3),
+                  'throughput': round(len(durations) / wall, 2) if wall else None,
+                  'latency_ms': bench.summarize(durations),
+                  }
+        results['scenarios'][name] = result
+
+        sys.stderr.write('{0:<16} {1:>8.1f} req/s  p50 {2[p50]:>8} ms  p99 {2[p99]:>8} ms  {3} errors\n'.format(
+                         name, result['throughput'] or 0, result['latency_ms'], errors))
+    finally:
+      cherrypy.engine.exit()
+
+    bench.write_results(results, args.output)
+  finally:
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Micro-benchmarks of the model code
+
+Every benchmark is run `repeat` times, each time calling it as often as
+it takes to run for at least MIN_TIME seconds; the fastest time per call
+is the most reproducible one and is the one compared by bench.compare.
+
+  python -m bench.models [--repeat 7] [--only NAME] [--output results.json]
+'''
+
+import sys
+import copy
+import timeit
+import shutil
+import argparse
+import tempfile
+import ldap
+import cherrypy
+import bench
+from bench import fixtures
+from bench.directory import Directory
+from mematool import Config
+
+MIN_TIME = 0.2
+
+# mail and maildrop values of the alias updated by update_alias
+ALIAS_VALUES = 20
+
+
+def setup(workdir):
+  '''Load a configuration written to workdir and seed a directory;
+  return the benchmarks, name -> callable'''
+  config_file, wsgi_config = fixtures.write_config(workdir)
+  Config.basePath = fixtures.ROOT
+  Config.load(config_file)
+
+  from mematool.model.ldapmodel import Member
+  from mematool.model.ldapModelFactory import LdapModelFactory
+  from mematool.helpers.crypto import encodeAES, decodeAES
+
+  directory = Directory()
+  uids = fixtures.seed_directory(directory, 20, photos=False)
+  # not within a request, the benchmarks don't touch the database
+  cherrypy.request.db = None
+  mf = LdapModelFactory(directory.connect())
+
+  dn, attributes = directory.connect().search_s('uid={0},{1}'.format(uids[0], fixtures.USERS), ldap.SCOPE_BASE)[0]
+  attributes = [(k, v[0]) for k, v in attributes.items() if not k == 'objectClass']
+
+  member = mf.getUser(uids[0])
+  changed = copy.copy(member)
+  changed.mobile = u'+352 691 123 456'
+  changed.homePostalAddress = u'1 Rue du Fort Wallis, Luxembourg'
+  changed.isMinor = True
+
+  # alone in its directory, so that the search is cheap next to the diff
+  aliases = Directory()
+  domain = fixtures.DOMAINS[0]
+  mail = 'many@' + domain
+  aliases.add(fixtures.BASEDN, {'objectClass': 'organization'})
+  aliases.add('mail={0},dc={1},{2}'.format(mail, domain, fixtures.BASEDN),
+              {'objectClass': 'mailAlias',
+               'mail': [mail] + ['many{0}@{1}'.format(i, domain) for i in range(ALIAS_VALUES)],
+               'maildrop': ['{0}@example.com'.format(u) for u in (uids * 2)[:ALIAS_VALUES]]})
+  alias_mf = LdapModelFactory(aliases.connect())
+  alias = alias_mf.getAlias(mail)
+
+  cipher = encodeAES(fixtures.PASSWORD)
+
+  def member_set_properties():
+    m = Member()
+    for k, v in attributes:
+      m.set_property(k, v)
+
+  def prepare_volatile_attributes():
+    for k in changed.auto_update_vars:
+      mf.prepareVolatileAttribute(changed, member, k)
+
+  def member_modifications():
+    mf.getModifications(changed, changed.auto_update_vars)
+
+  return {'member_init': Member,
+          'member_set_properties': member_set_properties,
+          'member_check': member.check,
+          'prepare_volatile_attributes': prepare_volatile_attributes,
+          'member_modifications': member_modifications,
+          'update_alias': lambda: alias_mf.updateAlias(alias),
+          'gravatar': lambda: member.getGravatar(48),
+          'encode_aes': lambda: encodeAES(fixtures.PASSWORD),
+          'decode_aes': lambda: decodeAES(cipher),
+          }
+
+
+def measure(f, repeat):
+  '''Time per call of f in microseconds'''
+  timer = timeit.Timer(f)
+
+  number = 1
+  while timer.timeit(number) < MIN_TIME:
+    number *= 10
+
+  times = sorted(t / number * 1e6 for t in timer.repeat(repeat, number))
+
+  return {'number': number,
+          'best_us': round(times[0], 3),
+          'median_us': round(times[len(times) // 2], 3),
+          }
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Micro-benchmarks of the model code')
+  parser.add_argument('--repeat', type=int, default=7)
+  parser.add_argument('--only', action='append', help='run only this benchmark, can be repeated')
+  parser.add_argument('--output', help='file for the JSON results, default: stdout')
+  args = parser.parse_args(argv)
+
+  workdir = tempfile.mkdtemp(prefix='mematool-bench-')
+  try:
+    benchmarks = setup(workdir)
+    results = {'benchmark': 'models',
+               'parameters': {'repeat': args.repeat, 'min_time': MIN_TIME},
+               'environment': bench.environment(),
+               'benchmarks': {},
+               }
+
+    for name in sorted(benchmarks):
+      if args.only and not name in args.only:
+        continue
+
+      result = results['benchmarks'][name] = measure(benchmarks[name], args.repeat)
+      sys.stderr.write('{0:<28} {1:>12.3f} us\n'.format(name, result['best_us']))
+
+    bench.write_results(results, args.output)
+  finally:
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+  main()
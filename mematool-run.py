@@ -19,11 +19,31 @@
 
 import cherrypy
 import os
-from ConfigParser import ConfigParser
+import sys
+import getpass
+import atexit
+import threading
+import multiprocessing
+from cherrypy.process.plugins import Monitor
 from mematool.helpers.i18ntool import ugettext as _
 from mematool.helpers.i18ntool import I18nTool
 from mematool import Config
 from mematool.model.satool import SAEnginePlugin, SATool
+from mematool.model import identitymap
+import mematool.helpers.sessionstore
+from mematool.helpers import templating
+from mematool.helpers import assets
+from mematool.helpers import avatars
+from mematool.helpers import blobstore
+from mematool.helpers import pagecache
+from mematool.helpers import prefork
+from mematool.helpers import profiler
+from mematool.helpers import metrics
+from mematool.helpers import nplusone
+from mematool.helpers import slowlog
+from mematool.helpers import postfix
+from mematool.helpers.ldapConnector import LdapConnector
+from mematool.model.ldapModelFactory import LdapModelFactory
 from mematool.controllers.index import IndexController
 from mematool.controllers.profile import ProfileController
 from mematool.controllers.members import MembersController
@@ -32,12 +52,36 @@ from mematool.controllers.mails import MailsController
 from mematool.controllers.groups import GroupsController
 from mematool.controllers.statistics import StatisticsController
 from mematool.controllers.preferences import PreferencesController
+from mematool.controllers.metrics import MetricsController
 from cherrypy._cperror import HTTPRedirect
 
 
+_app = None
+_app_lock = threading.Lock()
+
+
+def create_app():
+  '''Bootstrap once per process and return the WSGI application, for use
+  under an external server (mod_wsgi, uwsgi, ...)'''
+  global _app
+
+  if _app is None:
+    with _app_lock:
+      if _app is None:
+        bootstap(embedded=True)
+        # the external server listens and handles signals; the engine
+        # only runs the plugins (database, workers, config monitor)
+        cherrypy.config.update({'engine.autoreload.on': False})
+        cherrypy.server.unsubscribe()
+        cherrypy.engine.start()
+        atexit.register(cherrypy.engine.exit)
+        _app = cherrypy.tree
+
+  return _app
+
+
 def application(environ, start_response):
-  bootstap()
-  return cherrypy.tree(environ, start_response)
+  return create_app()(environ, start_response)
 
 
 def require_auth():
@@ -45,35 +89,115 @@ def require_auth():
     raise HTTPRedirect('/doLogin')
 
 
-def bootstap():
+def reload_config(force=True):
+  if Config.reload(force):
+    # pages depend on the configuration, e.g. who is an admin, and on
+    # the asset fingerprints
+    assets.reload_manifest()
+    pagecache.bump_generation()
+    cherrypy.log('Configuration reloaded')
+
+
+def warm():
+  '''Load what the prefork workers share: it is read-only from here on'''
+  Config.reload()
+  languages = cherrypy.tools.I18nTool.preload(Config.get('mematool', 'languages', []))
+  # after build-assets, pages must link the new fingerprints
+  if assets.reload_manifest():
+    pagecache.bump_generation()
+  precompile(languages)
+
+
+def precompile(languages):
+  '''Compile the templates, and their copies baked for the loaded
+  languages; return the number of templates compiled'''
+  count = templating.precompile()
+
+  if templating.bake_translations():
+    for lang in languages:
+      count += templating.precompile(templating.get_lookup(lang))
+
+  return count
+
+
+def per_process_stores():
+  '''The configured stores every process keeps its own copy of: logins,
+  cached pages, the maildrop index and avatar jobs would differ between
+  prefork workers'''
+  stores = []
+  if Config.get('mematool', 'session_store', 'file') == 'lru':
+    stores.append('session_store = lru')
+  if Config.get('mematool', 'cache', 'lru') == 'lru':
+    stores.append('cache = lru')
+
+  return stores
+
+
+def bootstap(embedded=False, config_file=None, wsgi_config=None, compile_templates=True):
+  '''compile_templates=False leaves compiling to the caller, e.g. the
+  prefork master, whose warm() does'''
   basePath = os.path.dirname(os.path.abspath(__file__))
 
-  config_file = basePath + '/config/mematool.conf'
-  config = ConfigParser()
+  if config_file is None:
+    config_file = basePath + '/config/mematool.conf'
   if not os.path.isfile(config_file):
     raise ConfigException('Could not find config file ' +
                           config_file + ' in ' + getcwd())
 
-  config.read(config_file)
   Config.basePath = basePath
-  Config(config)
+  Config.load(config_file)
 
-  wsgi_config = basePath + '/config/cherrypy.conf'
+  if wsgi_config is None:
+    wsgi_config = basePath + '/config/cherrypy.conf'
   cherrypy.config.update(config=wsgi_config)
 
+  session_store = Config.get('mematool', 'session_store', 'file')
+  debug = Config.get_boolean('mematool', 'debug', 'false')
+
   cherrypy_config = {'tools.staticdir.on': True,
                      'tools.staticdir.root': basePath + "/htdocs",
                      'tools.staticdir.dir': "",
+                     'tools.assets.on': True,
+                     'tools.assets.root': assets.get_assets_dir(),
                      'tools.sessions.on': True,
-                     'tools.sessions.storage_type': 'file',
-                     'tools.sessions.storage_path': basePath + '/sessions',
+                     'tools.sessions.storage_type': session_store,
                      'tools.sessions.timeout': 60,
+                     'tools.profiler.on': True,
+                     'tools.metrics.on': True,
+                     'tools.nplusone.on': debug,
+                     'tools.slowlog.on': True,
+                     'tools.identitymap.on': True,
                      }
 
+  if session_store == 'file':
+    cherrypy_config['tools.sessions.storage_path'] = basePath + '/sessions'
+  elif session_store == 'lru':
+    cherrypy_config['tools.sessions.max_entries'] = Config.get_int('mematool', 'session_max_entries', 10000)
+
   cherrypy.config.update(cherrypy_config)
 
   cherrypy.tools.I18nTool = I18nTool(basePath)
+  cherrypy.engine.subscribe('start', lambda: cherrypy.tools.I18nTool.preload(Config.get('mematool', 'languages', [])))
+  cherrypy.tools.assets = cherrypy._cptools.HandlerTool(assets.serve_asset)
+  cherrypy.engine.subscribe('start', avatars.start)
+  cherrypy.engine.subscribe('stop', avatars.stop)
   cherrypy.tools.require_auth = cherrypy.Tool('before_handler', require_auth)
+  # after require_auth, profiles only the handler
+  cherrypy.tools.profiler = cherrypy.Tool('before_handler', profiler.profile_request, priority=90)
+  cherrypy.tools.metrics = metrics.MetricsTool()
+  cherrypy.tools.nplusone = nplusone.NPlusOneTool()
+  cherrypy.tools.slowlog = slowlog.SlowLogTool()
+  cherrypy.tools.identitymap = identitymap.IdentityMapTool()
+  if debug:
+    nplusone.install()
+  # reload the configuration on SIGHUP and when the file changes, instead
+  # of restarting the engine
+  if not embedded and getattr(cherrypy.engine, 'signal_handler', None) is not None:
+    cherrypy.engine.signal_handler.handlers['SIGHUP'] = reload_config
+    cherrypy.engine.signal_handler.subscribe()
+  Monitor(cherrypy.engine, lambda: reload_config(force=False),
+          frequency=Config.get_int('mematool', 'config_check_interval', 5),
+          name='ConfigReload').subscribe()
   # DB stuff
   SAEnginePlugin(cherrypy.engine).subscribe()
   cherrypy.tools.db = SATool()
@@ -86,10 +210,59 @@ def bootstap():
   cherrypy.tree.mount(GroupsController(), '/groups')
   cherrypy.tree.mount(StatisticsController(), '/statistics')
   cherrypy.tree.mount(PreferencesController(), '/preferences')
+  cherrypy.tree.mount(MetricsController(), '/metrics')
+
+  if compile_templates and Config.get_boolean('mako', 'precompile', str(not debug)):
+    precompile(cherrypy.tools.I18nTool.preload(Config.get('mematool', 'languages', [])))
 
 
 if __name__ == '__main__':
-  bootstap()
+  command = sys.argv[1] if len(sys.argv) > 1 else 'serve'
+
+  # the prefork master handles signals itself; it and the precompile
+  # command compile the templates themselves
+  bootstap(embedded=command == 'prefork',
+           compile_templates=command not in ('prefork', 'precompile'))
+
+  if command == 'precompile':
+    languages = cherrypy.tools.I18nTool.preload(Config.get('mematool', 'languages', []))
+    print '{0} templates compiled'.format(precompile(languages))
+    sys.exit(0)
+  elif command == 'build-assets':
+    print '{0} assets built'.format(len(assets.build()))
+    sys.exit(0)
+  elif command == 'migrate-photos':
+    username = raw_input('Admin username: ')
+    ldapcon = LdapConnector(username=username, password=getpass.getpass()).get_connection()
+    # not within a request, the migration doesn't touch the database
+    cherrypy.request.db = None
+    avatar_dir = avatars.get_avatar_dir()
+    render = lambda data, key: avatars.render(data, avatar_dir, key)
+    count = LdapModelFactory(ldapcon).migratePhotos(blobstore.get_photo_store(), render)
+    print '{0} photos migrated'.format(count)
+    sys.exit(0)
+  elif command == 'export-postfix':
+    # mematool-run.py export-postfix [username], the password is read from
+    # stdin when it isn't a terminal, e.g. from cron
+    username = sys.argv[2] if len(sys.argv) > 2 else raw_input('Admin username: ')
+    password = getpass.getpass() if sys.stdin.isatty() else sys.stdin.readline().rstrip('\n')
+    ldapcon = LdapConnector(username=username, password=password).get_connection()
+    cherrypy.request.db = None
+    count = postfix.export(LdapModelFactory(ldapcon))
+    if count is None:
+      print 'Postfix map unchanged'
+    else:
+      print 'Postfix map written with {0} entries'.format(count)
+    sys.exit(0)
+  elif command == 'prefork':
+    workers = Config.get_int('mematool', 'workers', multiprocessing.cpu_count())
+    stores = per_process_stores()
+    if workers > 1 and stores:
+      sys.stderr.write('{1} is kept per process, {0} workers would not share it; use session_store = sql (or file) and cache = sqlite (or memcached), or set workers = 1\n'.format(workers, ', '.join(stores)))
+      sys.exit(1)
+    prefork.Arbiter(cherrypy.tree, workers, warm=warm).run()
+    sys.exit(0)
+
   try:
       # this is the way it should be done in cherrypy 3.X
       cherrypy.engine.start()
@@ -18,23 +18,94 @@
 # along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import os
+import threading
+
+
+def _parse(value):
+  '''"[a, b]" -> ['a', 'b'], anything else is returned as is'''
+  if value.startswith('[') and value.endswith(']'):
+    return [v.strip() for v in value[1:-1].split(',') if v.strip()]
+
+  return value
+
+
 class Config(object):
+  '''The parsed configuration.
+
+  Every value is converted once, when the file is read: lists are also
+  kept as frozensets for membership tests (get_set) and numbers as ints
+  (get_int). reload() builds a new instance and swaps it in, so a request
+  sees either the old or the new configuration, never a mix.
+  '''
   instance = None
+  path = None
+  _reload_lock = threading.Lock()
 
-  def __init__(self, config):
-    Config.instance = self
+  def __init__(self, config, path=None):
     self.config = {}
+    self.sets = {}
+    self.ints = {}
+    self.booleans = {}
+    self.mtime = None
+
+    if path is not None:
+      Config.path = path
+      self.mtime = os.path.getmtime(path)
+
     for s in config.sections():
       if not s in self.config:
         self.config[s] = {}
 
       for k, v in config.items(s):
-        value = v
+        value = _parse(v)
+        self.config[s][k] = value
 
-        if v.startswith('[') and v.endswith(']'):
-          value = v.lstrip('[').rstrip(']').split(',')
+        if isinstance(value, list):
+          self.sets[(s, k)] = frozenset(value)
+        elif value.strip().lstrip('-').isdigit():
+          self.ints[(s, k)] = int(value)
+        elif value.strip().lower() in ('true', 'false'):
+          self.booleans[(s, k)] = value.strip().lower() == 'true'
 
-        self.config[s][k] = value
+    # virtual groups: vgroup_<name> = [groups whose members belong to <name>]
+    self.vgroups = {}
+    for k, v in self.config.get('mematool', {}).items():
+      if k.startswith('vgroup_'):
+        self.vgroups[k[len('vgroup_'):]] = frozenset(v if isinstance(v, list) else [v])
+
+    Config.instance = self
+
+  @staticmethod
+  def load(path):
+    '''Read the configuration file at path'''
+    # imported here, mematool is imported by everything
+    from ConfigParser import ConfigParser
+
+    config = ConfigParser()
+    config.read(path)
+
+    return Config(config, path)
+
+  @staticmethod
+  def reload(force=True):
+    '''Read the configuration file again, if it changed or force is set.
+    Returns True if it was reloaded.
+
+    Settings which are only used at startup (sessions, database, worker
+    processes) keep their old value until the server is restarted.
+    '''
+    with Config._reload_lock:
+      path = Config.path
+      if path is None or not os.path.isfile(path):
+        return False
+
+      if not force and os.path.getmtime(path) == Config.instance.mtime:
+        return False
+
+      Config.load(path)
+
+    return True
 
   @staticmethod
   def get(section, key, default=None):
@@ -48,16 +119,38 @@ class Config(object):
 
   @staticmethod
   def get_boolean(section, key, default=None):
-    if not section in Config.instance.config:
-      raise KeyError()
-
-    if default is None and not key in Config.instance.config[section]:
-      raise KeyError()
+    value = Config.instance.booleans.get((section, key))
+    if value is not None:
+      return value
 
-    if not Config.instance.config[section].get(key, default).lower() in ['true', 'false']:
+    value = Config.get(section, key, default)
+    if not str(value).lower() in ['true', 'false']:
       raise ValueError()
 
-    if Config.instance.config[section].get(key, default).lower() == 'true':
-      return True
+    return str(value).lower() == 'true'
+
+  @staticmethod
+  def get_int(section, key, default=None):
+    value = Config.instance.ints.get((section, key))
+    if value is not None:
+      return value
 
-    return False
+    return int(Config.get(section, key, default))
+
+  @staticmethod
+  def get_set(section, key, default=frozenset()):
+    '''A list option as a frozenset'''
+    value = Config.instance.sets.get((section, key))
+    if value is not None:
+      return value
+
+    if key in Config.instance.config.get(section, {}):
+      # a single value
+      return frozenset([Config.instance.config[section][key]])
+
+    return default
+
+  @staticmethod
+  def get_vgroup(group):
+    '''Groups whose members are members of the virtual group'''
+    return Config.instance.vgroups.get(group, frozenset())
@@ -17,9 +17,9 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
 
+import time
 import cherrypy
 from cherrypy._cperror import HTTPRedirect, HTTPError
-from mako.lookup import TemplateLookup
 import ldap
 import smtplib
 from email.mime.text import MIMEText
@@ -29,6 +29,17 @@ from mematool.model.ldapModelFactory import LdapModelFactory
 from mematool.model.dbmodel import TmpMember
 from mematool.helpers.crypto import decodeAES
 from mematool.helpers.i18ntool import ugettext as _
+from mematool.helpers.templating import get_lookup
+from mematool.helpers import pagecache
+# imported by name: the package attribute `metrics` is the controller module
+from mematool.helpers.metrics import TEMPLATE_SECONDS
+from mematool.helpers import slowlog
+
+
+# placeholder for the rows of a streamed template
+STREAM_MARKER = '<!--mematool:stream-rows-->'
+# rows rendered before a chunk is handed to the server
+STREAM_CHUNK_ROWS = 50
 
 
 class TemplateContext(object):
@@ -38,15 +49,6 @@ class TemplateContext(object):
 
 class BaseController(object):
   def __init__(self):
-    templateRoot = Config.get('mako', 'templateroot')
-    collectionSize = Config.get('mako', 'collectionsize')
-    outputEncoding = Config.get('mako', 'outputencoding')
-    self._mylookup = TemplateLookup(directories=[templateRoot],
-                              module_directory=Config.basePath + '/tmp',
-                              output_encoding=outputEncoding,
-                              encoding_errors='replace',
-                              imports=['from mematool.helpers.i18ntool import ugettext as _'])
-
     self.ldapcon = None
     self.sidebar = []
     self.languages = Config.get('mematool', 'languages', [])
@@ -55,9 +57,7 @@ class BaseController(object):
   def _sidebar(self):
     pass
 
-  def render(self, template_name, template_context=None, **kwargs):
-    template = self._mylookup.get_template(template_name)
-
+  def _prepare_context(self, template_context=None):
     if template_context is None:
       c = TemplateContext()
     else:
@@ -68,7 +68,71 @@ class BaseController(object):
 
     self._sidebar()
 
-    return template.render(session=cherrypy.session, c=c, sidebar=self.sidebar, **kwargs)
+    return c
+
+  def render(self, template_name, template_context=None, **kwargs):
+    template = self.lookup.get_template(template_name)
+    c = self._prepare_context(template_context)
+    pagecache.mark_rendered()
+
+    start = time.time()
+    try:
+      return template.render(session=cherrypy.session, c=c, sidebar=self.sidebar, **kwargs)
+    finally:
+      elapsed = time.time() - start
+      TEMPLATE_SECONDS.observe(elapsed, template_name)
+      slowlog.add('template', elapsed, template_name)
+
+  def render_stream(self, template_name, rows, template_context=None, **kwargs):
+    '''Stream a list template to the client while its rows are produced.
+
+    The template marks the place of its rows with ${stream_rows()} and
+    renders a single one in a ``row(m, i)`` def. The page around the rows
+    is sent first, then the rows as ``rows`` yields them, so neither the
+    time to the first byte nor the memory used depend on the row count.
+
+    Rows are rendered after the request's database session is closed,
+    whatever they need from SQL has to be loaded up front.
+    '''
+    template = self.lookup.get_template(template_name)
+    row = template.get_def('row')
+    c = self._prepare_context(template_context)
+    data = dict(session=cherrypy.session, c=c, sidebar=self.sidebar, **kwargs)
+    pagecache.mark_rendered()
+
+    start = time.time()
+    page = template.render(stream_rows=lambda: STREAM_MARKER, **data)
+    head, tail = page.split(STREAM_MARKER, 1)
+    rendering = time.time() - start
+
+    def generate():
+      yield head
+
+      chunk = []
+      rendering_rows = 0
+      for i, m in enumerate(rows, 1):
+        start = time.time()
+        chunk.append(row.render(m=m, i=i, **data))
+        rendering_rows += time.time() - start
+
+        if len(chunk) >= STREAM_CHUNK_ROWS:
+          yield ''.join(chunk)
+          chunk = []
+
+      chunk.append(tail)
+      yield ''.join(chunk)
+
+      # without the time spent producing the rows
+      TEMPLATE_SECONDS.observe(rendering + rendering_rows, template_name)
+      slowlog.add('template', rendering + rendering_rows, template_name)
+
+    cherrypy.response.stream = True
+
+    return generate()
+
+  @property
+  def lookup(self):
+    return get_lookup(getattr(cherrypy.response, 'i18n', None))
 
   @property
   def debug(self):
@@ -124,9 +188,8 @@ class BaseController(object):
 
   def is_in_vgroup(self, group):
     if not group == '' and 'user' in self.session:
-      for vgroup in Config.get('mematool', 'vgroup_{0}'.format(group), []):
-        if vgroup in self.session.get('user').groups:
-          return True
+      if not Config.get_vgroup(group).isdisjoint(self.session.get('user').groups):
+        return True
 
     return False
 
@@ -162,6 +225,16 @@ class BaseController(object):
       return new_f
     return wrap_f
 
+  @staticmethod
+  def cachedPage(f):
+    '''Cache the rendered page until LDAP or SQL change (see
+    mematool.helpers.pagecache); put it below the access checks'''
+    def new_f(self, *args, **kwargs):
+      view = '{0}.{1}'.format(self.__class__.__name__, f.__name__)
+      return pagecache.cached_page(view, f, self, *args, **kwargs)
+
+    return new_f
+
   def is_finance_admin(self):
     if 'user' in self.session and self.session['user'].is_finance_admin():
       return True
@@ -179,7 +252,7 @@ class BaseController(object):
       member = self.mf.getUser(uid)
 
       if not member.jpegPhoto is None:
-        return '/profile/getAvatar/?member_id=' + uid
+        return '/profile/getAvatar/?member_id={0}&size={1}'.format(uid, size)
       else:
         return member.getGravatar(size=size)
     except:
@@ -190,6 +263,10 @@ class BaseController(object):
   def pendingMemberValidations(self):
     return self.db.query(TmpMember).count()
 
+  def pendingValidationUidNumbers(self):
+    '''uidNumbers (as found on Member objects) having changes to validate'''
+    return set(unicode(i) for (i,) in self.db.query(TmpMember.id))
+
   def sendMail(self, to_, subject, body, from_=''):
     msg = MIMEText(body)
 
@@ -22,11 +22,14 @@ from cherrypy._cperror import HTTPRedirect
 import logging
 from mematool.controllers import BaseController, TemplateContext
 from mematool.helpers.i18ntool import ugettext as _
-from mematool.helpers.lechecker import ParamChecker, InvalidParameterFormat
+from mematool.helpers import lechecker
+from mematool.helpers.lechecker import ParamChecker, Schema, N_
 from mematool.model.dbmodel import Group
 
 log = logging.getLogger(__name__)
 
+GROUP_SCHEMA = Schema([('gid', lechecker.USERNAME.replace(error=N_('Invalid group ID')))])
+
 
 class GroupsController(BaseController):
   _cp_config = {'tools.require_auth.on': True}
@@ -45,7 +48,6 @@ class GroupsController(BaseController):
     if msg and not 'msg' in cherrypy.request.params:
       self.session['flash'] = msg
       self.session['flash_class'] = msg_class
-      self.session.save()
     
     if self.is_admin():
       return self.listGroups()
@@ -54,6 +56,7 @@ class GroupsController(BaseController):
 
   @cherrypy.expose()
   @BaseController.needGroup('superadmin')
+  @BaseController.cachedPage
   def listGroups(self):
     c = TemplateContext()
     c.heading = _('Managed groups')
@@ -102,34 +105,23 @@ class GroupsController(BaseController):
 
   def checkEdit(f):
     def new_f(self, gid, users=None):
-      formok = True
-      errors = []
+      errors = GROUP_SCHEMA.errors({'gid': gid})
       items = {}
 
-      try:
-        ParamChecker.checkUsername('gid', param=True)
-      except:
-        formok = False
-        errors.append(_('Invalid group ID'))
-
       items['users'] = []
 
       if not users is None:
-        try:
-          #ParamChecker.checkString('users', param=True, min_len=-1, max_len=9999, regex=r'([\w]{1,20}\n?)*')
-
-          for k in users.split('\n'):
-            m = k.replace('\r', '').replace(' ', '')
-            if m == '':
-              continue
-            else:
-              ParamChecker.checkUsername(m, param=False)
-              items['users'].append(m)
-        except InvalidParameterFormat as ipf:
-          formok = False
-          errors.append(_('Invalid user name(s)'))
-
-      if not formok:
+        for k in users.split('\n'):
+          m = k.replace('\r', '').replace(' ', '')
+          if m == '':
+            continue
+          elif lechecker.USERNAME.valid(m):
+            items['users'].append(m)
+          else:
+            errors.append(_('Invalid user name(s)'))
+            break
+
+      if errors:
         self.session['errors'] = errors
         self.session['reqparams'] = {}
 
@@ -137,8 +129,6 @@ class GroupsController(BaseController):
         for k in self.request.params.iterkeys():
           self.session['reqparams'][k] = cherrypy.request.params[k]
 
-        self.session.save()
-
         raise HTTPRedirect('/groups/editGroup/?gid={0}'.format(gid))
       else:
         items['gid'] = gid
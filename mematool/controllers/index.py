@@ -25,6 +25,7 @@ from mematool import Config
 from mematool.controllers import BaseController
 from mematool.helpers.ldapConnector import LdapConnector
 from mematool.model.dbmodel import Preferences
+from mematool.model.ldapmodel import SessionUser
 from mematool.helpers.i18ntool import ugettext as _
 from mematool.helpers.lechecker import ParamChecker, InvalidParameterFormat
 from mematool.helpers.crypto import encodeAES
@@ -47,7 +48,6 @@ class IndexController(BaseController):
     if errorMsg:
       self.session['flash'] = errorMsg
       self.session['flash_class'] = 'error'
-      self.session.save()
 
     return self.render('/auth/login.mako', errorMsg=errorMsg)
 
@@ -55,7 +55,6 @@ class IndexController(BaseController):
   def setLang(self, lang):
     if lang in Config.get('mematool', 'languages', []):
       self.session['language'] = lang
-      self.session.save()
 
     if 'user' in self.session:
       raise HTTPRedirect('/profile/index')
@@ -83,17 +82,14 @@ class IndexController(BaseController):
     self.session['username'] = username
     self.session['password'] = encodeAES(password)
     self.set_ldapcon(ldap_connector.get_connection())
-    self.session['groups'] = self.mf.getUserGroupList(username)
 
     try:
       user = self.mf.getUser(self.session['username'])
     except:
       return self.index(_('Server error, please retry later'))
 
-    self.session['user'] = user
-
-    if self.is_admin():
-      self.session['pendingMemberValidations'] = self.pendingMemberValidations()
+    # only keep what is needed to authorize requests in the session
+    self.session['user'] = SessionUser(user)
 
     uidNumber = user.uidNumber
     language = self.db.query(Preferences).filter(and_(Preferences.uidNumber == uidNumber, Preferences.key == 'language')).one()
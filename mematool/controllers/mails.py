@@ -17,16 +17,25 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
 
+import subprocess
 import cherrypy
 from cherrypy._cperror import HTTPRedirect
 import logging
 from mematool.controllers import BaseController, TemplateContext
 from mematool.helpers.i18ntool import ugettext as _
-from mematool.helpers.lechecker import ParamChecker, InvalidParameterFormat
+from mematool.helpers import lechecker
+from mematool.helpers import postfix
+from mematool.helpers.lechecker import ParamChecker, InvalidParameterFormat, Field, Schema, N_
 from mematool.model.ldapmodel import Alias
 
 log = logging.getLogger(__name__)
 
+DOMAIN_SCHEMA = Schema([('domain', lechecker.DOMAIN)])
+ALIAS_SCHEMA = Schema([
+  ('domain', lechecker.DOMAIN),
+  ('maildrop', Field(N_('Invalid mail destination!'), max_len=300)),
+])
+
 
 class MailsController(BaseController):
   _cp_config = {'tools.require_auth.on': True}
@@ -39,6 +48,8 @@ class MailsController(BaseController):
     self.sidebar.append({'name': _('Show all domains'), 'args': {'controller': 'mails', 'action': 'listDomains'}})
     self.sidebar.append({'name': _('Add domain'), 'args': {'controller': 'mails', 'action': 'editDomain'}})
     self.sidebar.append({'name': _('Add alias'), 'args': {'controller': 'mails', 'action': 'editAlias'}})
+    if postfix.get_path() is not None:
+      self.sidebar.append({'name': _('Export Postfix map'), 'args': {'controller': 'mails', 'action': 'exportPostfix'}})
 
   @cherrypy.expose()
   def index(self, msg=None, msg_class='error'):
@@ -48,12 +59,12 @@ class MailsController(BaseController):
     if msg and not 'msg' in cherrypy.request.params:
       self.session['flash'] = msg
       self.session['flash_class'] = msg_class
-      self.session.save()
 
     return self.listDomains()
 
   @cherrypy.expose()
   @BaseController.needAdmin
+  @BaseController.cachedPage
   def listDomains(self):
     c = TemplateContext()
     c.heading = _('Managed domains')
@@ -107,8 +118,6 @@ class MailsController(BaseController):
         for k in self.request.params.iterkeys():
           self.session['reqparams'][k] = self.request.params[k]
 
-        self.session.save()
-
         raise HTTPRedirect('/mails/editDomain')
       else:
         items['domain'] = domain
@@ -153,11 +162,11 @@ class MailsController(BaseController):
       msg = _('Failed to delete domain!')
       msg_class = 'error'
 
-    self.session.save()
     return self.index(msg=msg, msg_class=msg_class)
 
   @cherrypy.expose()
   @BaseController.needAdmin
+  @BaseController.cachedPage
   def listAliases(self, domain, *args, **kwargs):
     try:
       ParamChecker.checkDomain('domain', param=True)
@@ -230,7 +239,6 @@ class MailsController(BaseController):
 
   def checkEditAlias(f):
     def new_f(self, mode, alias, domain, mail=None, maildrop=None):
-      formok = True
       errors = []
       items = {}
 
@@ -238,28 +246,14 @@ class MailsController(BaseController):
         raise HTTPRedirect('/mails/index')
 
       if mode == 'add':
-        try:
-          ParamChecker.checkDomain('domain')
-        except InvalidParameterFormat as ipf:
-          formok = False
-          errors.append(ipf.message)
-
+        errors += DOMAIN_SCHEMA.errors({'domain': domain})
         alias += '@' + domain
 
       domain = alias.split('@')[1]
 
-      try:
-        ParamChecker.checkDomain(domain, param=False)
-      except InvalidParameterFormat as ipf:
-        formok = False
-        errors.append(ipf.message)
-
       # @TODO improve check
-      try:
-        ParamChecker.checkString('maildrop', min_len=0, max_len=300)
-      except InvalidParameterFormat as ipf:
-        formok = False
-        errors.append(_('Invalid mail destination!'))
+      errors += ALIAS_SCHEMA.errors({'domain': domain, 'maildrop': maildrop})
+      formok = not errors
 
       if mail and not mail == '':
         for k in mail.split('\n'):
@@ -267,9 +261,7 @@ class MailsController(BaseController):
           if m == '':
             continue
 
-          try:
-            ParamChecker.checkEmail(m, param=False)
-          except:
+          if not lechecker.EMAIL.valid(m):
             formok = False
             break
 
@@ -293,8 +285,6 @@ class MailsController(BaseController):
         for k in cherrypy.request.params.iterkeys():
           self.session['reqparams'][k] = cherrypy.request.params[k]
 
-        self.session.save()
-
         if mode == 'edit':
           raise HTTPRedirect('/mails/editAlias/?alias={0}'.format(alias))
         else:
@@ -341,7 +331,6 @@ class MailsController(BaseController):
         self.mf.addAlias(alias)
 
       self.session['flash'] = _('Alias successfully edited')
-      self.session.save()
     except Exception as e:
       import sys, traceback
       traceback.print_exc(file=sys.stdout)
@@ -374,3 +363,23 @@ class MailsController(BaseController):
       msg_class = 'error'
 
     return self.index(msg=msg, msg_class=msg_class)
+
+  @cherrypy.expose()
+  @BaseController.needAdmin
+  def exportPostfix(self):
+    '''Write the Postfix virtual alias map, see mematool.helpers.postfix'''
+    try:
+      count = postfix.export(self.mf)
+
+      if count is None:
+        msg = _('The Postfix map is up to date')
+        msg_class = 'info'
+      else:
+        msg = _('Postfix map written with {0} entries').format(count)
+        msg_class = 'success'
+    except (LookupError, EnvironmentError, subprocess.CalledProcessError) as e:
+      log.error('Postfix map export failed: {0}'.format(e))
+      msg = _('Failed to write the Postfix map')
+      msg_class = 'error'
+
+    return self.index(msg=msg, msg_class=msg_class)
@@ -23,13 +23,16 @@ import logging
 from sqlalchemy.orm.exc import NoResultFound
 from mematool.controllers import BaseController, TemplateContext
 from mematool.helpers.i18ntool import ugettext as _
-from mematool.helpers.lechecker import ParamChecker, InvalidParameterFormat
+from mematool.helpers import lechecker
+from mematool.helpers.lechecker import Field, Schema, N_
 from mematool.model.dbmodel import TmpMember
 from mematool.model.ldapmodel import Member
 from mematool import Config
 
 log = logging.getLogger(__name__)
 
+MODE_SCHEMA = Schema([('mode', Field(N_('Invalid mode'), values=('add', 'edit')))])
+
 
 class MembersController(BaseController):
   _cp_config = {'tools.require_auth.on': True}
@@ -66,6 +69,7 @@ class MembersController(BaseController):
     try:
       c.heading = _('Edit member')
       c.member = self.mf.getUser(member_id)
+      c.mail_routes = self.mf.getMailRoutes(c.member)
       c.mode = 'edit'
 
       return self.render('/members/editMember.mako', template_context=c)
@@ -78,14 +82,7 @@ class MembersController(BaseController):
   def checkMember(f):
     def new_f(self, member_id, **kwargs):
       # @TODO request.params may contain multiple values per key... test & fix
-      formok = True
-      errors = []
-
-      try:
-        ParamChecker.checkMode('mode', values=('add', 'edit'))
-      except InvalidParameterFormat as ipf:
-        formok = False
-        errors.append(ipf.message)
+      errors = MODE_SCHEMA.errors(self.request.params)
 
       m = Member()
 
@@ -94,20 +91,12 @@ class MembersController(BaseController):
 
       m.uid = member_id
 
-      try:
-        m.check()
-      except InvalidParameterFormat as ipf:
-        formok = False
-        errors += ipf.message
+      errors += m.schema.errors(m.schema.attributes(m))
 
       if self.request.params['mode'] == 'add' or not self.request.params.get('userPassword', '') == '':
-        try:
-          ParamChecker.checkPassword('userPassword', 'userPassword2')
-        except InvalidParameterFormat as ipf:
-          formok = False
-          errors.append(ipf.message)
+        errors += lechecker.PASSWORD.errors(self.request.params)
 
-      if not formok:
+      if errors:
         self.session['errors'] = errors
         self.session['reqparams'] = {}
 
@@ -121,8 +110,6 @@ class MembersController(BaseController):
           else:
             self.session['reqparams'][k] = self.request.params[k]
 
-        self.session.save()
-
         if self.request.params['mode'] == 'add':
           raise HTTPRedirect('/members/addMember')
         else:
@@ -144,7 +131,8 @@ class MembersController(BaseController):
         member.uid = self.request.params['member_id']
 
       for v in member.str_vars:
-        if v in self.request.params:
+        # the password is set by setPassword() below
+        if v in self.request.params and not v in member.credential_vars:
           setattr(member, v, self.request.params.get(v).lstrip(' ').rstrip(' '))
 
       for v in member.bool_vars:
@@ -168,7 +156,6 @@ class MembersController(BaseController):
       self.mf.saveMember(member)
 
       self.session['flash'] = _('Member details successfully edited')
-      self.session.save()
 
       raise HTTPRedirect('/members/editMember/?member_id={0}'.format(self.request.params['member_id']))
 
@@ -180,31 +167,26 @@ class MembersController(BaseController):
 
   @cherrypy.expose()
   @BaseController.needAdmin
+  @BaseController.cachedPage
   def showAllMembers(self, _filter='active'):
     c = TemplateContext()
     try:
       c.heading = _('All members')
+      c.validating = self.pendingValidationUidNumbers()
+      # reads the list now: errors are raised before the page is streamed
+      users = self.mf.iterUsers(clear_credentials=True)
+
+      def members():
+        for m in users:
+          if _filter == 'active' and not m.lockedMember:
+            yield m
+          elif _filter == 'former' and m.lockedMember:
+            yield m
+          elif _filter == 'all':
+            yield m
+
+      return self.render_stream('/members/viewAll.mako', members(), template_context=c)
 
-      members = self.mf.getUsers(clear_credentials=True)
-      c.members = []
-
-      # make sure to clean out some vars
-      for m in members:
-        if _filter == 'active' and not m.lockedMember:
-          c.members.append(m)
-        elif _filter == 'former' and m.lockedMember:
-          c.members.append(m)
-        elif _filter == 'all':
-          c.members.append(m)
-
-      return self.render('/members/viewAll.mako', template_context=c)
-
-    except LookupError as e:
-      import sys, traceback
-      traceback.print_exc(file=sys.stdout)
-      print 'Lookup error!'
-      print e
-      pass
     except NoResultFound:
       print 'No such sql user !'
 
@@ -214,31 +196,16 @@ class MembersController(BaseController):
   @BaseController.needAdmin
   def exportList(self, listType='plain'):
     c = TemplateContext()
-    try:
-      members = self.mf.getUsers()
-      c.members = []
-
-      # make sure to clean out some vars
-      for m in members:
-        m.sambaNTPassword = '******'
-        m.userPassword = '******'
+    # credentials are cleared by the model factory; the list is read
+    # before the export is streamed
+    members = (m for m in self.mf.iterUsers(clear_credentials=True) if not m.lockedMember)
 
-        if not m.lockedMember:
-          c.members.append(m)
-
-      if listType == 'RCSL':
-        cherrypy.response.content_type = 'text/plain'
-        return self.render('/members/exportRCSLCSV.mako', template_context=c)
-      else:
-        cherrypy.response.content_type = 'text/plain'
-        return self.render('/members/exportCSV.mako', template_context=c)
-
-    except LookupError as e:
-      print 'Lookup error!'
-      print e
-      pass
-
-    return 'ERROR 4x0'
+    if listType == 'RCSL':
+      cherrypy.response.content_type = 'text/plain'
+      return self.render_stream('/members/exportRCSLCSV.mako', members, template_context=c)
+    else:
+      cherrypy.response.content_type = 'text/plain'
+      return self.render_stream('/members/exportCSV.mako', members, template_context=c)
 
   @cherrypy.expose()
   @BaseController.needAdmin
@@ -284,7 +251,6 @@ class MembersController(BaseController):
     except LookupError:
       self.session['flash'] = _('Member validation failed!')
 
-    self.session.save()
     raise HTTPRedirect('/members/showAllMembers')
 
   @cherrypy.expose()
@@ -309,7 +275,6 @@ class MembersController(BaseController):
       self.session['flash'] = _('Failed to reject validation!')
       self.session['flash_class'] = 'error'
 
-    self.session.save()
     raise HTTPRedirect('/members/showAllMembers')
 
   def postValidationMail(self, member_id, member_mail, validated=True):
@@ -364,28 +329,15 @@ class MembersController(BaseController):
     try:
       self.mf.deleteUser(member_id)
 
-      aliases = self.mf.getMaildropList(member_id)
-      errors = ''
-      for dn, attr in aliases.items():
-        if errors == '':
-          errors = 'Could not auto-delete the following aliases:'
-
-        m = re.match(r'^mail=([^,]+),', dn)
-        if m:
-          alias = m.group(1)
-          url_ = url(controller='mails', action='editAlias', alias=alias)
-          errors += '\n<br/><a href="{0}" target="_blank">{1}</a>'.format(url_, alias)
-
-        if not errors == '':
-          if not 'errors' in self.session:
-            self.session['errors'] = []
-          self.session['errors'].append(literal(errors))
+      # the aliases the user was the only maildrop of are left
+      remaining = self.mf.getMaildropIndex().routes(member_id)
+      if remaining:
+        self.session['errors'] = self.session.get('errors', [])
+        self.session['errors'].append(_('Could not auto-delete the following aliases: {0}').format(', '.join(remaining)))
 
       self.session['flash'] = _('User successfully deleted')
-      self.session.save()
     except LookupError:
       self.session['flash'] = _('Failed to delete user')
-      self.session.save()
 
     # @TODO make much more noise !
     raise HTTPRedirect('/members/showAllMembers')
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+import cherrypy
+from cherrypy._cperror import HTTPError
+from mematool import Config
+from mematool.helpers import metrics
+
+
+class MetricsController(object):
+  '''Prometheus endpoint, readable with "Authorization: Bearer
+  <[mematool] metrics_token>", or from localhost if no token is set'''
+  _cp_config = {'tools.sessions.on': False,
+                'tools.db.on': False,
+                'tools.I18nTool.on': False,
+                'tools.profiler.on': False,
+                'tools.trailing_slash.on': False,
+                }
+
+  @cherrypy.expose
+  def index(self):
+    if not metrics.allowed(Config.get('mematool', 'metrics_token', '')):
+      raise HTTPError(403)
+
+    cherrypy.response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    cherrypy.response.headers['Cache-Control'] = 'no-cache'
+
+    return metrics.expose()
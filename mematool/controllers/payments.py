@@ -21,17 +21,28 @@ import cherrypy
 from cherrypy._cperror import HTTPRedirect, HTTPError
 import logging
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, func
 import datetime
 from dateutil import parser
 from dateutil.relativedelta import relativedelta
 from mematool.controllers import BaseController, TemplateContext
 from mematool.helpers.i18ntool import ugettext as _
-from mematool.helpers.lechecker import ParamChecker
+from mematool.helpers import lechecker
+from mematool.helpers.lechecker import ParamChecker, Schema, N_
 from mematool.model.dbmodel import Payment
 
 log = logging.getLogger(__name__)
 
+PAYMENT_SCHEMA = Schema([
+  ('date', lechecker.DATE),
+  ('status', lechecker.INT.replace(error=N_('Invalid payment status'))),
+])
+BULK_SCHEMA = Schema([
+  ('member_id', lechecker.USERNAME),
+  ('months', lechecker.INT.replace(max_len=2)),
+])
+VERIFIED = lechecker.INT.replace(max_len=1)
+
 
 # @todo remove this
 def IsInt(string):
@@ -86,8 +97,6 @@ class PaymentsController(BaseController):
       self.session['flash'] = _('Saving payment failed')
       self.session['flash_class'] = 'error'
 
-    self.session.save()
-
     raise HTTPRedirect('/payments/listPayments/?member_id={0}'.format(member_id))
 
   def _getLastPayment(self, uid):
@@ -117,21 +126,14 @@ class PaymentsController(BaseController):
 
   @cherrypy.expose()
   def doBulkAdd(self, member_id, months, verified=None):
-    try:
-      ParamChecker.checkUsername('member_id', param=True)
-      ParamChecker.checkInt('months', param=True, max_len=2)
-    except:
+    if BULK_SCHEMA.errors(self.request.params):
       raise HTTPRedirect('/payments/index')
 
     lastDate = self._getLastPayment(member_id)
     months = int(months)
 
     if self.is_finance_admin():
-      try:
-        ParamChecker.checkInt('verified', param=True, max_len=1)
-        verified = True
-      except:
-        verified = False
+      verified = VERIFIED.valid(verified)
 
     try:
       for i in range(months):
@@ -151,8 +153,6 @@ class PaymentsController(BaseController):
       self.session['flash'] = _('Operation failed')
       self.session['flash_class'] = 'error'
 
-    self.session.save()
-
     raise HTTPRedirect('/payments/listPayments/?member_id={0}'.format(member_id))
 
   @cherrypy.expose()
@@ -165,37 +165,30 @@ class PaymentsController(BaseController):
       showAll = False
 
     activeMembers = self.mf.getActiveMemberList()
+    today = datetime.datetime.now().date()
+
+    # date of the last verified payment of every member, in one query
+    last_payments = dict(self.db.query(Payment.uid, func.max(Payment.date)).filter(Payment.verified == 1).group_by(Payment.uid))
 
     # Prepare add payment form
     c = TemplateContext()
     c.heading = _('Outstanding payments')
-    c.members = []
-    c.member_ids = []
-    for uid in activeMembers:
-      last_payment = None
+    c.member_ids = list(activeMembers)
 
-      try:
-        last_payment = self.db.query(Payment).filter(and_(Payment.uid == uid, Payment.verified == 1)).order_by(Payment.date.desc()).limit(1)[0]
-      except:
-        ''' Don't care if there is no payment '''
-        pass
-
-      m = self.mf.getUser(uid)
-      m.paymentGood = False
-
-      if last_payment:
-        d = last_payment.date
-        today = datetime.datetime.now().date()
+    def members():
+      for uid in activeMembers:
+        paymentGood = False
+        d = last_payments.get(uid)
 
-        if d.year > today.year or (d.year == today.year and d.month >= today.month):
-          m.paymentGood = True
+        if d and (d.year > today.year or (d.year == today.year and d.month >= today.month)):
+          paymentGood = True
 
-      if not m.paymentGood or showAll:
-        c.members.append(m)
+        if not paymentGood or showAll:
+          m = self.mf.getUser(uid)
+          m.paymentGood = paymentGood
+          yield m
 
-      c.member_ids.append(uid)
-
-    return self.render('/payments/showOutstanding.mako', template_context=c)
+    return self.render_stream('/payments/showOutstanding.mako', members(), template_context=c)
 
   @cherrypy.expose()
   def listPayments(self, member_id=None, year=None):
@@ -259,7 +252,6 @@ class PaymentsController(BaseController):
       return "this member has no payments on records"  # replace by "this member has made no payments" message
 
     self.session['return_to'] = ('payments', 'listPayments')
-    self.session.save()
 
     self.sidebar.append({'name': _('Add payment'), 'args': {'controller': 'payments', 'action': 'editPayment', 'params': {'member_id': member_id}}})
 
@@ -317,45 +309,36 @@ class PaymentsController(BaseController):
   def checkPayment(f):
     def new_f(self, member_id, idPayment, date, status):
       # @TODO request.params may contain multiple values per key... test & fix
-      if not self.is_admin() and not member_id == self.session.get('username') or (member_id == self.session.get('username') and ParamChecker.checkInt('idPayment', param=True, optional=True)):
-        print 'checkPayment err0r::', str(self.isAdmin()), str(member_id), str(self.session.get('username')), str(ParamChecker.checkInt('idPayment', param=True, optional=True))
+      if not self.is_admin() and not member_id == self.session.get('username') or (member_id == self.session.get('username') and lechecker.INT.valid(idPayment)):
+        print 'checkPayment err0r::', str(self.is_admin()), str(member_id), str(self.session.get('username')), str(lechecker.INT.valid(idPayment))
         raise HTTPError(403, 'Forbidden')
       else:
-        formok = True
-        errors = []
+        errors = PAYMENT_SCHEMA.errors(self.request.params)
         items = {}
         d = None
 
-        try:
-          ParamChecker.checkDate('date', param=True)
-          d = parser.parse(date)
-          d = datetime.date(d.year, d.month, 1)
-        except Exception as e:
-          print e
-          formok = False
-          errors.append(_('Invalid date'))
-
-        try:
-          ParamChecker.checkInt('status', param=True)
+        if not errors:
+          try:
+            d = parser.parse(date)
+            d = datetime.date(d.year, d.month, 1)
+          except Exception as e:
+            print e
+            errors.append(_('Invalid date'))
+
           items['status'] = int(status)
-        except:
-          formok = False
-          errors.append(_('Invalid payment status'))
 
-        try:
-          ParamChecker.checkInt('idPayment', param=True)
+        if lechecker.INT.valid(idPayment):
           items['idPayment'] = int(idPayment)
-        except:
+        else:
           items['idPayment'] = 0
 
         if not d is None and items['idPayment'] == 0:
           p_count = self.db.query(Payment).filter(Payment.uid == member_id).filter(Payment.date == d).count()
 
           if p_count > 0:
-            formok = False
             errors.append(_('That month is already on records!'))
 
-        if not formok:
+        if errors:
           self.session['errors'] = errors
           self.session['reqparams'] = {}
 
@@ -363,8 +346,6 @@ class PaymentsController(BaseController):
           for k in self.request.params.iterkeys():
             self.session['reqparams'][k] = self.request.params[k]
 
-          self.session.save()
-
           raise HTTPRedirect('/payments/editPayment/?member_id={0}&idPayment={1}'.format(member_id, items['idPayment']))
         else:
           items['date'] = d
@@ -388,7 +369,6 @@ class PaymentsController(BaseController):
         np.verified = verified
       except:
         self.session['flash'] = _('Invalid record')
-        self.session.save()
         raise HTTPRedirect('/payments/listPayments/?member_id={0}'.format(member_id))
     else:
       np = Payment()
@@ -402,13 +382,11 @@ class PaymentsController(BaseController):
       np.uid = member_id
     except:
       self.session['flash'] = _('Invalid member')
-      self.session.save()
       raise HTTPRedirect('/payments/listPayments/?member_id={0}'.format(member_id))
 
     # Cleanup session
     if 'reqparams' in self.session:
       del(self.session['reqparams'])
-    self.session.save()
     ##########
 
     self.db.add(np)
@@ -416,7 +394,6 @@ class PaymentsController(BaseController):
 
     self.session['flash'] = _('Payment saved successfully.')
     self.session['flash_class'] = 'success'
-    self.session.save()
 
     raise HTTPRedirect('/payments/listPayments/?member_id={0}'.format(member_id))
 
@@ -67,7 +67,7 @@ class PreferencesController(BaseController):
 
       c.languages = Config.get('mematool', 'languages', ['en'])
 
-      return self.render('preferences/edit.mako', template_context=c)
+      return self.render('/preferences/edit.mako', template_context=c)
 
     except LookupError:
       print 'Edit :: No such user !'
@@ -93,8 +93,6 @@ class PreferencesController(BaseController):
         for k in self.request.params.iterkeys():
           self.session['reqparams'][k] = self.request.params[k]
 
-        self.session.save()
-
         raise HTTPRedirect('/preferences/edit')
 
       return f(self)
@@ -131,5 +129,4 @@ class PreferencesController(BaseController):
 
     self.db.commit()
 
-    self.session.save()
     raise HTTPRedirect('/preferences/edit')
@@ -20,14 +20,18 @@
 import cherrypy
 from cherrypy._cperror import HTTPError
 import logging
-from PIL import Image
-import StringIO
-import base64
+import json
+import copy
+from cherrypy.lib import static
 from mematool import Config
 from mematool.controllers import BaseController, TemplateContext
 from mematool.helpers.i18ntool import ugettext as _
-from mematool.helpers.lechecker import ParamChecker, InvalidParameterFormat
-from mematool.helpers.crypto import encodeAES
+from mematool.helpers import lechecker
+from mematool.helpers import avatars
+from mematool.helpers import blobstore
+from mematool.helpers.crypto import encodeAES, decodeAES
+from mematool.helpers.ldapConnector import LdapConnector
+from mematool.model.ldapModelFactory import LdapModelFactory
 from mematool.model.dbmodel import TmpMember
 from cherrypy._cperror import HTTPRedirect
 
@@ -82,29 +86,20 @@ class ProfileController(BaseController):
   def checkMember(f):
     def new_f(self, **kwargs):
       # @TODO request.params may contain multiple values per key... test & fix
-      formok = True
-      errors = []
-
-      m = self.mf.getUser(self.session.get('username'))
+      # validated on a copy: within the request, getUser returns the same
+      # Member to doEdit, which compares it with the form
+      m = copy.copy(self.mf.getUser(self.session.get('username')))
 
       for v in m.str_vars:
         if v in self.request.params:
           setattr(m, v, self.request.params.get(v, ''))
 
-      try:
-        m.check()
-      except InvalidParameterFormat as ipf:
-        formok = False
-        errors += ipf.message
+      errors = m.schema.errors(m.schema.attributes(m))
 
       if not self.request.params.get('userPassword', '') == '' and self.request.params['userPassword'] == self.request.params['userPassword2']:
-        try:
-          ParamChecker.checkPassword('userPassword', 'userPassword2')
-        except InvalidParameterFormat as ipf:
-          formok = False
-          errors.append(ipf.message)
+        errors += lechecker.PASSWORD.errors(self.request.params)
 
-      if not formok:
+      if errors:
         self.session['errors'] = errors
         self.session['reqparams'] = {}
 
@@ -112,8 +107,6 @@ class ProfileController(BaseController):
         for k in self.request.params.iterkeys():
           self.session['reqparams'][k] = self.request.params[k]
 
-        self.session.save()
-
         raise HTTPRedirect('/profile/edit')
 
       return f(self)
@@ -178,7 +171,6 @@ class ProfileController(BaseController):
         self.session['flash'] = _('Password updated!')
         self.session['flash_class'] = 'success'
 
-    self.session.save()
     raise HTTPRedirect('/profile/index')
 
   def mailValidationRequired(self):
@@ -192,26 +184,20 @@ class ProfileController(BaseController):
     subject = Config.get('mematool', 'name_prefix') + ' mematool - request for validation'
     self.sendMail(to, subject, body)
 
-  def _resizeImage(self, img):
-      try:
-        o_img = Image.open(img)
-        max_size = (240, 240)
-        o_img.thumbnail(max_size, Image.ANTIALIAS)
-
-        out = StringIO.StringIO()
-        o_img.save(out, format='jpeg', quality=75)
-
-        return base64.b64encode(out.getvalue())
-      except:
-        import sys, traceback
-        traceback.print_exc(file=sys.stdout)
-
-      return None
-
   @cherrypy.expose
-  def editAvatar(self):
+  def editAvatar(self, job=None):
     c = TemplateContext()
     c.heading = _('Edit avatar')
+    c.job = None
+
+    if job is not None:
+      status = avatars.status(job, self.session['username'])
+      if status == avatars.PENDING:
+        c.job = job
+      elif status == avatars.FAILED:
+        log.warning('Avatar job {0} of {1} failed'.format(job, self.session['username']))
+        self.session['flash'] = _('Your avatar could not be processed, please try another image')
+        self.session['flash_class'] = 'error'
 
     try:
       member = self.mf.getUser(self.session['username'])
@@ -231,16 +217,27 @@ class ProfileController(BaseController):
     if not 'avatar' in self.request.params or not len(self.request.params['avatar'].value) > 0:
       raise HTTPRedirect('/profile/editAvatar')
 
-    try:
-      img_param = self.request.params['avatar'].file
-      img = self._resizeImage(img_param)
-      member = self.mf.getUser(self.session['username'])
-      self.mf.updateAvatar(member, img)
-    except:
-      import sys, traceback
-      traceback.print_exc(file=sys.stdout)
+    username = self.session['username']
+    password = self.session['password']
 
-    raise HTTPRedirect('/profile/editAvatar')
+    def store(key, jpeg):
+      # called once the renditions are written, the request is long gone
+      con = LdapConnector(username, decodeAES(password)).get_connection()
+      try:
+        mf = LdapModelFactory(con)
+        key = blobstore.get_photo_store().put(jpeg)
+        mf.updateAvatar(mf.getUser(username), blobstore.make_ref(key))
+      finally:
+        con.unbind_s()
+
+    job = avatars.submit(self.request.params['avatar'].value, owner=username, callback=store)
+
+    raise HTTPRedirect('/profile/editAvatar/?job={0}'.format(job))
+
+  @cherrypy.expose
+  def avatarStatus(self, job):
+    cherrypy.response.headers['Content-Type'] = 'application/json'
+    return json.dumps({'status': avatars.status(job, self.session['username'])})
 
   @cherrypy.expose
   def doDeleteAvatar(self):
@@ -254,13 +251,33 @@ class ProfileController(BaseController):
     raise HTTPRedirect('/profile/editAvatar')
 
   @cherrypy.expose
-  def getAvatar(self, member_id):
+  def getAvatar(self, member_id, size=avatars.SIZES[0]):
     try:
       member = self.mf.getUser(member_id)
 
       if not member.jpegPhoto is None:
-        return member.avatar
+        return self._serveAvatar(member, int(size))
     except:
       pass
 
     return '4x4 p0wer'
+
+  def _serveAvatar(self, member, size):
+    formats = ('jpg',)
+    if 'image/webp' in self.request.headers.get('Accept', ''):
+      formats = ('webp', 'jpg')
+
+    cherrypy.response.headers['Vary'] = 'Accept'
+    key = member.photo_key
+    path = avatars.find_rendition(key, size, formats)
+
+    if path is None:
+      if blobstore.parse_ref(member.jpegPhoto) is None:
+        # still stored in the directory
+        cherrypy.response.headers['Content-Type'] = 'image/jpeg'
+        return member.avatar
+
+      path = blobstore.get_photo_store().path(key)
+
+    content_type = 'image/webp' if path.endswith('.webp') else 'image/jpeg'
+    return static.serve_file(path, content_type)
@@ -18,12 +18,15 @@
 # along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
 
 import cherrypy
+from cherrypy._cperror import HTTPError
+from cherrypy.lib import static
 import logging
 from sqlalchemy import and_
 import datetime
 from mematool.controllers import BaseController, TemplateContext
 from mematool.helpers.i18ntool import ugettext as _
 from mematool.model.dbmodel import Payment
+from mematool.helpers import profiler
 
 log = logging.getLogger(__name__)
 
@@ -34,8 +37,16 @@ class StatisticsController(BaseController):
   def __init__(self):
     super(StatisticsController, self).__init__()
 
+  def _sidebar(self):
+    self.sidebar = []
+
+    if self.is_admin():
+      self.sidebar.append({'name': _('Statistics'), 'args': {'controller': 'statistics', 'action': 'index'}})
+      self.sidebar.append({'name': _('Profiles'), 'args': {'controller': 'statistics', 'action': 'profiles'}})
+
   @cherrypy.expose()
   @BaseController.needAdmin
+  @BaseController.cachedPage
   def index(self):
     c = TemplateContext()
     c.heading = _('Statistics')
@@ -66,3 +77,21 @@ class StatisticsController(BaseController):
     c.paymentsNotOk = c.activeMembers - c.paymentsOk
 
     return self.render('/statistics/index.mako', template_context=c)
+
+  @cherrypy.expose()
+  @BaseController.needAdmin
+  def profiles(self):
+    c = TemplateContext()
+    c.heading = _('Profiles')
+    c.profiles = profiler.list_profiles()
+
+    return self.render('/statistics/profiles.mako', template_context=c)
+
+  @cherrypy.expose()
+  @BaseController.needAdmin
+  def profileFile(self, name, ext='prof'):
+    path = profiler.profile_path(name, ext)
+    if path is None:
+      raise HTTPError(404)
+
+    return static.serve_download(path)
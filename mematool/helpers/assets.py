@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Fingerprinted static assets
+
+``mematool-run.py build-assets`` copies htdocs to the assets directory,
+adding a content hash to every file name, builds the bundles below and
+writes a gzip variant next to every compressible file. manifest.json maps
+the original paths to the fingerprinted ones.
+
+Templates reference assets through asset_url() and asset_bundle(). As
+long as no manifest was built, they return the plain htdocs paths, which
+are served by tools.staticdir as before.
+'''
+
+import os
+import re
+import json
+import gzip
+import hashlib
+import mimetypes
+import threading
+import logging
+from collections import OrderedDict
+import cherrypy
+from cherrypy.lib import static
+from mematool import Config
+
+try:
+  from jsmin import jsmin
+except ImportError:
+  jsmin = None
+
+log = logging.getLogger(__name__)
+
+# URL prefix the fingerprinted files are served under
+PREFIX = '/static'
+
+# bundle -> source files, in the order they have to be loaded
+BUNDLES = OrderedDict([
+  ('css/mematool.bundle.css', ['css/bootstrap.min.css', 'css/mematool_bootstrap_custom.css']),
+  ('javascript/mematool.bundle.js', ['javascript/jquery.min.js', 'javascript/mematool.js', 'javascript/bootstrap.min.js']),
+])
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ttf', '.eot', '.ico', '.json')
+
+MAX_AGE = 365 * 24 * 3600
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+_css_comment = re.compile(r'/\*(?!!).*?\*/', re.S)
+_css_space = re.compile(r'\s+')
+_css_punct = re.compile(r'\s*([{};,])\s*')
+_css_url = re.compile(r'url\(\s*([\'"]?)([^\'")?#]+)([^\'")]*)\1\s*\)')
+
+
+def get_assets_dir():
+  return os.path.join(Config.basePath, Config.get('mematool', 'assets_dir', 'build/static'))
+
+
+def fingerprint(path, content):
+  name, ext = os.path.splitext(path)
+  return '{0}.{1}{2}'.format(name, hashlib.sha1(content).hexdigest()[:12], ext)
+
+
+def minify_css(content):
+  content = _css_comment.sub('', content)
+  content = _css_space.sub(' ', content)
+  return _css_punct.sub(r'\1', content).strip()
+
+
+def minify_js(content):
+  if jsmin is None:
+    return content
+
+  return jsmin(content)
+
+
+def rewrite_css_urls(path, content, manifest):
+  '''Point relative url()s of a stylesheet at the fingerprinted files'''
+  directory = os.path.dirname(path)
+
+  def replace(match):
+    quote, url, suffix = match.groups()
+    if url.startswith('/') or ':' in url:
+      return match.group(0)
+
+    target = os.path.normpath(os.path.join(directory, url)).replace(os.sep, '/')
+    if target not in manifest:
+      return match.group(0)
+
+    url = os.path.relpath(manifest[target], directory or '.').replace(os.sep, '/')
+    return 'url({0}{1}{2}{0})'.format(quote, url, suffix)
+
+  return _css_url.sub(replace, content)
+
+
+def _write(path, content):
+  directory = os.path.dirname(path)
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+
+  tmp = path + '.tmp'
+  with open(tmp, 'wb') as f:
+    f.write(content)
+  os.rename(tmp, path)
+
+  if path.endswith(COMPRESSIBLE):
+    # mtime=0 keeps the .gz files of unchanged assets byte identical
+    with open(tmp, 'wb') as raw:
+      gz = gzip.GzipFile(filename='', mode='wb', fileobj=raw, compresslevel=9, mtime=0)
+      gz.write(content)
+      gz.close()
+    os.rename(tmp, path + '.gz')
+
+
+def build(source=None, target=None):
+  '''Build the fingerprinted assets, return the manifest'''
+  if source is None:
+    source = os.path.join(Config.basePath, 'htdocs')
+  if target is None:
+    target = get_assets_dir()
+
+  files = OrderedDict()
+  for root, dirs, names in os.walk(source):
+    dirs.sort()
+    for name in sorted(names):
+      path = os.path.relpath(os.path.join(root, name), source).replace(os.sep, '/')
+      with open(os.path.join(root, name), 'rb') as f:
+        files[path] = f.read()
+
+  manifest = {}
+
+  # stylesheets come last, they refer to fonts and images
+  for path in sorted(files, key=lambda p: p.endswith('.css')):
+    content = files[path]
+    if path.endswith('.css'):
+      content = rewrite_css_urls(path, content, manifest)
+      files[path] = content
+
+    manifest[path] = fingerprint(path, content)
+    _write(os.path.join(target, manifest[path]), content)
+
+  for bundle, sources in BUNDLES.items():
+    if bundle.endswith('.css'):
+      content = '\n'.join(minify_css(files[s]) for s in sources)
+    else:
+      content = ';\n'.join(minify_js(files[s]) for s in sources)
+
+    manifest[bundle] = fingerprint(bundle, content)
+    _write(os.path.join(target, manifest[bundle]), content)
+
+  _write(os.path.join(target, 'manifest.json'), json.dumps(manifest, indent=1, sort_keys=True))
+  log.info('{0} assets built'.format(len(manifest)))
+
+  return manifest
+
+
+def _load_manifest():
+  path = os.path.join(get_assets_dir(), 'manifest.json')
+  manifest = {}
+
+  if os.path.isfile(path):
+    with open(path, 'rb') as f:
+      manifest = json.load(f)
+
+  return manifest
+
+
+def get_manifest():
+  global _manifest
+
+  if _manifest is None:
+    with _manifest_lock:
+      if _manifest is None:
+        _manifest = _load_manifest()
+
+  return _manifest
+
+
+def reload_manifest():
+  '''Read the manifest again, e.g. after build-assets; return whether it
+  changed'''
+  global _manifest
+
+  with _manifest_lock:
+    old = _manifest
+    _manifest = _load_manifest()
+
+    return not _manifest == old
+
+
+def asset_url(path):
+  '''URL of a file below htdocs, e.g. asset_url('/images/logo.png')'''
+  fingerprinted = get_manifest().get(path.lstrip('/'))
+  if fingerprinted is None:
+    return path
+
+  return '{0}/{1}'.format(PREFIX, fingerprinted)
+
+
+def asset_bundle(bundle):
+  '''URLs to load for a bundle: the bundle itself once built, its sources
+  otherwise'''
+  if bundle in get_manifest():
+    return [asset_url(bundle)]
+
+  return ['/' + s for s in BUNDLES[bundle]]
+
+
+def _accepts_gzip(request):
+  for e in request.headers.elements('Accept-Encoding'):
+    if e.value in ('gzip', '*') and e.qvalue > 0:
+      return True
+
+  return False
+
+
+def serve_asset(root, prefix=PREFIX):
+  '''Serve a fingerprinted file, the gzip variant if the client takes it.
+
+  Names change with the content, so the files are cached forever.
+  '''
+  request = cherrypy.serving.request
+  response = cherrypy.serving.response
+
+  if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(prefix + '/'):
+    return False
+
+  root = os.path.abspath(root)
+  path = os.path.normpath(os.path.join(root, request.path_info[len(prefix) + 1:]))
+  if not path.startswith(root + os.sep) or not os.path.isfile(path):
+    return False
+
+  content_type = mimetypes.guess_type(path)[0]
+  response.headers['Cache-Control'] = 'public, max-age={0}, immutable'.format(MAX_AGE)
+  response.headers['Vary'] = 'Accept-Encoding'
+
+  if os.path.isfile(path + '.gz') and _accepts_gzip(request):
+    response.headers['Content-Encoding'] = 'gzip'
+    path += '.gz'
+
+  static.serve_file(path, content_type)
+
+  return True
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Avatar renditions
+
+Uploaded images are decoded once in a worker process, which writes every
+size in SIZES as JPEG (and WebP where PIL supports it) to the avatar
+directory. Renditions are named after the SHA-1 of the largest JPEG, the
+image that is kept in LDAP, so they can be found again from jpegPhoto.
+
+The status of a job is kept in the configured cache backend (see
+mematool.helpers.cache), so with a shared backend a prefork worker can
+answer the status poll of a job another worker submitted.
+'''
+
+import os
+import uuid
+import hashlib
+import logging
+import threading
+import multiprocessing
+import cStringIO
+from PIL import Image
+from mematool import Config
+from mematool.helpers import cache
+
+log = logging.getLogger(__name__)
+
+SIZES = (240, 180, 48, 20)
+FORMATS = (('jpeg', 'jpg'), ('webp', 'webp'))
+QUALITY = 75
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+# seconds a job is kept for status polls
+JOB_TTL = 3600
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_avatar_dir():
+  return os.path.join(Config.basePath, Config.get('mematool', 'avatar_dir', 'avatars'))
+
+
+def rendition_path(directory, key, size, ext='jpg'):
+  return os.path.join(directory, key[:2], '{0}-{1}.{2}'.format(key, size, ext))
+
+
+def photo_key(jpeg):
+  '''Key of the renditions of the stored (largest) JPEG'''
+  return hashlib.sha1(jpeg).hexdigest()
+
+
+def _encode(img, format):
+  out = cStringIO.StringIO()
+  img.save(out, format=format, quality=QUALITY)
+
+  return out.getvalue()
+
+
+def _write(path, data):
+  directory = os.path.dirname(path)
+  if not os.path.isdir(directory):
+    try:
+      os.makedirs(directory)
+    except OSError:
+      # created by another worker meanwhile
+      pass
+
+  tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+  with open(tmp, 'wb') as f:
+    f.write(data)
+  os.rename(tmp, path)
+
+
+def render(data, directory, key=None):
+  '''Write all renditions of the image in data, return (key, jpeg) where
+  jpeg is the largest JPEG rendition. Renditions are named after `key`,
+  the hash of that JPEG unless given.
+
+  Runs in a worker process.
+  '''
+  img = Image.open(cStringIO.StringIO(data))
+  img = img.convert('RGB')
+
+  renditions = []
+  for size in SIZES:
+    # each size is scaled down from the previous one
+    img.thumbnail((size, size), Image.ANTIALIAS)
+    for format, ext in FORMATS:
+      try:
+        renditions.append((size, ext, _encode(img, format)))
+      except (IOError, KeyError):
+        # this PIL can't write the format
+        pass
+
+  jpeg = renditions[0][2]
+  if key is None:
+    key = photo_key(jpeg)
+
+  for size, ext, content in renditions:
+    _write(rendition_path(directory, key, size, ext), content)
+
+  return key, jpeg
+
+
+def find_rendition(key, size, formats=('jpg',)):
+  '''Path of the smallest rendition of at least `size` pixels in one of
+  `formats`, or None'''
+  directory = get_avatar_dir()
+  candidates = [s for s in reversed(SIZES) if s >= size] or [SIZES[0]]
+
+  for s in candidates:
+    for ext in formats:
+      path = rendition_path(directory, key, s, ext)
+      if os.path.isfile(path):
+        return path
+
+  return None
+
+
+def start():
+  '''Start the worker processes, subscribed to the engine's start channel'''
+  global _pool
+
+  with _pool_lock:
+    if _pool is None:
+      _pool = multiprocessing.Pool(Config.get_int('mematool', 'avatar_workers', 2))
+
+
+def stop():
+  global _pool
+
+  with _pool_lock:
+    if _pool is not None:
+      _pool.close()
+      _pool.join()
+      _pool = None
+
+
+def _job_key(job):
+  return cache.make_key('avatar-job', job)
+
+
+def _set_status(job, owner, status, key=None):
+  cache.get_cache().set(_job_key(job), {'owner': owner, 'status': status, 'key': key}, JOB_TTL)
+
+
+def submit(data, owner=None, callback=None):
+  '''Render the image in data in the background, return the job id.
+
+  callback(key, jpeg) is called in the web process once the renditions
+  are written; the job is only marked done after it returned.
+  '''
+  start()
+
+  job = uuid.uuid4().hex
+  _set_status(job, owner, PENDING)
+
+  def done(result):
+    # runs in the pool's result thread, which must not die
+    if result[0] is None:
+      log.error('Failed to process the avatar of {0}: {1}'.format(owner, result[1]))
+      _set_status(job, owner, FAILED)
+      return
+
+    try:
+      if callback is not None:
+        callback(*result)
+      _set_status(job, owner, DONE, result[0])
+    except Exception:
+      log.exception('Failed to store avatar')
+      _set_status(job, owner, FAILED)
+
+  _pool.apply_async(_render_safely, (data, get_avatar_dir()), callback=done)
+
+  return job
+
+
+def _render_safely(data, directory):
+  '''render() in a worker; returns (None, reason) if it failed'''
+  try:
+    return render(data, directory)
+  except Exception as e:
+    # the traceback stays in the worker, the web process gets the reason
+    log.exception('Failed to process avatar')
+    return None, '{0}: {1}'.format(e.__class__.__name__, e)
+
+
+def status(job, owner=None):
+  '''Status of a job ('pending', 'done', 'failed'), None if unknown'''
+  info = cache.get_cache().get(_job_key(job))
+  if info is None or (owner is not None and not info['owner'] == owner):
+    return None
+
+  return info['status']
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Content addressed blob store
+
+Blobs are files named after the SHA-1 of their content, so storing the
+same data twice costs nothing and a blob never changes once written.
+Directory entries only keep a reference (see make_ref) to the blob.
+'''
+
+import os
+import hashlib
+import threading
+from mematool import Config
+
+REF_PREFIX = 'blob:sha1:'
+
+_photos = None
+_photos_lock = threading.Lock()
+
+
+def make_ref(key):
+  return REF_PREFIX + key
+
+
+def parse_ref(value):
+  '''Return the key of a blob reference, None for anything else'''
+  if value and value.startswith(REF_PREFIX):
+    return value[len(REF_PREFIX):]
+
+  return None
+
+
+class BlobStore(object):
+  def __init__(self, directory):
+    self.directory = directory
+
+  def path(self, key):
+    return os.path.join(self.directory, key[:2], key)
+
+  def exists(self, key):
+    return os.path.isfile(self.path(key))
+
+  def put(self, data):
+    '''Store data, return its key'''
+    key = hashlib.sha1(data).hexdigest()
+    path = self.path(key)
+
+    if not os.path.isfile(path):
+      directory = os.path.dirname(path)
+      if not os.path.isdir(directory):
+        try:
+          os.makedirs(directory)
+        except OSError:
+          # created by another thread meanwhile
+          pass
+
+      tmp = '{0}.{1}.{2}.tmp'.format(path, os.getpid(), threading.current_thread().ident)
+      with open(tmp, 'wb') as f:
+        f.write(data)
+      os.rename(tmp, path)
+
+    return key
+
+  def get(self, key):
+    with open(self.path(key), 'rb') as f:
+      return f.read()
+
+
+def get_photo_store():
+  '''The store holding member photos'''
+  global _photos
+
+  if _photos is None:
+    with _photos_lock:
+      if _photos is None:
+        _photos = BlobStore(os.path.join(Config.basePath, Config.get('mematool', 'photo_dir', 'photos')))
+
+  return _photos
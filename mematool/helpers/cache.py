@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Cache backends
+
+All backends store values serialized with dumps() and offer get, set
+(with an optional TTL in seconds), delete and generation counters. A
+generation is a number which is part of the keys of everything depending
+on some data; bumping it invalidates all those entries at once.
+
+The backend is chosen with [mematool] cache:
+
+ - lru: in-process, every worker has its own copy (default)
+ - sqlite: a file shared by the workers on one host (cache_path)
+ - memcached: memcached servers (cache_servers), shared by all hosts
+
+Values are pickled: the SQLite file and the memcached servers must only
+be writable by the application.
+'''
+
+import os
+import time
+import socket
+import sqlite3
+import hashlib
+import threading
+import cPickle as pickle
+from collections import OrderedDict
+from mematool import Config
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def dumps(value):
+  return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def loads(data):
+  return pickle.loads(data)
+
+
+def make_key(*parts):
+  '''A key of printable characters, short enough for memcached'''
+  return hashlib.sha1(repr(parts)).hexdigest()
+
+
+def _expires(ttl):
+  return time.time() + ttl if ttl else None
+
+
+class Cache(object):
+  def get(self, key):
+    '''The value stored under key, None if there is none'''
+    raise NotImplementedError()
+
+  def set(self, key, value, ttl=None):
+    raise NotImplementedError()
+
+  def delete(self, key):
+    raise NotImplementedError()
+
+  def generation(self, name):
+    raise NotImplementedError()
+
+  def bump_generation(self, name):
+    '''Increment a generation counter, return the new value'''
+    raise NotImplementedError()
+
+
+class LruCache(Cache):
+  def __init__(self, max_entries=1000):
+    self.max_entries = max_entries
+    self.entries = OrderedDict()
+    self.generations = {}
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    with self.lock:
+      entry = self.entries.pop(key, None)
+      if entry is None:
+        return None
+
+      data, expires = entry
+      if expires is not None and expires < time.time():
+        return None
+
+      self.entries[key] = entry
+
+    return loads(data)
+
+  def set(self, key, value, ttl=None):
+    entry = (dumps(value), _expires(ttl))
+
+    with self.lock:
+      self.entries.pop(key, None)
+      self.entries[key] = entry
+
+      while len(self.entries) > self.max_entries:
+        self.entries.popitem(last=False)
+
+  def delete(self, key):
+    with self.lock:
+      self.entries.pop(key, None)
+
+  def generation(self, name):
+    return self.generations.get(name, 0)
+
+  def bump_generation(self, name):
+    with self.lock:
+      self.generations[name] = self.generations.get(name, 0) + 1
+      return self.generations[name]
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+
+
+class SqliteCache(Cache):
+  '''A cache file shared by the processes of one host. SQLite maps the
+  file into memory (mmap_size), so reads don't copy through the kernel.'''
+
+  # expired entries are removed every PURGE_INTERVAL writes
+  PURGE_INTERVAL = 100
+
+  def __init__(self, path, mmap_size=64 * 1024 * 1024):
+    self.path = path
+    self.mmap_size = mmap_size
+    self.local = threading.local()
+    self.writes = 0
+
+    con = self._connection()
+    with con:
+      con.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)')
+      con.execute('CREATE TABLE IF NOT EXISTS generations (name TEXT PRIMARY KEY, value INTEGER)')
+
+  def _connection(self):
+    con = getattr(self.local, 'con', None)
+
+    # connections can't be used across a fork
+    if con is None or not self.local.pid == os.getpid():
+      directory = os.path.dirname(self.path)
+      if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+      con = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+      con.text_factory = str
+      con.execute('PRAGMA journal_mode=WAL')
+      con.execute('PRAGMA synchronous=NORMAL')
+      con.execute('PRAGMA mmap_size={0:d}'.format(self.mmap_size))
+      self.local.con = con
+      self.local.pid = os.getpid()
+
+    return con
+
+  def get(self, key):
+    row = self._connection().execute('SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+    if row is None or (row[1] is not None and row[1] < time.time()):
+      return None
+
+    return loads(str(row[0]))
+
+  def set(self, key, value, ttl=None):
+    con = self._connection()
+    con.execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                (key, sqlite3.Binary(dumps(value)), _expires(ttl)))
+
+    self.writes += 1
+    if self.writes % self.PURGE_INTERVAL == 0:
+      con.execute('DELETE FROM cache WHERE expires < ?', (time.time(),))
+
+  def delete(self, key):
+    self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+  def generation(self, name):
+    row = self._connection().execute('SELECT value FROM generations WHERE name = ?', (name,)).fetchone()
+
+    return row[0] if row is not None else 0
+
+  def bump_generation(self, name):
+    con = self._connection()
+    with con:
+      con.execute('BEGIN IMMEDIATE')
+      con.execute('INSERT OR IGNORE INTO generations (name, value) VALUES (?, 0)', (name,))
+      con.execute('UPDATE generations SET value = value + 1 WHERE name = ?', (name,))
+      return con.execute('SELECT value FROM generations WHERE name = ?', (name,)).fetchone()[0]
+
+
+class MemcachedCache(Cache):
+  '''Client for the memcached text protocol. Keys are spread over the
+  servers by hash; a server which can't be reached is a cache miss.'''
+  def __init__(self, servers, timeout=1.0):
+    self.servers = []
+    for s in servers:
+      host, port = s.rsplit(':', 1) if ':' in s else (s, 11211)
+      self.servers.append((host, int(port)))
+
+    self.timeout = timeout
+    self.local = threading.local()
+
+  def _server(self, key):
+    return self.servers[int(hashlib.md5(key).hexdigest()[:8], 16) % len(self.servers)]
+
+  def _connection(self, server):
+    connections = getattr(self.local, 'connections', None)
+    if connections is None or not self.local.pid == os.getpid():
+      connections = self.local.connections = {}
+      self.local.pid = os.getpid()
+
+    con = connections.get(server)
+    if con is None:
+      sock = socket.create_connection(server, self.timeout)
+      con = connections[server] = (sock, sock.makefile('rb'))
+
+    return con
+
+  def _command(self, key, line, data=None, read=None):
+    '''Send a command, return read(reader) or the response line'''
+    server = self._server(key)
+
+    try:
+      sock, reader = self._connection(server)
+      sock.sendall(line + '\r\n' + (data + '\r\n' if data is not None else ''))
+
+      if read is not None:
+        return read(reader)
+
+      return reader.readline().rstrip('\r\n')
+    except (socket.error, IOError):
+      self.local.connections.pop(server, None)
+      return None
+
+  def _read_value(self, reader):
+    header = reader.readline().rstrip('\r\n')
+    if not header.startswith('VALUE '):
+      return None
+
+    length = int(header.split()[3])
+    data = reader.read(length + 2)[:-2]
+    reader.readline()  # END
+
+    return data
+
+  def get(self, key):
+    data = self._command(key, 'get ' + key, read=self._read_value)
+
+    return loads(data) if data is not None else None
+
+  def set(self, key, value, ttl=None):
+    data = dumps(value)
+    self._command(key, 'set {0} 0 {1:d} {2:d}'.format(key, int(ttl or 0), len(data)), data)
+
+  def delete(self, key):
+    self._command(key, 'delete ' + key)
+
+  def generation(self, name):
+    key = 'generation:' + name
+    value = self._command(key, 'get ' + key, read=self._read_value)
+
+    return int(value) if value is not None else 0
+
+  def bump_generation(self, name):
+    key = 'generation:' + name
+    response = self._command(key, 'incr {0} 1'.format(key))
+    if response is not None and response.isdigit():
+      return int(response)
+
+    # no such counter yet; if another process created it meanwhile, add fails
+    if self._command(key, 'add {0} 0 0 1'.format(key), '1') == 'STORED':
+      return 1
+
+    response = self._command(key, 'incr {0} 1'.format(key))
+    return int(response) if response is not None and response.isdigit() else 0
+
+
+def create_cache():
+  backend = Config.get('mematool', 'cache', 'lru')
+
+  if backend == 'lru':
+    return LruCache(Config.get_int('mematool', 'cache_max_entries', 1000))
+  elif backend == 'sqlite':
+    return SqliteCache(os.path.join(Config.basePath, Config.get('mematool', 'cache_path', 'tmp/cache.sqlite')))
+  elif backend == 'memcached':
+    servers = Config.get('mematool', 'cache_servers', ['127.0.0.1:11211'])
+    if not isinstance(servers, list):
+      servers = [servers]
+
+    return MemcachedCache(servers)
+
+  raise ValueError('Unknown cache backend ' + backend)
+
+
+def get_cache():
+  '''The configured cache, shared by all users in the process'''
+  global _cache
+
+  if _cache is None:
+    with _cache_lock:
+      if _cache is None:
+        _cache = create_cache()
+
+  return _cache
+
+
+def set_cache(cache):
+  global _cache
+
+  _cache = cache
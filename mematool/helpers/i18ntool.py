@@ -80,9 +80,12 @@ That's it.
 """
 
 import os
+import threading
+from collections import OrderedDict
 import cherrypy
 from babel.core import Locale, UnknownLocaleError
 from babel.support import Translations, LazyProxy
+from mematool.helpers import slowlog
 
 try:
     # Python 2.6 and above
@@ -99,6 +102,10 @@ except ImportError:
 # Cache for Translations and Locale objects
 _languages = {}
 
+# Number of (Accept-Language, session language) combinations whose
+# negotiated Lang is kept
+NEGOTIATED_CACHE_SIZE = 512
+
 
 # Exception
 class ImproperlyConfigured(Exception):
@@ -178,6 +185,9 @@ class I18nTool(cherrypy.Tool):
         self._root_path = root_path
         # Make sure, session tool (priority 50) is loaded before
         self._priority = 100
+        # (domain, Accept-Language header, session language) -> Lang
+        self._negotiated = OrderedDict()
+        self._negotiated_lock = threading.Lock()
 
     def _setup(self):
         #c = cherrypy.request.config
@@ -187,6 +197,7 @@ class I18nTool(cherrypy.Tool):
         cherrypy.Tool._setup(self)
         cherrypy.request.hooks.attach('before_finalize', set_header_language)
 
+    @slowlog.timed('i18n', 'negotiate')
     def callable(self, **kw):
         """Main function which will be invoked during the request by `I18nTool`.
         If the SessionTool is on and has a lang key, this language get the
@@ -207,14 +218,32 @@ class I18nTool(cherrypy.Tool):
         default = kw.get('default', None)
         domain = kw.get('domain', None)
 
-        langs = [x.value.replace('-', '_') for x in
-                 cherrypy.request.headers.elements('Accept-Language')]
+        header = cherrypy.request.headers.get('Accept-Language', '')
         sessions_on = cherrypy.request.config.get('tools.sessions.on', False)
-        if sessions_on and cherrypy.session.get('language', ''):
-            langs.insert(0, cherrypy.session.get('language', '__'))
-        langs.append(default)
+        language = ''
+        if sessions_on:
+            language = cherrypy.session.get('language', '')
+
+        key = (domain, header, language)
+        with self._negotiated_lock:
+            loc = self._negotiated.pop(key, None)
+            if loc is not None:
+                self._negotiated[key] = loc
+
+        if loc is None:
+            langs = [x.value.replace('-', '_') for x in
+                     cherrypy.request.headers.elements('Accept-Language')]
+            if language:
+                langs.insert(0, language)
+            langs.append(default)
+
+            loc = self.load_translation(langs, mo_dir, domain)
+
+            with self._negotiated_lock:
+                self._negotiated[key] = loc
+                while len(self._negotiated) > NEGOTIATED_CACHE_SIZE:
+                    self._negotiated.popitem(last=False)
 
-        loc = self.load_translation(langs, mo_dir, domain)
         cherrypy.response.i18n = loc
         if sessions_on:
             cherrypy.session['_lang_'] = str(loc.locale)
@@ -255,6 +284,31 @@ class I18nTool(cherrypy.Tool):
         _languages[(domain, short)] = res = Lang(locale, trans)
         return res
 
+    def preload(self, languages=None):
+        """Load the catalogs of all `languages` (and of the default
+        language) into memory, so no request has to read them from disk.
+        Subscribed to the engine's start channel.
+
+        :returns: The Lang objects loaded.
+        :rtype: List
+        """
+        config = cherrypy.config
+        mo_dir = config.get('tools.I18nTool.mo_dir', '')
+        default = config.get('tools.I18nTool.default', '')
+        domain = config.get('tools.I18nTool.domain', '')
+
+        loaded = []
+        for lang in list(languages or []) + [default]:
+            if lang:
+                loc = self.load_translation([lang, default], mo_dir, domain)
+                if loc not in loaded:
+                    loaded.append(loc)
+
+        with self._negotiated_lock:
+            self._negotiated.clear()
+
+        return loaded
+
     def set_custom_language(self, language):
         config = cherrypy.request.config
         langs = [language, cherrypy.request.config.get('tools.I18nTool.default', '')]
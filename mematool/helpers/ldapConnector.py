@@ -21,6 +21,7 @@
 import ldap
 from mematool.helpers.exceptions import InvalidCredentials, ServerError
 from mematool import Config
+from mematool.helpers import nplusone
 
 
 class LdapConnector(object):
@@ -40,4 +41,4 @@ class LdapConnector(object):
       raise ServerError(str(e))
 
   def get_connection(self):
-    return self.con
+    return nplusone.wrap(self.con)
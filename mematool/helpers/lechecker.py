@@ -260,3 +260,141 @@ class ParamChecker(object):
   def checkDay(fn, param=True, optional=False):
     return ParamChecker._baseCheckInt(fn, _('Invalid day value'),
       param=param, optional=optional, min_val=1, max_val=31)
+
+
+def N_(message):
+  '''Mark a message for translation, Field errors are translated when
+  they are reported'''
+  return message
+
+
+class Field(object):
+  '''Validation rule of a single value.
+
+  Patterns are compiled and value sets frozen once, when the field is
+  defined. Like ParamChecker, an empty value only fails if the field is
+  not optional, and an optional field is never reported.
+  '''
+  def __init__(self, error, kind='str', min_len=0, max_len=999999, regex=None,
+               values=None, ignore_case=False, min_val=None, max_val=None,
+               same_as=None, optional=False, missing=None):
+    self.error = error
+    self.missing = missing or error
+    self.kind = kind
+    self.min_len = min_len
+    self.max_len = max_len
+    self.pattern = regex
+    self.regex = re.compile(regex, re.IGNORECASE) if regex else None
+    self.values = frozenset(values) if values is not None else None
+    self.ignore_case = ignore_case
+    self.min_val = min_val
+    self.max_val = max_val
+    self.same_as = same_as
+    self.optional = optional
+
+  def replace(self, **kwargs):
+    '''Copy of this field with some settings changed'''
+    settings = dict(error=self.error, kind=self.kind, min_len=self.min_len,
+      max_len=self.max_len, regex=self.pattern, values=self.values,
+      ignore_case=self.ignore_case, min_val=self.min_val, max_val=self.max_val,
+      same_as=self.same_as, optional=self.optional, missing=self.missing)
+    settings.update(kwargs)
+
+    return Field(**settings)
+
+  def valid(self, value, data=None):
+    '''True if value is set and passes all rules'''
+    if isinstance(value, bool):
+      value = '1' if value else '0'
+
+    if not value or not isinstance(value, basestring):
+      return False
+
+    if not self.min_len <= len(value) <= self.max_len:
+      return False
+
+    if self.regex is not None and self.regex.match(value) is None:
+      return False
+
+    if self.kind == 'int':
+      try:
+        num = int(value)
+      except ValueError:
+        return False
+
+      if self.min_val is not None and num < self.min_val:
+        return False
+      if self.max_val is not None and num > self.max_val:
+        return False
+    elif self.kind == 'bool' and not value in ('0', '1'):
+      return False
+
+    if self.values is not None:
+      if (value.lower() if self.ignore_case else value) not in self.values:
+        return False
+
+    if self.same_as is not None and not (data or {}).get(self.same_as) == value:
+      return False
+
+    return True
+
+  def check(self, value, data=None):
+    '''Return None if value is acceptable, the error otherwise'''
+    if self.optional:
+      return None
+
+    if not value:
+      return self.missing
+
+    if self.valid(value, data):
+      return None
+
+    return self.error
+
+
+class Schema(object):
+  '''Ordered list of (name, Field) validating a whole form in one pass'''
+  def __init__(self, fields):
+    self.fields = list(fields)
+    self.names = [name for name, field in self.fields]
+
+  def errors(self, data):
+    '''Return the translated errors of all fields of data (a dict like
+    object, e.g. request.params)'''
+    errors = []
+
+    for name, field in self.fields:
+      error = field.check(data.get(name), data)
+      if error is not None:
+        errors.append(_(error))
+
+    return errors
+
+  def attributes(self, obj):
+    '''The values of obj's attributes named like the fields'''
+    return dict((name, getattr(obj, name, None)) for name in self.names)
+
+  def check(self, data):
+    errors = self.errors(data)
+    if errors:
+      raise InvalidParameterFormat(errors)
+
+    return True
+
+
+USERNAME = Field(N_('Invalid username'), max_len=20, regex=regex.username)
+EMAIL = Field(N_('Invalid e-mail address'), regex=regex.email)
+DOMAIN = Field(N_('Invalid domain'), max_len=64, regex=regex.domain)
+DATE = Field(N_('Invalid date'), regex=regex.date)
+PHONE = Field(N_('Invalid phone number'), regex=regex.phone)
+PGP = Field(N_('Invalid PGP key'), regex=regex.pgpKey)
+IBUTTON_UID = Field(N_('Invalid iButton UID'), regex=regex.iButtonUID)
+BOOL = Field(N_('Invalid Boolean value'), kind='bool', min_len=1, max_len=1)
+INT = Field(N_('Invalid Integer value'), kind='int', min_len=1, max_len=999, min_val=0)
+COUNTRY_CODE = Field(N_('Invalid country code'), min_len=2, max_len=2,
+  values=countrycodes.cc, ignore_case=True)
+PASSWORD = Schema([
+  ('userPassword', Field(N_('Invalid password'), min_len=8, max_len=999)),
+  ('userPassword2', Field(N_('Passwords do not match'), same_as='userPassword',
+    missing=N_('Second password not valid'))),
+])
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Metrics in the Prometheus text format
+
+Every thread counts into its own shard, so recording a value takes no
+lock; the shards are only summed up when /metrics is read. The numbers
+are those of the process serving /metrics: with prefork workers, each
+worker has its own.
+'''
+
+import hmac
+import bisect
+import time
+import threading
+import functools
+from collections import OrderedDict
+import cherrypy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from mematool.helpers import profiler
+from mematool.helpers import nplusone
+from mematool.helpers import slowlog
+
+# seconds
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+_metrics = OrderedDict()
+
+
+def _escape(value):
+  return unicode(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+  pairs = list(zip(names, values)) + list(extra)
+  if not pairs:
+    return ''
+
+  return '{' + ','.join(u'{0}="{1}"'.format(k, _escape(v)) for k, v in pairs) + '}'
+
+
+def _format(value):
+  if value == float('inf'):
+    return '+Inf'
+
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+  type = None
+
+  def __init__(self, name, help, labelnames=()):
+    self.name = name
+    self.help = help
+    self.labelnames = tuple(labelnames)
+    self.local = threading.local()
+    self.shards = []
+    self.shards_lock = threading.Lock()
+    _metrics[name] = self
+
+  def _shard(self):
+    '''The calling thread's values, label values -> value'''
+    try:
+      return self.local.shard
+    except AttributeError:
+      shard = self.local.shard = {}
+      with self.shards_lock:
+        self.shards.append(shard)
+
+      return shard
+
+  def header(self):
+    return [u'# HELP {0} {1}'.format(self.name, self.help),
+            u'# TYPE {0} {1}'.format(self.name, self.type)]
+
+
+class Counter(Metric):
+  type = 'counter'
+
+  def inc(self, *labels):
+    shard = self._shard()
+    shard[labels] = shard.get(labels, 0) + 1
+
+  def collect(self):
+    totals = {}
+    for shard in list(self.shards):
+      for labels, value in shard.items():
+        totals[labels] = totals.get(labels, 0) + value
+
+    return totals
+
+  def expose(self):
+    lines = self.header()
+    for labels, value in sorted(self.collect().items()):
+      lines.append(u'{0}{1} {2}'.format(self.name, _labels(self.labelnames, labels), _format(value)))
+
+    return lines
+
+
+class Histogram(Metric):
+  type = 'histogram'
+
+  def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    Metric.__init__(self, name, help, labelnames)
+    self.buckets = tuple(buckets)
+
+  def observe(self, value, *labels):
+    shard = self._shard()
+    values = shard.get(labels)
+    if values is None:
+      # one count per bucket, then +Inf, the sum
+      values = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+
+    values[bisect.bisect_left(self.buckets, value)] += 1
+    values[-1] += value
+
+  def time(self, *labels):
+    '''Decorator measuring the duration of the calls'''
+    def wrap(f):
+      @functools.wraps(f)
+      def new_f(*args, **kwargs):
+        start = time.time()
+        try:
+          return f(*args, **kwargs)
+        finally:
+          self.observe(time.time() - start, *labels)
+
+      return new_f
+    return wrap
+
+  def collect(self):
+    totals = {}
+    for shard in list(self.shards):
+      for labels, values in shard.items():
+        total = totals.setdefault(labels, [0] * len(values))
+        for i, v in enumerate(list(values)):
+          total[i] += v
+
+    return totals
+
+  def expose(self):
+    lines = self.header()
+    for labels, values in sorted(self.collect().items()):
+      count = 0
+      for bound, n in zip(self.buckets + (float('inf'),), values):
+        count += n
+        lines.append(u'{0}_bucket{1} {2}'.format(self.name, _labels(self.labelnames, labels, [('le', _format(bound))]), count))
+
+      lines.append(u'{0}_sum{1} {2}'.format(self.name, _labels(self.labelnames, labels), _format(values[-1])))
+      lines.append(u'{0}_count{1} {2}'.format(self.name, _labels(self.labelnames, labels), count))
+
+    return lines
+
+
+def expose():
+  '''All metrics in the text exposition format'''
+  lines = []
+  for metric in _metrics.values():
+    lines.extend(metric.expose())
+
+  return (u'\n'.join(lines) + u'\n').encode('utf-8')
+
+
+REQUEST_SECONDS = Histogram('mematool_request_duration_seconds', 'Time spent handling requests.', ('mount', 'action', 'status'))
+LDAP_CALLS = Counter('mematool_ldap_calls_total', 'LdapModelFactory method calls.', ('method',))
+LDAP_SECONDS = Histogram('mematool_ldap_duration_seconds', 'Time spent in LdapModelFactory methods.', ('method',))
+SQL_STATEMENTS = Counter('mematool_sql_statements_total', 'SQL statements executed.')
+SQL_SECONDS = Histogram('mematool_sql_duration_seconds', 'Time spent executing SQL statements.')
+TEMPLATE_SECONDS = Histogram('mematool_template_render_seconds', 'Time spent rendering templates.', ('template',))
+SESSION_SAVE_SECONDS = Histogram('mematool_session_save_seconds', 'Time spent saving sessions.')
+
+
+def instrument(cls, names=None):
+  '''Count and time the calls of the methods `names` of cls, by default
+  of all public methods it defines'''
+  if names is None:
+    names = [k for k, v in cls.__dict__.items() if callable(v) and not k.startswith('_')]
+
+  for name in names:
+    f = getattr(cls, name).im_func
+
+    def wrap(f, name):
+      @functools.wraps(f)
+      def new_f(*args, **kwargs):
+        LDAP_CALLS.inc(name)
+        request = cherrypy.serving.request
+        # methods calling each other are only one call to the slow log
+        depth = getattr(request, '_mematool_ldap_depth', 0)
+        request._mematool_ldap_depth = depth + 1
+        start = time.time()
+        try:
+          return f(*args, **kwargs)
+        finally:
+          elapsed = time.time() - start
+          request._mematool_ldap_depth = depth
+          LDAP_SECONDS.observe(elapsed, name)
+          if depth == 0:
+            slowlog.add('ldap', elapsed, name)
+
+      return new_f
+
+    setattr(cls, name, wrap(f, name))
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  conn.info.setdefault('mematool_query_start', []).append(time.time())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  starts = conn.info.get('mematool_query_start')
+  if starts:
+    elapsed = time.time() - starts.pop()
+    SQL_STATEMENTS.inc()
+    SQL_SECONDS.observe(elapsed)
+    slowlog.add('sql', elapsed, nplusone.sql_fingerprint(statement))
+
+
+class MetricsTool(cherrypy.Tool):
+  '''Times every request, labelled with the mount point and the action'''
+  def __init__(self):
+    cherrypy.Tool.__init__(self, 'on_start_resource', self.start, priority=0)
+
+  def _setup(self):
+    cherrypy.Tool._setup(self)
+    cherrypy.serving.request.hooks.attach('on_end_request', self.end)
+
+  def start(self):
+    cherrypy.serving.request._mematool_start = time.time()
+
+  def end(self):
+    request = cherrypy.serving.request
+    start = getattr(request, '_mematool_start', None)
+    if start is None:
+      return
+
+    callable = profiler.page_callable(request.handler)
+    action = callable.__name__ if callable is not None else 'unknown'
+    status = str(cherrypy.serving.response.status or 200)[:3]
+
+    REQUEST_SECONDS.observe(time.time() - start, request.script_name or '/', action, status)
+
+
+def allowed(token=None):
+  '''May the current client read the metrics? With a token, only clients
+  sending it; a reverse proxy on the same host makes every client local.
+  Without one, only local clients.'''
+  request = cherrypy.serving.request
+  if not token:
+    return request.remote.ip in ('127.0.0.1', '::1')
+
+  header = request.headers.get('Authorization', '')
+  expected = 'Bearer ' + token
+  # compare_digest takes two byte strings
+  if isinstance(header, unicode):
+    header = header.encode('utf-8')
+  if isinstance(expected, unicode):
+    expected = expected.encode('utf-8')
+
+  return hmac.compare_digest(header, expected)
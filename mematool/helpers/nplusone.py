@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''N+1 query detection, for debug mode
+
+While tools.nplusone is on, every SQL statement and LDAP operation of a
+request is reduced to a fingerprint: the statement or the search filter
+and base with all values replaced by "?". When the same fingerprint is
+seen more than [mematool] nplusone_threshold times in one request, it is
+most likely run once per row of a list; this is logged with the places
+in mematool issuing it, and added to the bottom of HTML pages.
+'''
+
+import re
+import os
+import logging
+import traceback
+import cherrypy
+from cgi import escape
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from mematool import Config
+
+log = logging.getLogger(__name__)
+
+# call sites kept per fingerprint
+MAX_SITES = 5
+
+_package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_this_file = os.path.splitext(os.path.abspath(__file__))[0]
+
+_space = re.compile(r'\s+')
+_sql_literal = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_sql_in_list = re.compile(r'\bIN\s*\((?:\s*\?\s*,?)+\)', re.I)
+_ldap_value = re.compile(r'=(?!\*\))[^,()]*')
+
+_installed = False
+
+
+def sql_fingerprint(statement):
+  statement = _sql_literal.sub('?', _space.sub(' ', statement.strip()))
+
+  return _sql_in_list.sub('IN (?)', statement)
+
+
+def ldap_fingerprint(operation, base, filterstr=None):
+  fingerprint = u'{0} {1}'.format(operation, _ldap_value.sub('=?', base))
+  if filterstr is not None:
+    fingerprint += u' ' + _ldap_value.sub('=?', filterstr)
+
+  return fingerprint
+
+
+def _call_site():
+  '''The innermost frame in mematool outside of this module'''
+  for filename, line, function, text in reversed(traceback.extract_stack()):
+    path = os.path.abspath(filename)
+    if path.startswith(_package_dir) and not os.path.splitext(path)[0] == _this_file:
+      return '{0}:{1} {2}'.format(os.path.relpath(path, os.path.dirname(_package_dir)), line, function)
+
+  return None
+
+
+def record(kind, fingerprint):
+  queries = getattr(cherrypy.serving.request, '_mematool_queries', None)
+  if queries is None:
+    # not within a request with the tool on
+    return
+
+  entry = queries.get(fingerprint)
+  if entry is None:
+    entry = queries[fingerprint] = {'kind': kind, 'count': 0, 'sites': []}
+
+  entry['count'] += 1
+
+  site = _call_site()
+  if site is not None and not site in entry['sites'] and len(entry['sites']) < MAX_SITES:
+    entry['sites'].append(site)
+
+
+class RecordingConnection(object):
+  '''Wraps an LDAP connection, recording the operations'''
+  def __init__(self, con):
+    self._con = con
+
+  def __getattr__(self, name):
+    return getattr(self._con, name)
+
+  def search_s(self, base, scope, filterstr='(objectClass=*)', *args, **kwargs):
+    record('ldap', ldap_fingerprint('search', base, filterstr))
+    return self._con.search_s(base, scope, filterstr, *args, **kwargs)
+
+  def search(self, base, scope, filterstr='(objectClass=*)', *args, **kwargs):
+    record('ldap', ldap_fingerprint('search', base, filterstr))
+    return self._con.search(base, scope, filterstr, *args, **kwargs)
+
+  def modify_s(self, dn, *args, **kwargs):
+    record('ldap', ldap_fingerprint('modify', dn))
+    return self._con.modify_s(dn, *args, **kwargs)
+
+  def add_s(self, dn, *args, **kwargs):
+    record('ldap', ldap_fingerprint('add', dn))
+    return self._con.add_s(dn, *args, **kwargs)
+
+  def delete_s(self, dn, *args, **kwargs):
+    record('ldap', ldap_fingerprint('delete', dn))
+    return self._con.delete_s(dn, *args, **kwargs)
+
+
+def wrap(con):
+  '''Record the operations on an LDAP connection, once install()ed'''
+  if not _installed:
+    return con
+
+  return RecordingConnection(con)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  record('sql', sql_fingerprint(statement))
+
+
+def install():
+  '''Start recording SQL statements and LDAP operations'''
+  global _installed
+
+  if not _installed:
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    _installed = True
+
+
+def offenders(queries, threshold):
+  '''The entries seen more than threshold times, most frequent first'''
+  found = [(fingerprint, entry) for fingerprint, entry in queries.items() if entry['count'] > threshold]
+
+  return sorted(found, key=lambda f: -f[1]['count'])
+
+
+def _footer(found):
+  rows = []
+  for fingerprint, entry in found:
+    rows.append(u'<tr><td>{0}</td><td>{1}</td><td><code>{2}</code></td><td>{3}</td></tr>'.format(
+                entry['kind'], entry['count'], escape(fingerprint), '<br>'.join(escape(s) for s in entry['sites'])))
+
+  return (u'<div class="container"><table class="table table-condensed" id="nplusone">'
+          u'<caption>Repeated queries</caption>{0}</table></div>'.format(''.join(rows))).encode('utf-8')
+
+
+class NPlusOneTool(cherrypy.Tool):
+  def __init__(self):
+    cherrypy.Tool.__init__(self, 'on_start_resource', self.start)
+
+  def _setup(self):
+    cherrypy.Tool._setup(self)
+    # after the handler and its tools, before the body is encoded
+    cherrypy.serving.request.hooks.attach('before_finalize', self.report, priority=40)
+
+  def start(self):
+    cherrypy.serving.request._mematool_queries = {}
+
+  def report(self):
+    request = cherrypy.serving.request
+    response = cherrypy.serving.response
+
+    found = offenders(request._mematool_queries, Config.get_int('mematool', 'nplusone_threshold', 5))
+    if not found:
+      return
+
+    for fingerprint, entry in found:
+      log.warning(u'{0} {1} {2}x in {3}: {4} (from {5})'.format(
+                  entry['kind'], 'query', entry['count'], request.path_info, fingerprint, ', '.join(entry['sites'])))
+
+    # streamed bodies are only logged
+    if 'html' in response.headers.get('Content-Type', '') and isinstance(response.body, list):
+      body = ''.join(response.body)
+      if '</body>' in body:
+        body = body.replace('</body>', _footer(found) + '</body>', 1)
+        response.body = [body]
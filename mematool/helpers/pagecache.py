@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Directory generation and rendered page cache
+
+Every write to LDAP (through LdapModelFactory) and every committed change
+of the SQL tables shown on list pages bumps a generation counter. Pages
+are cached under a key made of the view, its parameters, the generation,
+the language, the user and the day (payment states depend on the date),
+which is also used as the page's ETag: as long as nothing changed, a
+repeated view is answered from the cache or with a 304 without touching
+LDAP or SQL.
+
+The generation and the pages are kept in the configured cache backend
+(see mematool.helpers.cache), so with a shared backend all workers see
+the same generation and share the rendered pages.
+'''
+
+import datetime
+import types
+import cherrypy
+from cherrypy.lib import cptools
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from mematool.model.dbmodel import Payment, Group, TmpMember
+from mematool.helpers import cache
+
+# SQL tables whose content ends up on cached pages
+WATCHED_MODELS = (Payment, Group, TmpMember)
+
+# bodies larger than this are streamed but not kept
+MAX_BODY_SIZE = 1024 * 1024
+
+# pages of older generations are never asked for again
+TTL = 24 * 3600
+
+GENERATION = 'directory'
+
+
+def generation():
+  return cache.get_cache().generation(GENERATION)
+
+
+def bump_generation():
+  '''Invalidate everything rendered so far'''
+  cache.get_cache().bump_generation(GENERATION)
+
+
+def page_key(view, args, kwargs):
+  user = cherrypy.session.get('user')
+  uid = user.uid if user is not None else None
+  i18n = getattr(cherrypy.response, 'i18n', None)
+  language = str(i18n.locale) if i18n is not None else None
+
+  return cache.make_key('page', view, args, tuple(sorted(kwargs.items())), generation(),
+                        language, uid, datetime.date.today().toordinal())
+
+
+def etag_for(key):
+  return '"{0}"'.format(key)
+
+
+def cacheable():
+  '''Pages showing one-time session messages must be rendered'''
+  for k in ('flash', 'errors', 'reqparams'):
+    if k in cherrypy.session:
+      return False
+
+  return cherrypy.request.method in ('GET', 'HEAD')
+
+
+def mark_rendered():
+  '''Called by the controllers' render methods: the body of this request
+  is a page, which may be cached'''
+  cherrypy.request.page_rendered = True
+
+
+def cached_page(view, f, self, *args, **kwargs):
+  '''Serve ``f(self, *args, **kwargs)`` from the page cache if possible.
+
+  Only bodies rendered from a template (see mark_rendered()) are kept;
+  whatever else a view returns, e.g. an error message, is passed on
+  without ETag.
+  '''
+  if not cacheable():
+    return f(self, *args, **kwargs)
+
+  key = page_key(view, args, kwargs)
+  etag = etag_for(key)
+  response = cherrypy.response
+
+  response.headers['ETag'] = etag
+  response.headers['Cache-Control'] = 'private, no-cache'
+  # raises a 304 if the client already has this generation of the page
+  cptools.validate_etags()
+
+  entry = cache.get_cache().get(key)
+  if entry is not None:
+    content_type, body = entry
+    response.headers['Content-Type'] = content_type
+    return body
+
+  cherrypy.request.page_rendered = False
+  body = f(self, *args, **kwargs)
+
+  if not cherrypy.request.page_rendered:
+    del response.headers['ETag']
+    return body
+
+  if isinstance(body, types.GeneratorType):
+    return _store_streamed(key, body)
+
+  if isinstance(body, str):
+    cache.get_cache().set(key, (response.headers.get('Content-Type'), body), TTL)
+
+  return body
+
+
+def _store_streamed(key, body):
+  content_type = cherrypy.response.headers.get('Content-Type')
+  chunks = []
+  size = 0
+
+  for chunk in body:
+    if chunks is not None:
+      chunks.append(chunk)
+      size += len(chunk)
+      if size > MAX_BODY_SIZE:
+        chunks = None
+
+    yield chunk
+
+  if chunks is not None:
+    cache.get_cache().set(key, (content_type, ''.join(chunks)), TTL)
+
+
+def _after_flush(session, flush_context):
+  for obj in session.new | session.dirty | session.deleted:
+    if isinstance(obj, WATCHED_MODELS):
+      session._mematool_generation_dirty = True
+      break
+
+
+def _after_commit(session):
+  if getattr(session, '_mematool_generation_dirty', False):
+    session._mematool_generation_dirty = False
+    bump_generation()
+
+
+def _after_rollback(session):
+  session._mematool_generation_dirty = False
+
+
+event.listen(Session, 'after_flush', _after_flush)
+event.listen(Session, 'after_commit', _after_commit)
+event.listen(Session, 'after_soft_rollback', lambda session, previous_transaction: _after_rollback(session))
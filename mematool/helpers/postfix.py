@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Postfix virtual alias map
+
+The mail domains and aliases of the directory are written to a lookup
+table for Postfix's virtual_alias_maps, so that the MTA doesn't have to
+query LDAP for every delivery:
+
+  example.com             example.com
+  info@example.com        alice, bob@example.org
+
+[mematool] postfix_virtual is the text file written, relative to the
+application directory; [mematool] postfix_postmap is the postmap command
+turning it into the hashed database postfix_virtual.db, empty to only
+write the text file. main.cf then uses:
+
+  virtual_alias_domains = $virtual_alias_maps
+  virtual_alias_maps = hash:/path/to/postfix_virtual
+
+The table is written in one pass over the entries, to a temporary file
+next to it. The files are only replaced if their content changed, and
+by renaming, so Postfix sees either the old or the new table.
+'''
+
+import os
+import hashlib
+import logging
+import tempfile
+import subprocess
+from mematool import Config
+
+log = logging.getLogger(__name__)
+
+HEADER = '# written by mematool, changes will be lost\n'
+
+
+def get_path():
+  '''The configured text file, None if there is none'''
+  path = Config.get('mematool', 'postfix_virtual', '')
+  if not path:
+    return None
+
+  return os.path.join(Config.basePath, path)
+
+
+def _line(key, targets):
+  if targets is None:
+    # a virtual alias domain, the value is not used
+    targets = [key]
+
+  # as returned by python-ldap, UTF-8 encoded
+  targets = [t.decode('utf-8') if isinstance(t, str) else t for t in targets]
+  if isinstance(key, str):
+    key = key.decode('utf-8')
+
+  return u'{0}\t{1}\n'.format(key, u', '.join(targets)).encode('utf-8')
+
+
+def _valid(key, targets):
+  for v in [key] + list(targets or []):
+    if not v or len(v.split()) > 1 or ',' in v:
+      return False
+
+  return True
+
+
+class Digest(object):
+  '''Digest of a set of lines, which doesn't depend on their order: the
+  directory returns entries in no particular order'''
+  def __init__(self):
+    self.value = 0
+
+  def add(self, line):
+    self.value = (self.value + int(hashlib.sha1(line).hexdigest(), 16)) % (1 << 160)
+
+
+def file_digest(path):
+  '''Digest of the lines of the table at path, None if it doesn't exist'''
+  if not os.path.exists(path):
+    return None
+
+  digest = Digest()
+  with open(path) as f:
+    for line in f:
+      if not line.startswith('#'):
+        digest.add(line)
+
+  return digest.value
+
+
+def write_map(entries, path, postmap=None):
+  '''Write entries, (address, maildrops) or (domain, None) pairs, as the
+  table at path and, with postmap, path.db. Returns the number of
+  entries written, None if the table was already up to date.'''
+  fd, tmp = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=os.path.dirname(path))
+  digest = Digest()
+  count = 0
+
+  try:
+    with os.fdopen(fd, 'w') as f:
+      f.write(HEADER)
+
+      for key, targets in entries:
+        if not _valid(key, targets):
+          log.warning('Not exported to the Postfix map: %r %r', key, targets)
+          continue
+
+        line = _line(key, targets)
+        f.write(line)
+        digest.add(line)
+        count += 1
+
+    if digest.value == file_digest(path) and (not postmap or os.path.exists(path + '.db')):
+      return None
+
+    # readable by the Postfix daemons
+    os.chmod(tmp, 0644)
+
+    if postmap:
+      subprocess.check_call([postmap, 'hash:' + tmp])
+      os.chmod(tmp + '.db', 0644)
+      os.rename(tmp + '.db', path + '.db')
+
+    os.rename(tmp, path)
+  finally:
+    for leftover in (tmp, tmp + '.db'):
+      if os.path.exists(leftover):
+        os.remove(leftover)
+
+  return count
+
+
+def export(mf):
+  '''Write the table of the directory read through the model factory mf
+  to the configured file; see write_map'''
+  path = get_path()
+  if path is None:
+    raise LookupError('[mematool] postfix_virtual is not set')
+
+  return write_map(mf.iterVirtualAliases(), path, Config.get('mematool', 'postfix_postmap', 'postmap'))
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Prefork server
+
+The master process bootstraps the application, warms everything that is
+only read afterwards (configuration, compiled templates, translations,
+asset manifest), binds the listening socket and forks the workers, which
+share that memory copy-on-write. Every worker runs the CherryPy engine and
+an HTTP server accepting on the inherited socket.
+
+The master restarts workers which die. On SIGHUP it reloads the
+configuration, forks a new set of workers and only then stops the old
+ones, which finish the requests they are serving; the socket stays open
+throughout, so no connection is refused. SIGTERM and SIGINT stop all
+workers gracefully.
+'''
+
+import os
+import sys
+import time
+import errno
+import socket
+import signal
+import threading
+import cherrypy
+from cherrypy import wsgiserver
+
+# seconds a stopping worker gets to finish its requests
+SHUTDOWN_TIMEOUT = 30
+
+
+class _InheritedSocketServer(wsgiserver.CherryPyWSGIServer):
+  '''Accepts on a socket bound by the master instead of binding its own'''
+  def __init__(self, listener, *args, **kwargs):
+    wsgiserver.CherryPyWSGIServer.__init__(self, *args, **kwargs)
+    self.listener = listener
+
+  def bind(self, family, type, proto=0):
+    self.socket = self.listener
+    if self.ssl_adapter is not None:
+      self.socket = self.ssl_adapter.bind(self.socket)
+
+
+def _bind(bind_addr, backlog):
+  host, port = bind_addr
+  family, socktype, proto, canonname, addr = socket.getaddrinfo(host, port, socket.AF_UNSPEC, socket.SOCK_STREAM, 0, socket.AI_PASSIVE)[0]
+
+  sock = socket.socket(family, socktype, proto)
+  sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  sock.bind(addr)
+  sock.listen(backlog)
+
+  return sock
+
+
+class Arbiter(object):
+  def __init__(self, app, workers, bind_addr=None, warm=None):
+    '''app is the WSGI application the workers serve, warm() is called
+    in the master before forking and again on every reload'''
+    self.app = app
+    self.num_workers = workers
+    self.bind_addr = bind_addr or cherrypy.server.bind_addr
+    self.warm = warm
+    self.workers = {}
+    self.generation = 0
+    self.listener = None
+    self.stopping = False
+    self._signals = []
+
+  def run(self):
+    # the workers serve with their own server and must not re-exec
+    cherrypy.server.unsubscribe()
+    cherrypy.engine.autoreload.unsubscribe()
+
+    if self.warm is not None:
+      self.warm()
+
+    self.listener = _bind(self.bind_addr, cherrypy.server.socket_queue_size)
+    cherrypy.log('Listening on {0}:{1} with {2} workers'.format(self.bind_addr[0], self.bind_addr[1], self.num_workers), 'PREFORK')
+
+    for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+      signal.signal(sig, self._signal)
+
+    self.spawn()
+
+    while self.workers:
+      self.reap()
+
+      while self._signals:
+        sig = self._signals.pop(0)
+        if sig == signal.SIGHUP:
+          self.reload()
+        elif sig in (signal.SIGTERM, signal.SIGINT) and not self.stopping:
+          self.stop()
+
+      if not self.stopping:
+        # replace workers which died
+        self.spawn()
+
+      try:
+        time.sleep(1)
+      except IOError:
+        # interrupted by a signal
+        pass
+
+    self.listener.close()
+
+  def _signal(self, sig, frame):
+    if not sig == signal.SIGCHLD:
+      self._signals.append(sig)
+
+  def spawn(self):
+    '''Fork workers until the current generation is complete'''
+    current = [g for g in self.workers.values() if g == self.generation]
+
+    for i in range(self.num_workers - len(current)):
+      pid = os.fork()
+      if pid == 0:
+        self._worker()
+
+      self.workers[pid] = self.generation
+
+  def reap(self):
+    while True:
+      try:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+      except OSError, e:
+        if e.errno == errno.ECHILD:
+          return
+        raise
+
+      if pid == 0:
+        return
+
+      if self.workers.pop(pid, None) == self.generation and not self.stopping:
+        cherrypy.log('Worker {0} exited with status {1}'.format(pid, status), 'PREFORK')
+
+  def kill(self, pids, sig=signal.SIGTERM):
+    for pid in pids:
+      try:
+        os.kill(pid, sig)
+      except OSError, e:
+        if not e.errno == errno.ESRCH:
+          raise
+
+  def reload(self):
+    '''Start new workers, then retire the old ones'''
+    cherrypy.log('Reloading', 'PREFORK')
+    if self.warm is not None:
+      self.warm()
+
+    old = list(self.workers.keys())
+    self.generation += 1
+    self.spawn()
+    self.kill(old)
+
+  def stop(self):
+    cherrypy.log('Stopping workers', 'PREFORK')
+    self.stopping = True
+    self.kill(list(self.workers.keys()))
+
+  def _serve(self, server):
+    try:
+      server.start()
+    except Exception:
+      cherrypy.log('HTTP server failed', 'PREFORK', traceback=True)
+
+  def _worker(self):
+    '''Body of a worker process, never returns'''
+    stopped = threading.Event()
+    for sig in (signal.SIGHUP, signal.SIGCHLD):
+      signal.signal(sig, signal.SIG_DFL)
+    for sig in (signal.SIGTERM, signal.SIGINT):
+      signal.signal(sig, lambda sig, frame: stopped.set())
+
+    status = 0
+    try:
+      server = _InheritedSocketServer(self.listener, self.bind_addr, self.app,
+                                      numthreads=cherrypy.server.thread_pool,
+                                      shutdown_timeout=SHUTDOWN_TIMEOUT)
+      # the plugins (database, worker pools, config monitor) start their
+      # threads here, threads don't survive a fork
+      cherrypy.engine.start()
+
+      thread = threading.Thread(target=self._serve, args=(server,), name='HTTPServer')
+      thread.daemon = True
+      thread.start()
+
+      while not stopped.is_set() and thread.is_alive():
+        # wait() without timeout can't be interrupted by signals
+        stopped.wait(1)
+
+      server.stop()
+      cherrypy.engine.exit()
+    except Exception:
+      cherrypy.log('Worker failed', 'PREFORK', traceback=True)
+      status = 1
+    finally:
+      sys.stdout.flush()
+      sys.stderr.flush()
+      os._exit(status)
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Profiling of single requests
+
+With tools.profiler.on, a request is run under cProfile when an admin
+asks for it (the _profile=1 parameter or an X-Profile: 1 header) and
+every [mematool] profile_every-th request (0, the default, turns sampling
+off). For each profiled request three files are written to the profile
+directory, named after the time and a random id:
+
+ - <name>.prof: the cProfile data, for pstats, snakeviz, ...
+ - <name>.collapsed: collapsed stacks ("a;b;c microseconds" lines) for
+   flamegraph.pl and speedscope
+ - <name>.json: the view, the user and the wall time
+
+The call graph recorded by cProfile doesn't keep whole stacks, the
+collapsed stacks split the time of a function between its callers in
+proportion to the time spent on behalf of each of them.
+'''
+
+import os
+import time
+import json
+import uuid
+import pstats
+import cProfile
+import itertools
+import threading
+import types
+import cherrypy
+from mematool import Config
+
+PARAM = '_profile'
+HEADER = 'X-Profile'
+
+# older profiles are deleted
+MAX_PROFILES = 50
+
+# collapsed stacks deeper than this are cut
+MAX_DEPTH = 100
+
+_counter = itertools.count(1)
+_write_lock = threading.Lock()
+
+
+def get_profile_dir():
+  return os.path.join(Config.basePath, Config.get('mematool', 'profile_dir', 'tmp/profiles'))
+
+
+def _requested(request):
+  '''Did an admin ask for this request to be profiled?'''
+  flag = request.params.pop(PARAM, None) or request.headers.get(HEADER)
+  if not flag in ('1', 'true'):
+    return False
+
+  user = cherrypy.session.get('user') if hasattr(cherrypy, 'session') else None
+
+  return user is not None and user.is_admin()
+
+
+def _sampled():
+  every = Config.get_int('mematool', 'profile_every', 0)
+
+  return every > 0 and next(_counter) % every == 0
+
+
+def _label(name):
+  filename, line, function = name
+  if filename == '~':
+    # built-in functions
+    return function
+
+  return '{0}:{1}:{2}'.format(os.path.basename(filename), line, function)
+
+
+def collapse(stats):
+  '''Collapsed stacks of a pstats.Stats, as a list of lines'''
+  callees = {}
+  for function, (cc, nc, tt, ct, callers) in stats.stats.items():
+    for caller, edge in callers.items():
+      callees.setdefault(caller, []).append((function, edge[3]))
+
+  totals = {}
+
+  def walk(function, path, share):
+    cc, nc, tt, ct, callers = stats.stats[function]
+    path = path + [_label(function)]
+    ct = ct or 1e-9
+
+    own = tt * share / ct
+    if own > 0:
+      key = ';'.join(path)
+      totals[key] = totals.get(key, 0) + own
+
+    if len(path) >= MAX_DEPTH:
+      return
+
+    for callee, edge_time in callees.get(function, []):
+      if _label(callee) in path:
+        # recursion, already accounted for in the caller's time
+        continue
+
+      walk(callee, path, share * edge_time / ct)
+
+  for function, (cc, nc, tt, ct, callers) in stats.stats.items():
+    if not callers:
+      walk(function, [], ct)
+
+  return ['{0} {1:d}'.format(k, int(v * 1e6)) for k, v in sorted(totals.items()) if int(v * 1e6) > 0]
+
+
+def _save(profile, info):
+  directory = get_profile_dir()
+  name = '{0}-{1}'.format(time.strftime('%Y%m%d-%H%M%S'), uuid.uuid4().hex[:8])
+  base = os.path.join(directory, name)
+
+  with _write_lock:
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+
+    profile.dump_stats(base + '.prof')
+
+    with open(base + '.collapsed', 'w') as f:
+      f.write('\n'.join(collapse(pstats.Stats(profile))) + '\n')
+
+    info['name'] = name
+    with open(base + '.json', 'w') as f:
+      json.dump(info, f)
+
+    # keep the newest MAX_PROFILES
+    for old in list_profiles()[MAX_PROFILES:]:
+      for ext in ('.prof', '.collapsed', '.json'):
+        try:
+          os.remove(os.path.join(directory, old['name'] + ext))
+        except OSError:
+          pass
+
+
+def list_profiles():
+  '''Metadata of the stored profiles, newest first'''
+  directory = get_profile_dir()
+  if not os.path.isdir(directory):
+    return []
+
+  profiles = []
+  for filename in sorted(os.listdir(directory), reverse=True):
+    if filename.endswith('.json'):
+      try:
+        with open(os.path.join(directory, filename)) as f:
+          profiles.append(json.load(f))
+      except (IOError, ValueError):
+        # being written
+        pass
+
+  return profiles
+
+
+def profile_path(name, ext):
+  '''Path of a stored profile file, None if there is no such file'''
+  if not ext in ('prof', 'collapsed') or not name.replace('-', '').isalnum():
+    return None
+
+  path = os.path.join(get_profile_dir(), '{0}.{1}'.format(name, ext))
+
+  return path if os.path.isfile(path) else None
+
+
+def page_callable(handler):
+  '''The controller method behind a page handler, possibly wrapped by
+  tools, None if there is none (e.g. for a 404)'''
+  while not hasattr(handler, 'callable') and hasattr(handler, 'oldhandler'):
+    handler = handler.oldhandler
+
+  callable = getattr(handler, 'callable', None)
+
+  return callable if hasattr(callable, 'im_class') else None
+
+
+def _view(handler):
+  '''controller.action of a page handler'''
+  callable = page_callable(handler)
+  if callable is None:
+    return None
+
+  return '{0}.{1}'.format(callable.im_class.__name__, callable.__name__)
+
+
+class ProfiledHandler(object):
+  def __init__(self, handler, requested):
+    # named like the attribute of the wrappers of CherryPy's tools
+    self.oldhandler = handler
+    self.requested = requested
+
+  def __call__(self, *args, **kwargs):
+    request = cherrypy.serving.request
+    profile = cProfile.Profile()
+    start = time.time()
+
+    profile.enable()
+    try:
+      body = self.oldhandler(*args, **kwargs)
+      if isinstance(body, types.GeneratorType):
+        # streamed pages are rendered while iterating
+        body = list(body)
+    finally:
+      profile.disable()
+      wall = time.time() - start
+
+      user = cherrypy.session.get('username') if hasattr(cherrypy, 'session') else None
+      view = _view(self.oldhandler) or request.path_info
+
+      try:
+        _save(profile, {'view': view,
+                        'path': request.path_info,
+                        'user': user,
+                        'requested': self.requested,
+                        'time': start,
+                        'wall': wall})
+      except (IOError, OSError):
+        cherrypy.log('Could not save profile', 'PROFILER', traceback=True)
+
+    return body
+
+
+def profile_request():
+  '''before_handler hook of tools.profiler; needs the session, so it runs
+  after tools.sessions'''
+  request = cherrypy.serving.request
+  if request.handler is None:
+    return
+
+  requested = _requested(request)
+  if requested or _sampled():
+    request.handler = ProfiledHandler(request.handler, requested)
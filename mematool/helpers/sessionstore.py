@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Session storage backends
+
+Select a backend with ``tools.sessions.storage_type``:
+
+  lru   process local, keeps at most ``tools.sessions.max_entries`` sessions
+  sql   shared between worker processes through the ``session`` table
+
+Both backends pickle the session payload exactly once per request and only
+write it back when it changed (or when it has to be kept alive), no matter
+how often ``session.save()`` is called by the application.
+'''
+
+import threading
+import datetime
+import cPickle as pickle
+import cStringIO
+from collections import OrderedDict
+from cherrypy.lib import sessions
+from sqlalchemy import create_engine, select, func
+from mematool.model.dbmodel import SessionData
+from mematool.model.satool import get_connection_string
+from mematool.helpers import metrics
+from mematool.helpers import slowlog
+
+
+def dumps(data, protocol=2):
+  '''Pickle without a memo, so equal payloads give equal bytes'''
+  out = cStringIO.StringIO()
+  p = pickle.Pickler(out, protocol)
+  p.fast = 1
+  p.dump(data)
+
+  return out.getvalue()
+
+
+class StoredSession(sessions.Session):
+  '''Base class of the mematool session backends.
+
+  Subclasses only move opaque ``(blob, expiration_time)`` records with
+  `_fetch`, `_store` and `_remove`; serialization and the dirty check
+  happen here.
+  '''
+  pickle_protocol = 2
+
+  # Class-level objects. Don't rebind these!
+  locks = {}
+  locks_lock = threading.Lock()
+
+  # record read by _exists(), reused by the following _load()
+  _record = None
+  # last record read from or written to the backend
+  _stored = None
+
+  @classmethod
+  def setup(cls, **kwargs):
+    '''Called once per process by cherrypy.lib.sessions.init()'''
+    for k, v in kwargs.items():
+      setattr(cls, k, v)
+
+  def _fetch(self):
+    '''Return the stored (blob, expiration_time) tuple or None'''
+    raise NotImplementedError()
+
+  def _store(self, blob, expiration_time):
+    raise NotImplementedError()
+
+  def _remove(self):
+    raise NotImplementedError()
+
+  def _exists(self):
+    self._record = self._fetch()
+    return self._record is not None
+
+  @slowlog.timed('session', 'load')
+  def _load(self):
+    record = self._record
+    if record is None:
+      record = self._fetch()
+
+    self._record = None
+    self._stored = record
+
+    if record is None:
+      return None
+
+    return (pickle.loads(record[0]), record[1])
+
+  def _save(self, expiration_time):
+    blob = dumps(self._data, self.pickle_protocol)
+    self._store(blob, expiration_time)
+    self._stored = (blob, expiration_time)
+
+  def _delete(self):
+    self._remove()
+    self._stored = None
+
+  def _needs_save(self, blob):
+    if self._stored is None:
+      # don't persist sessions nobody wrote anything into
+      return len(self._data) > 0
+
+    stored_blob, expiration_time = self._stored
+    if not blob == stored_blob:
+      return True
+
+    # unchanged data is only rewritten to keep the session alive
+    remaining = expiration_time - self.now()
+    return remaining < datetime.timedelta(seconds=self.timeout * 30)
+
+  @metrics.SESSION_SAVE_SECONDS.time()
+  @slowlog.timed('session', 'save')
+  def save(self):
+    '''Write the session back if its content changed'''
+    try:
+      if self.loaded:
+        blob = dumps(self._data, self.pickle_protocol)
+
+        if self._needs_save(blob):
+          expiration_time = self.now() + datetime.timedelta(seconds=self.timeout * 60)
+          self._store(blob, expiration_time)
+          self._stored = (blob, expiration_time)
+    finally:
+      if self.locked:
+        self.release_lock()
+
+  def acquire_lock(self):
+    with self.locks_lock:
+      lock = self.locks.setdefault(self.id, threading.RLock())
+
+    if not lock.acquire(False):
+      lock.acquire()
+      # somebody else held the session, what _exists() read may be stale
+      self._record = None
+
+    self.locked = True
+
+  def release_lock(self):
+    self.locks[self.id].release()
+    self.locked = False
+
+    if self._stored is None:
+      # nothing was stored for this id, don't keep its lock around
+      with self.locks_lock:
+        self.locks.pop(self.id, None)
+
+  def _drop_locks(self, ids):
+    with self.locks_lock:
+      for id in ids:
+        self.locks.pop(id, None)
+
+
+class LruSession(StoredSession):
+  '''Process local store dropping the least recently used sessions once
+  more than `max_entries` are held'''
+  max_entries = 10000
+
+  # Class-level objects. Don't rebind these!
+  cache = OrderedDict()
+  cache_lock = threading.Lock()
+
+  def _fetch(self):
+    with self.cache_lock:
+      record = self.cache.pop(self.id, None)
+      if record is not None:
+        self.cache[self.id] = record
+
+    return record
+
+  def _store(self, blob, expiration_time):
+    evicted = []
+
+    with self.cache_lock:
+      self.cache.pop(self.id, None)
+      self.cache[self.id] = (blob, expiration_time)
+
+      while len(self.cache) > int(self.max_entries):
+        id, record = self.cache.popitem(last=False)
+        evicted.append(id)
+
+    self._drop_locks(evicted)
+
+  def _remove(self):
+    with self.cache_lock:
+      self.cache.pop(self.id, None)
+
+  def clean_up(self):
+    '''Clean up expired sessions'''
+    now = self.now()
+    expired = []
+
+    with self.cache_lock:
+      for id, (blob, expiration_time) in self.cache.items():
+        if expiration_time <= now:
+          del self.cache[id]
+          expired.append(id)
+
+    self._drop_locks(expired)
+
+  def __len__(self):
+    return len(self.cache)
+
+
+class SqlSession(StoredSession):
+  '''Store shared by all worker processes using the same database.
+
+  Locks are process local: two processes serving the same session at the
+  same time is last-writer-wins, just like two browser tabs would be.
+  '''
+  url = None
+
+  # Class-level objects. Don't rebind these!
+  engine = None
+  engine_lock = threading.Lock()
+  table = SessionData.__table__
+
+  @classmethod
+  def get_engine(cls):
+    if cls.engine is None:
+      with cls.engine_lock:
+        if cls.engine is None:
+          engine = create_engine(cls.url or get_connection_string(), pool_recycle=3600)
+          cls.table.create(engine, checkfirst=True)
+          cls.engine = engine
+
+    return cls.engine
+
+  def _fetch(self):
+    t = self.table
+    row = self.get_engine().execute(
+      select([t.c.data, t.c.expiration_time]).where(t.c.id == self.id)).first()
+
+    if row is None:
+      return None
+
+    return (str(row[0]), row[1])
+
+  def _store(self, blob, expiration_time):
+    t = self.table
+    con = self.get_engine().connect()
+
+    try:
+      result = con.execute(t.update().where(t.c.id == self.id).values(
+        data=blob, expiration_time=expiration_time))
+
+      if result.rowcount == 0:
+        con.execute(t.insert().values(id=self.id, data=blob,
+          expiration_time=expiration_time))
+    finally:
+      con.close()
+
+  def _remove(self):
+    t = self.table
+    self.get_engine().execute(t.delete().where(t.c.id == self.id))
+
+  def clean_up(self):
+    '''Clean up expired sessions'''
+    t = self.table
+    now = self.now()
+    engine = self.get_engine()
+
+    expired = [row[0] for row in engine.execute(select([t.c.id]).where(t.c.expiration_time <= now))]
+    engine.execute(t.delete().where(t.c.expiration_time <= now))
+
+    self._drop_locks(expired)
+
+  def __len__(self):
+    t = self.table
+    return self.get_engine().execute(select([func.count(t.c.id)])).scalar()
+
+
+# cherrypy.lib.sessions.init() looks 'tools.sessions.storage_type' up in
+# its own module namespace ('lru' -> LruSession)
+sessions.LruSession = LruSession
+sessions.SqlSession = SqlSession
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Slow request log
+
+tools.slowlog adds up, per request, the time spent in each phase (ldap,
+sql, template, session, i18n; see add()). Requests taking longer than
+[mematool] slow_request_ms are written as one JSON object per line to
+[mematool] slow_log, or to the application log if it isn't set:
+
+  {"path": "/members/showAllMembers", "action": "MembersController.showAllMembers",
+   "user": "admin", "status": 200, "wall": 2.1,
+   "phases": {"ldap": {"seconds": 1.7, "count": 143}, ...}, "other": 0.1,
+   "slowest": [{"phase": "ldap", "seconds": 0.05, "detail": "getUser"}, ...]}
+
+"other" is the time outside of the measured phases.
+'''
+
+import os
+import json
+import time
+import heapq
+import logging
+import functools
+import cherrypy
+from mematool import Config
+from mematool.helpers import profiler
+
+log = logging.getLogger(__name__)
+
+# individual calls kept per request
+SLOWEST = 10
+
+_writer = None
+
+
+def add(phase, seconds, detail=None):
+  '''Account seconds spent in phase to the current request'''
+  request = cherrypy.serving.request
+  phases = getattr(request, '_mematool_phases', None)
+  if phases is None:
+    # not within a request with the tool on
+    return
+
+  total = phases.get(phase)
+  if total is None:
+    total = phases[phase] = [0.0, 0]
+
+  total[0] += seconds
+  total[1] += 1
+
+  slowest = request._mematool_slowest
+  entry = (seconds, phase, detail)
+  if len(slowest) < SLOWEST:
+    heapq.heappush(slowest, entry)
+  elif seconds > slowest[0][0]:
+    heapq.heapreplace(slowest, entry)
+
+
+def timed(phase, detail=None):
+  '''Decorator accounting the duration of the calls to phase'''
+  def wrap(f):
+    @functools.wraps(f)
+    def new_f(*args, **kwargs):
+      start = time.time()
+      try:
+        return f(*args, **kwargs)
+      finally:
+        add(phase, time.time() - start, detail)
+
+    return new_f
+  return wrap
+
+
+def _get_writer():
+  '''logger the slow requests are written to'''
+  global _writer
+
+  if _writer is None:
+    path = Config.get('mematool', 'slow_log', '')
+    if not path:
+      _writer = log
+    else:
+      writer = logging.getLogger(__name__ + '.file')
+      writer.propagate = False
+      handler = logging.FileHandler(os.path.join(Config.basePath, path))
+      handler.setFormatter(logging.Formatter('%(message)s'))
+      writer.addHandler(handler)
+      writer.setLevel(logging.INFO)
+      _writer = writer
+
+  return _writer
+
+
+class SlowLogTool(cherrypy.Tool):
+  def __init__(self):
+    cherrypy.Tool.__init__(self, 'on_start_resource', self.start, priority=0)
+
+  def _setup(self):
+    cherrypy.Tool._setup(self)
+    cherrypy.serving.request.hooks.attach('on_end_request', self.end)
+
+  def start(self):
+    request = cherrypy.serving.request
+    request._mematool_phases = {}
+    request._mematool_slowest = []
+    request._mematool_slowlog_start = time.time()
+
+  def end(self):
+    request = cherrypy.serving.request
+    wall = time.time() - request._mematool_slowlog_start
+
+    if wall * 1000 < Config.get_int('mematool', 'slow_request_ms', 1000):
+      return
+
+    phases = dict((k, {'seconds': round(v[0], 6), 'count': v[1]}) for k, v in request._mematool_phases.items())
+    measured = sum(v[0] for v in request._mematool_phases.values())
+    session = getattr(cherrypy.serving, 'session', None)
+    callable = profiler.page_callable(request.handler)
+
+    entry = {'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(request._mematool_slowlog_start)),
+             'method': request.method,
+             'path': request.path_info,
+             'mount': request.script_name or '/',
+             'action': '{0}.{1}'.format(callable.im_class.__name__, callable.__name__) if callable is not None else None,
+             'user': session.get('username') if session is not None and session.loaded else None,
+             'status': int(str(cherrypy.serving.response.status or 200)[:3]),
+             'wall': round(wall, 6),
+             'phases': phases,
+             'other': round(max(wall - measured, 0), 6),
+             'slowest': [{'phase': p, 'seconds': round(s, 6), 'detail': d}
+                         for s, p, d in sorted(request._mematool_slowest, reverse=True)],
+             }
+
+    _get_writer().warning(json.dumps(entry, sort_keys=True))
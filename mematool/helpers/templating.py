@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Process wide Mako template lookup
+
+All controllers share one TemplateLookup. Compiled templates stay in
+memory; outside of debug mode the template files are not stat()ed again,
+so template changes require a restart (or a new precompile at deploy time).
+
+With ``bake_translations`` on, every language gets a lookup of its own.
+Its templates are compiled with all ``_('literal')`` calls already
+replaced by their translation, so static strings cost nothing at render
+time. Calls on computed strings are still translated while rendering.
+Their compiled modules are kept per language and catalog version (see
+catalog_version()), as Mako only compares them with the template file.
+'''
+
+import os
+import re
+import ast
+import hashlib
+import threading
+import logging
+from mako.lookup import TemplateLookup
+from mematool import Config
+
+log = logging.getLogger(__name__)
+
+_lookup = None
+_lookup_lock = threading.Lock()
+# locale name -> TemplateLookup with baked in translations
+_translated = {}
+_bake_translations = None
+
+_literal = r'''('(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*")'''
+# ${_('literal')}, replaced by plain text where possible
+_gettext_expr = re.compile(r'\$\{\s*_\(\s*' + _literal + r'\s*\)\s*\}')
+# any other _('literal') in Python code, replaced by a unicode literal
+_gettext_call = re.compile(r'(?<![\w.])_\(\s*' + _literal + r'\s*\)')
+# the Python code of a template: <% %> blocks, ${} expressions and
+# % control lines; template text (markup, inline JavaScript) is left alone
+_mako_code = re.compile(r'<%!?(?=\s).*?%>|\$\{(?:' + _literal + r'''|[^'"}])*\}|^[ \t]*%(?!%)[^\n]*''', re.S | re.M)
+# characters which would have a meaning in Mako template text
+_mako_special = re.compile(r'[$%<#\\\n]')
+
+
+def translating_preprocessor(trans):
+  '''Return a Mako preprocessor translating static strings with `trans`'''
+  def translate(match):
+    return trans.ugettext(ast.literal_eval('u' + match.group(1)))
+
+  def expression(match):
+    text = translate(match)
+    if _mako_special.search(text):
+      return '${' + repr(text) + '}'
+
+    return text
+
+  def code(match):
+    return _gettext_call.sub(lambda m: repr(translate(m)), match.group(0))
+
+  def preprocess(source):
+    source = _gettext_expr.sub(expression, source)
+    return _mako_code.sub(code, source)
+
+  return preprocess
+
+
+def catalog_version(trans):
+  '''Digest of the name, modification time and size of the catalog
+  files trans (and its fallbacks) was loaded from'''
+  files = []
+  while trans is not None:
+    for path in getattr(trans, 'files', []):
+      st = os.stat(path)
+      files.append((os.path.abspath(path), st.st_mtime, st.st_size))
+
+    trans = getattr(trans, '_fallback', None)
+
+  return hashlib.sha1(repr(files)).hexdigest()[:12]
+
+
+def create_lookup(lang=None):
+  templateRoot = os.path.join(Config.basePath, Config.get('mako', 'templateroot'))
+  collectionSize = Config.get_int('mako', 'collectionsize', -1)
+  outputEncoding = Config.get('mako', 'outputencoding')
+  debug = Config.get_boolean('mematool', 'debug', 'false')
+  moduleDirectory = Config.basePath + '/tmp'
+  preprocessor = None
+
+  if lang is not None:
+    # a new catalog gets new modules, with its translations
+    moduleDirectory = os.path.join(moduleDirectory, '{0}-{1}'.format(lang.locale, catalog_version(lang.trans)))
+    preprocessor = translating_preprocessor(lang.trans)
+
+  return TemplateLookup(directories=[templateRoot],
+                        module_directory=moduleDirectory,
+                        output_encoding=outputEncoding,
+                        encoding_errors='replace',
+                        collection_size=collectionSize,
+                        filesystem_checks=debug,
+                        preprocessor=preprocessor,
+                        imports=['from mematool.helpers.i18ntool import ugettext as _',
+                                 'from mematool.helpers.assets import asset_url, asset_bundle'])
+
+
+def bake_translations():
+  global _bake_translations
+
+  if _bake_translations is None:
+    _bake_translations = Config.get_boolean('mako', 'bake_translations', 'false')
+
+  return _bake_translations
+
+
+def get_lookup(lang=None):
+  '''Return the TemplateLookup to render in language `lang` (an i18ntool
+  Lang, e.g. cherrypy.response.i18n) with'''
+  global _lookup
+
+  if lang is not None and bake_translations():
+    name = str(lang.locale)
+    lookup = _translated.get(name)
+
+    if lookup is None:
+      with _lookup_lock:
+        lookup = _translated.get(name)
+        if lookup is None:
+          lookup = _translated[name] = create_lookup(lang)
+
+    return lookup
+
+  if _lookup is None:
+    with _lookup_lock:
+      if _lookup is None:
+        _lookup = create_lookup()
+
+  return _lookup
+
+
+def template_uris(lookup):
+  '''Yield the URI of every template found below the lookup directories'''
+  for directory in lookup.directories:
+    for root, dirs, files in os.walk(directory):
+      for f in sorted(files):
+        if f.endswith('.mako'):
+          path = os.path.relpath(os.path.join(root, f), directory)
+          yield '/' + path.replace(os.sep, '/')
+
+
+def precompile(lookup=None):
+  '''Compile all templates, so no request has to pay for it.
+
+  Compiled modules are written to the module directory as well, which
+  makes running this at deploy time speed up the next process start.
+  '''
+  if lookup is None:
+    lookup = get_lookup()
+
+  count = 0
+  for uri in template_uris(lookup):
+    lookup.get_template(uri)
+    count += 1
+
+  log.info('{0} templates compiled'.format(count))
+
+  return count
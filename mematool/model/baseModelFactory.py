@@ -38,13 +38,25 @@ class BaseModelFactory(object):
 
   def getUsers(self, clear_credentials=False):
     '''Return a list of all user objects'''
-    ul = self.getUserList()
-    users = []
+    return list(self.iterUsers(clear_credentials))
 
-    for v in ul:
-      users.append(self.getUser(v))
+  def iterUsers(self, clear_credentials=False, uids=None):
+    '''Return an iterator over the user objects, loading each one only when
+    it is asked for. The list of users is read by the call, so errors
+    reading it are raised here and not while iterating, e.g. while a
+    page is already being streamed.'''
+    if uids is None:
+      uids = self.getUserList()
 
-    return users
+    return self._iterUsers(uids, clear_credentials)
+
+  def _iterUsers(self, uids, clear_credentials):
+    for v in uids:
+      try:
+        yield self.getUser(v, clear_credentials)
+      except LookupError:
+        # deleted since the list was read
+        log.warning('User {0} vanished while listing users'.format(v))
 
   def getUserGroupList(self, uid):
     pass
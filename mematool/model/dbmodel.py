@@ -17,7 +17,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
 
-from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, Unicode
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, Unicode, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 
 
@@ -92,3 +92,15 @@ class TmpMember(Base):
 
   def __str__(self):
     return "<TmpMember('id=%d, gn=%s', sn=%s, homePostalAddress=%s, phone=%s, mobile=%s, mail=%s, xmppID=%s)>" % (self.id, self.gn, self.sn, self.homePostalAddress, self.phone, self.mobile, self.mail, self.xmppID)
+
+
+class SessionData(Base):
+  '''Table containing web sessions shared between worker processes'''
+  __tablename__ = 'session'
+
+  id = Column(String(64), primary_key=True)
+  data = Column(LargeBinary)
+  expiration_time = Column(DateTime, nullable=False, index=True)
+
+  def __repr__(self):
+    return "<SessionData('id=%s, expiration_time=%s')>" % (self.id, self.expiration_time)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Request-scoped identity map of directory entries
+
+While tools.identitymap is on, the model factory loads every entry at
+most once per request, and returns the same object when it is asked for
+it again (see cached()). Any write through the factory empties the map,
+so a request never sees an entry as it was before its own changes.
+
+The map is dropped when the handler returns: the rows of a streamed page
+are produced later, and are loaded one at a time as before instead of all
+being kept until the end of the response.
+'''
+
+import cherrypy
+
+
+def _entries():
+  return getattr(cherrypy.serving.request, '_mematool_entries', None)
+
+
+def cached(key, load):
+  '''The object stored under key, load()ed on the first lookup; outside
+  of a request with the tool on, load() is always called'''
+  entries = _entries()
+  if entries is None:
+    return load()
+
+  try:
+    return entries[key]
+  except KeyError:
+    value = entries[key] = load()
+    return value
+
+
+def clear():
+  '''Forget all entries of the current request'''
+  entries = _entries()
+  if entries is not None:
+    entries.clear()
+
+
+class IdentityMapTool(cherrypy.Tool):
+  def __init__(self):
+    cherrypy.Tool.__init__(self, 'on_start_resource', self.start)
+
+  def _setup(self):
+    cherrypy.Tool._setup(self)
+    cherrypy.serving.request.hooks.attach('on_end_resource', self.end)
+
+  def start(self):
+    cherrypy.serving.request._mematool_entries = {}
+
+  def end(self):
+    cherrypy.serving.request._mematool_entries = None
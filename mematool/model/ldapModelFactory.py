@@ -18,6 +18,7 @@
 # along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
 
 import logging
+import base64
 
 import ldap
 from mematool.model.baseModelFactory import BaseModelFactory
@@ -25,6 +26,11 @@ from mematool.model.dbmodel import Group
 from mematool.model.ldapmodel import Member, Domain, Alias
 from mematool import Config
 from mematool.helpers.exceptions import EntryExists
+from mematool.helpers.pagecache import bump_generation
+from mematool.helpers import blobstore
+from mematool.helpers import metrics
+from mematool.model import identitymap
+from mematool.model import maildropindex
 
 
 log = logging.getLogger(__name__)
@@ -39,6 +45,29 @@ class LdapModelFactory(BaseModelFactory):
     '''Close LDAP connection'''
     self.ldapcon = None
 
+  def _modify(self, dn, mod_attrs):
+    '''All LDAP writes go through _modify, _add and _delete, so cached
+    pages and the entries loaded by the request can be invalidated'''
+    try:
+      return self.ldapcon.modify_s(dn, mod_attrs)
+    finally:
+      identitymap.clear()
+      bump_generation()
+
+  def _add(self, dn, mod_attrs):
+    try:
+      return self.ldapcon.add_s(dn, mod_attrs)
+    finally:
+      identitymap.clear()
+      bump_generation()
+
+  def _delete(self, dn):
+    try:
+      return self.ldapcon.delete_s(dn)
+    finally:
+      identitymap.clear()
+      bump_generation()
+
   def getUser(self, uid, clear_credentials=False):
     '''
     Return a Member object populated with it's attributes loaded from LDAP
@@ -47,6 +76,11 @@ class LdapModelFactory(BaseModelFactory):
     :type uid: string
     :returns: Member
     '''
+    basedn = 'uid=' + str(uid) + ',' + str(Config.get('ldap', 'basedn_users'))
+
+    return identitymap.cached((basedn, clear_credentials), lambda: self._loadUser(uid, clear_credentials))
+
+  def _loadUser(self, uid, clear_credentials):
     filter_ = '(uid=' + uid + ')'
     attrs = ['*']
     basedn = 'uid=' + str(uid) + ',' + str(Config.get('ldap', 'basedn_users'))
@@ -78,6 +112,7 @@ class LdapModelFactory(BaseModelFactory):
       m.userPassword = '******'
 
     m.groups = self.getUserGroupList(uid)
+    m.mark_loaded()
 
     return m
 
@@ -101,15 +136,19 @@ class LdapModelFactory(BaseModelFactory):
   def getActiveMemberList(self):
     '''Get a list of members not belonging to the locked-members group'''
     users = []
+    locked = set(self.getGroupMembers(Config.get('mematool', 'group_lockedmember')))
 
     for u in self.getUserList():
-      if not self.isUserInGroup(u, Config.get('mematool', 'group_lockedmember')):
+      if not u in locked:
         users.append(u)
 
     return users
 
   def getUserGroupList(self, uid):
     '''Get a list of groups a user is a member of'''
+    return list(identitymap.cached(('memberUid', uid), lambda: self._loadUserGroupList(uid)))
+
+  def _loadUserGroupList(self, uid):
     filter = '(memberUid=' + uid + ')'
     attrs = ['cn']
     groups = []
@@ -193,36 +232,60 @@ class LdapModelFactory(BaseModelFactory):
 
     return retVal
 
-  def _updateMember(self, member, is_admin=True):
+  def getModifications(self, member, attributes):
+    '''Build the modlist writing those of the attributes of member (or
+    any BaseObject) which were modified since it was loaded'''
     mod_attrs = []
-    om = self.getUser(member.uid)
 
+    for k in member.modified(attributes):
+      a = getattr(member, k)
+      old = member.original(k)
+
+      if isinstance(a, bool):
+        # absent and FALSE are both loaded as False
+        mod_attrs.append((ldap.MOD_REPLACE, k, str(a).upper()))
+      elif a:
+        if not k in member._bin_fields:
+          a = str(a.encode('utf-8', 'ignore'))
+
+        if old:
+          mod_attrs.append((ldap.MOD_REPLACE, k, a))
+        else:
+          mod_attrs.append((ldap.MOD_ADD, k, a))
+      elif old:
+        mod_attrs.append((ldap.MOD_DELETE, k, None))
+
+    return mod_attrs
+
+  def _updateMember(self, member, is_admin=True):
+    if not member.loaded:
+      member.mark_loaded(self.getUser(member.uid))
+
+    mod_attrs = []
     if is_admin:
-      for k in member.auto_update_vars:
-        mod_attrs.append(self.prepareVolatileAttribute(member, om, k))
+      mod_attrs = self.getModifications(member, member.auto_update_vars)
 
-    if member.userPassword and member.userPassword != '':
-      mod_attrs.append((ldap.MOD_REPLACE, 'userPassword', str(member.userPassword)))
-      if member.sambaNTPassword and member.sambaNTPassword != '':
-        mod_attrs.append((ldap.MOD_REPLACE, 'sambaNTPassword', str(member.sambaNTPassword)))
+    # forms leave the password empty when it isn't changed
+    for k in member.modified(member.credential_vars):
+      if getattr(member, k):
+        mod_attrs.append((ldap.MOD_REPLACE, k, str(getattr(member, k))))
 
-    while None in mod_attrs:
-      mod_attrs.remove(None)
+    result = None
 
-    dn = 'uid={0},{1}'.format(member.uid, Config.get('ldap', 'basedn_users'))
-    result = self.ldapcon.modify_s(dn, mod_attrs)
+    if mod_attrs:
+      dn = 'uid={0},{1}'.format(member.uid, Config.get('ldap', 'basedn_users'))
+      result = self._modify(dn, mod_attrs)
 
-    diff = lambda l1,l2: [x for x in l1 if x not in l2]
-    to_disable_groups = diff(om.groups, member.groups)
-    to_enable_groups = diff(member.groups, om.groups)
-      
-    for g in to_disable_groups:
-      self.changeUserGroup(member.uid, g, False)
-    for g in to_enable_groups:
-      self.changeUserGroup(member.uid, g, True)
+    old_groups = member.original('groups')
 
-    print om.groups
-    print member.groups
+    for g in old_groups:
+      if not g in member.groups:
+        self._changeGroupMembership(member.uid, g, False)
+    for g in member.groups:
+      if not g in old_groups:
+        self._changeGroupMembership(member.uid, g, True)
+
+    member.mark_loaded()
 
     return result
 
@@ -248,7 +311,7 @@ class LdapModelFactory(BaseModelFactory):
 
     dn = 'uid=' + member.uid + ',' + Config.get('ldap', 'basedn_users')
     dn = dn.encode('ascii', 'ignore')
-    result = self.ldapcon.add_s(dn, mod_attrs)
+    result = self._add(dn, mod_attrs)
 
     self.changeUserGroup(member.uid, Config.get('mematool', 'group_fullmember'), member.fullMember)
     self.changeUserGroup(member.uid, Config.get('mematool', 'group_lockedmember'), member.lockedMember)
@@ -269,7 +332,7 @@ class LdapModelFactory(BaseModelFactory):
     groups = self.getUserGroupList(uid)
     for k in groups:
       #print 'removing from group {0}'.format(k)
-      self.changeUserGroup(uid, k, False)
+      self._changeGroupMembership(uid, k, False)
 
     # try to auto-delete aliases
     aliases = self.getMaildropList(uid)
@@ -281,46 +344,85 @@ class LdapModelFactory(BaseModelFactory):
         print 'can\'t remove user {0} from alias {1}'.format(uid, dn)
 
     # finally, remove the user
-    result = self.ldapcon.delete_s(basedn)
+    result = self._delete(basedn)
 
   def changeUserGroup(self, uid, group, status):
     '''Change user/group membership'''
     '''@TODO check and fwd return value'''
-    mod_attrs = []
-    result = ''
-    m = self.getUser(uid)
+    groups = self.getUserGroupList(uid)
+
+    if status and not group in groups or not status and group in groups:
+      return self._changeGroupMembership(uid, group, status)
 
-    if status and not group in m.groups:
+    return ''
+
+  def _changeGroupMembership(self, uid, group, status):
+    '''Add uid to or remove it from group, without checking first'''
+    if status:
       mod_attrs = [(ldap.MOD_ADD, 'memberUid', uid.encode('ascii', 'ignore'))]
-    elif not status and group in m.groups:
+    else:
       mod_attrs = [(ldap.MOD_DELETE, 'memberUid', uid.encode('ascii', 'ignore'))]
 
-    if len(mod_attrs) == 1:
-      try:
-        result = self.ldapcon.modify_s('cn=' + group.encode('ascii', 'ignore') + ',' + Config.get('ldap', 'basedn_groups'), mod_attrs)
-      except (ldap.TYPE_OR_VALUE_EXISTS, ldap.NO_SUCH_ATTRIBUTE):
-        pass
-      except Exception as e:
-        # @todo: implement better handling
-        print e
-        pass
+    try:
+      return self._modify('cn=' + group.encode('ascii', 'ignore') + ',' + Config.get('ldap', 'basedn_groups'), mod_attrs)
+    except (ldap.TYPE_OR_VALUE_EXISTS, ldap.NO_SUCH_ATTRIBUTE):
+      pass
+    except Exception as e:
+      # @todo: implement better handling
+      print e
+      pass
 
-    return result
+    return ''
 
   def updateAvatar(self, member, b64_jpg):
-    mod_attrs = []
-    om = self.getUser(member.uid)
+    if not member.loaded:
+      member.mark_loaded(self.getUser(member.uid))
 
     member.jpegPhoto = b64_jpg
-    mod_attrs.append(self.prepareVolatileAttribute(member, om, 'jpegPhoto', encoding=None))
+    mod_attrs = self.getModifications(member, ('jpegPhoto',))
+    result = None
 
-    while None in mod_attrs:
-      mod_attrs.remove(None)
+    if mod_attrs:
+      result = self._modify('uid=' + member.uid + ',' + Config.get('ldap', 'basedn_users'), mod_attrs)
 
-    result = self.ldapcon.modify_s('uid=' + member.uid + ',' + Config.get('ldap', 'basedn_users'), mod_attrs)
+    member.mark_loaded()
 
     return result
 
+  def migratePhotos(self, store, render=None):
+    '''Move photos still stored in LDAP to the blob store and replace them
+    by a reference. Entries are fetched one at a time, so all photos never
+    have to be held in memory. render(data, key), if given, is called for
+    every moved photo. Returns the number of migrated entries.'''
+    basedn = Config.get('ldap', 'basedn_users')
+    msgid = self.ldapcon.search(basedn, ldap.SCOPE_SUBTREE, '(jpegPhoto=*)', ['uid', 'jpegPhoto'])
+    count = 0
+
+    while True:
+      rtype, rdata = self.ldapcon.result(msgid, all=0)
+      if rtype == ldap.RES_SEARCH_RESULT or not rdata:
+        break
+
+      for dn, attributes in rdata:
+        value = attributes.get('jpegPhoto', [None])[0]
+        if not value or blobstore.parse_ref(value) is not None:
+          continue
+
+        try:
+          data = base64.b64decode(value)
+        except TypeError:
+          log.warning('Invalid photo in ' + dn)
+          continue
+
+        key = store.put(data)
+        if render is not None:
+          render(data, key)
+
+        self._modify(dn, [(ldap.MOD_REPLACE, 'jpegPhoto', blobstore.make_ref(key))])
+        count += 1
+
+    return count
+
   def getGroup(self, gid):
     ''' Get a specific group'''
     filter = '(cn=' + gid + ')'
@@ -403,7 +505,7 @@ class LdapModelFactory(BaseModelFactory):
 
         dn = 'cn=' + gid + ',' + Config.get('ldap', 'basedn_groups')
         dn = dn.encode('ascii', 'ignore')
-        result = self.ldapcon.add_s(dn, mod_attrs)
+        result = self._add(dn, mod_attrs)
 
         if result is None:
           return False
@@ -416,7 +518,7 @@ class LdapModelFactory(BaseModelFactory):
     '''Completely remove a group'''
     dn = 'cn=' + gid + ',' + Config.get('ldap', 'basedn_groups')
     dn = dn.encode('ascii', 'ignore')
-    retVal = self.ldapcon.delete_s(dn)
+    retVal = self._delete(dn)
 
     if not retVal is None and super(LdapModelFactory, self).deleteGroup(gid):
       return True
@@ -456,7 +558,7 @@ class LdapModelFactory(BaseModelFactory):
 
       dn = 'dc=' + domain + ',' + Config.get('ldap', 'basedn')
       dn = dn.encode('ascii', 'ignore')
-      result = self.ldapcon.add_s(dn, mod_attrs)
+      result = self._add(dn, mod_attrs)
 
       if result is None:
         return False
@@ -472,7 +574,7 @@ class LdapModelFactory(BaseModelFactory):
     if domain in dl:
       dn = 'dc=' + domain + ',' + Config.get('ldap', 'basedn')
       dn = dn.encode('ascii', 'ignore')
-      retVal = self.ldapcon.delete_s(dn)
+      retVal = self._delete(dn)
 
       if not retVal is None:
         return True
@@ -502,7 +604,7 @@ class LdapModelFactory(BaseModelFactory):
         # @TODO handle multiple results
         v = v[0]
 
-        setattr(d, k, v)
+        d.set_property(k, v)
 
     return d
 
@@ -558,7 +660,7 @@ class LdapModelFactory(BaseModelFactory):
           # @TODO handle multiple results
           v = v[0]
 
-          setattr(a, k, v)
+          a.set_property(k, v)
 
     return a
 
@@ -578,26 +680,57 @@ class LdapModelFactory(BaseModelFactory):
 
     return aliases
 
-  def getMaildropList(self, uid):
-    '''This returns all aliases which have as maildrop the specified uid'''
-    filter_ = '(&(objectClass=mailAlias)(maildrop={0}))'.format(uid)
+  def _buildMaildropIndex(self):
+    filter_ = '(objectClass=mailAlias)'
     attrs = ['maildrop']
     basedn = str(Config.get('ldap', 'basedn'))
     result = self.ldapcon.search_s(basedn, ldap.SCOPE_SUBTREE, filter_, attrs)
 
-    aliases = {}
-
-    if not result:
-      return aliases
-
+    index = maildropindex.MaildropIndex()
     for dn, attr in result:
-      if not dn in aliases:
-        aliases[dn] = []
+      index.set(dn, attr.get('maildrop', []))
 
-      for a in attr['maildrop']:
-        aliases[dn].append(a)
+    return index
 
-    return aliases
+  def getMaildropIndex(self):
+    return maildropindex.load(self._buildMaildropIndex)
+
+  def getMaildropList(self, uid):
+    '''This returns all aliases which have as maildrop the specified uid'''
+    return self.getMaildropIndex().maildrops(uid)
+
+  def getMailRoutes(self, member):
+    '''The addresses of the aliases delivering to member, by its uid or
+    its mail address'''
+    targets = [member.uid]
+    if member.mail:
+      targets.append(member.mail)
+
+    return self.getMaildropIndex().routes(*targets)
+
+  def iterVirtualAliases(self):
+    '''Yield (domain, None) for every mail domain and (address,
+    maildrops) for every address of an alias, in the order the directory
+    returns them; entries are fetched one at a time'''
+    filter_ = '(|{0}(objectClass=mailAlias))'.format(Config.get('ldap', 'domain_filter'))
+    attrs = ['objectClass', 'dc', 'mail', 'maildrop']
+    basedn = str(Config.get('ldap', 'basedn'))
+    msgid = self.ldapcon.search(basedn, ldap.SCOPE_SUBTREE, filter_, attrs)
+
+    while True:
+      rtype, rdata = self.ldapcon.result(msgid, all=0)
+      if rtype == ldap.RES_SEARCH_RESULT or not rdata:
+        break
+
+      for dn, attributes in rdata:
+        if 'mailAlias' in attributes.get('objectClass', []):
+          maildrop = attributes.get('maildrop', [])
+          if maildrop:
+            for m in attributes.get('mail', []):
+              yield m, maildrop
+        else:
+          for d in attributes.get('dc', []):
+            yield d, None
 
   def addAlias(self, alias):
     try:
@@ -629,10 +762,12 @@ class LdapModelFactory(BaseModelFactory):
       dn = dn.encode('ascii', 'ignore')
 
       try:
-        result = self.ldapcon.add_s(dn, mod_attrs)
+        result = self._add(dn, mod_attrs)
       except ldap.ALREADY_EXISTS:
         raise EntryExists('Alias already exists!')
 
+      maildropindex.update(lambda index: index.set(dn, maildrop))
+
       if result is None:
         return False
 
@@ -706,7 +841,12 @@ class LdapModelFactory(BaseModelFactory):
 
     dn = alias.getDN(Config.get('ldap', 'basedn')).encode('ascii', 'ignore')
 
-    result = self.ldapcon.modify_s(dn, mod_attrs)
+    result = self._modify(dn, mod_attrs)
+
+    # values equal to the alias' address are left alone above
+    maildrop = [m for m in alias.maildrop if not m == alias.dn_mail]
+    maildrop += [m for m in oldalias.maildrop if m == oldalias.dn_mail]
+    maildropindex.update(lambda index: index.set(dn, maildrop))
 
     if result is None:
       return False
@@ -717,7 +857,8 @@ class LdapModelFactory(BaseModelFactory):
     mod_attrs = []
     mod_attrs.append((ldap.MOD_DELETE, 'maildrop', uid.encode('ascii', 'ignore')))
 
-    result = self.ldapcon.modify_s(alias, mod_attrs)
+    result = self._modify(alias, mod_attrs)
+    maildropindex.update(lambda index: index.remove_maildrop(alias, uid))
 
     if result is None:
       return False
@@ -729,9 +870,13 @@ class LdapModelFactory(BaseModelFactory):
 
     a = self.getAlias(alias)
     dn = a.getDN(Config.get('ldap', 'basedn')).encode('ascii', 'ignore')
-    retVal = self.ldapcon.delete_s(dn)
+    retVal = self._delete(dn)
+    maildropindex.update(lambda index: index.remove(dn))
 
     if not retVal is None:
       return True
 
     return False
+
+
+metrics.instrument(LdapModelFactory)
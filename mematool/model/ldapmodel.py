@@ -25,44 +25,114 @@ import base64
 from binascii import b2a_base64
 from mematool import Config
 from mematool.helpers import regex
-from mematool.helpers.lechecker import ParamChecker, InvalidParameterFormat
+from mematool.helpers import lechecker
+from mematool.helpers import blobstore
+from mematool.helpers.lechecker import Field, Schema, N_
 from mematool.model.dbmodel import TmpMember
-from mematool.helpers.i18ntool import ugettext as _
+
+
+# values shared between objects instead of being copied into each of them
+MAX_INTERNED = 10000
+_interned = {}
+
+
+def intern_value(value):
+  if len(_interned) >= MAX_INTERNED:
+    return _interned.get(value, value)
+
+  return _interned.setdefault(value, value)
+
+
+class ObjectType(type):
+  '''Computes the field metadata of a BaseObject class once, when the
+  class is created, and gives it __slots__ for its fields'''
+  def __new__(mcs, name, bases, attrs):
+    def declared(key):
+      if key in attrs:
+        return list(attrs[key])
+
+      return list(getattr(bases[0], key, []))
+
+    str_vars = declared('str_vars')
+    list_vars = declared('list_vars')
+    bool_vars = declared('bool_vars')
+    bin_vars = declared('bin_vars')
+    no_auto_update = set(declared('no_auto_update_vars'))
+
+    attrs['all_vars'] = tuple(str_vars + list_vars + bool_vars + bin_vars)
+    attrs['auto_update_vars'] = tuple(v for v in str_vars + bool_vars + bin_vars if not v in no_auto_update)
+
+    attrs['_fields'] = frozenset(attrs['all_vars'])
+    # position of each field in the snapshot taken by mark_loaded()
+    attrs['_var_index'] = dict((v, i) for i, v in enumerate(attrs['all_vars']))
+    attrs['_list_fields'] = frozenset(list_vars)
+    attrs['_bool_fields'] = frozenset(bool_vars)
+    attrs['_bin_fields'] = frozenset(bin_vars)
+    attrs['_interned_fields'] = frozenset(declared('interned_vars'))
+
+    # fields implemented by properties have no slot of their own
+    inherited = getattr(bases[0], '_slots', ())
+    slots = list(attrs.get('__slots__', ()))
+    for v in attrs['all_vars'] + tuple(declared('view_vars')):
+      if not v in attrs and not v in inherited and not v in slots:
+        slots.append(v)
+
+    attrs['__slots__'] = tuple(slots)
+    attrs['_slots'] = tuple(inherited) + tuple(slots)
+
+    # what __init__ sets: the immutable defaults, then a list per list field
+    initial = [(v, '') for v in str_vars] + [(v, False) for v in bool_vars] + [(v, None) for v in bin_vars]
+    attrs['_initial'] = tuple((k, v) for k, v in initial if k in attrs['_slots'])
+    attrs['_initial_lists'] = tuple(v for v in list_vars if v in attrs['_slots'])
+
+    return type.__new__(mcs, name, bases, attrs)
 
 
 class BaseObject(object):
+  '''An entry of the directory.
+
+  The field lists are class attributes; for subclasses, ObjectType turns
+  them into __slots__ and lookup tables, so instances have no __dict__.
+  Attributes other than the fields and the view_vars (values set by
+  controllers for templates) can't be set.
+
+  Objects loaded from the directory remember the values they were loaded
+  with (see mark_loaded()), so that saving them only writes the fields
+  which were changed since.'''
+  __metaclass__ = ObjectType
+  __slots__ = ('_original',)
+
   str_vars = []
   list_vars = []
   bool_vars = []
   bin_vars = []
   no_auto_update_vars = []
+  # fields with few distinct values, see intern_value()
+  interned_vars = []
+  view_vars = []
 
   def __init__(self):
-    self.auto_update_vars = []
+    self._original = None
 
-    for v in self.str_vars:
-      setattr(self, v, '')
-      if not v in self.no_auto_update_vars:
-        self.auto_update_vars.append(v)
+    for k, v in self._initial:
+      setattr(self, k, v)
 
-    for v in self.list_vars:
-      setattr(self, v, [])
+    for k in self._initial_lists:
+      setattr(self, k, [])
 
-    for v in self.bool_vars:
-      setattr(self, v, False)
-      if not v in self.no_auto_update_vars:
-        self.auto_update_vars.append(v)
+  def __getstate__(self):
+    state = {}
+    for name in self._slots:
+      try:
+        state[name] = object.__getattribute__(self, name)
+      except AttributeError:
+        pass
 
-    for v in self.bin_vars:
-      setattr(self, v, None)
-      if not v in self.no_auto_update_vars:
-        self.auto_update_vars.append(v)
+    return state
 
-    self.all_vars = []
-    self.all_vars.extend(self.str_vars)
-    self.all_vars.extend(self.list_vars)
-    self.all_vars.extend(self.bool_vars)
-    self.all_vars.extend(self.bin_vars)
+  def __setstate__(self, state):
+    for k, v in state.items():
+      setattr(self, k, v)
 
   def __eq__(self, om):
     equal = True
@@ -80,22 +150,85 @@ class BaseObject(object):
   def __ne__(self, om):
     return not self == om
 
+  def _value(self, key):
+    value = getattr(self, key)
+    if key in self._list_fields:
+      return tuple(value)
+
+    return value
+
+  def mark_loaded(self, other=None):
+    '''Remember the current values, or those of other, as the ones
+    stored in the directory'''
+    if other is None:
+      other = self
+
+    # a tuple in all_vars order: a dict per loaded object would cost
+    # ten times the object itself
+    self._original = tuple(other._value(k) for k in self.all_vars)
+
+  @property
+  def loaded(self):
+    return self._original is not None
+
+  def original(self, key):
+    '''The value of key as loaded from the directory (a tuple for lists)'''
+    return self._original[self._var_index[key]]
+
+  def modified(self, keys=None):
+    '''The fields among keys (default: all) changed since mark_loaded();
+    assigning a field its current value doesn't change it'''
+    if keys is None:
+      keys = self.all_vars
+
+    original = self._original
+    index = self._var_index
+    return [k for k in keys if not self._value(k) == original[index[k]]]
+
   def set_property(self, key, value):
-    if key in self.bool_vars:
+    '''Set a field from its value in the directory; attributes which
+    aren't fields are ignored'''
+    if not key in self._fields:
+      return
+
+    if key in self._bool_fields:
       if value.lower() == 'true':
         setattr(self, key, True)
       else:
         setattr(self, key, False)
-    elif key in self.bin_vars:
+    elif key in self._bin_fields:
       setattr(self, key, value)
     elif not value is None and not isinstance(value, unicode):
       value_ = unicode(str(value), 'utf-8')
+      if key in self._interned_fields:
+        value_ = intern_value(value_)
       setattr(self, key, value_)
     else:
       setattr(self, key, value)
 
 
-class Member(BaseObject):
+class Roles(object):
+  '''Access checks of an object with a uid and groups, against the
+  current configuration (it may be reloaded at any time)'''
+  __slots__ = ()
+
+  def is_in_group(self, group):
+    if group in self.groups:
+      return True
+
+    return False
+
+  def is_admin(self):
+    if self.uid in Config.get_set('mematool', 'admin_user'):
+      return True
+
+    return not Config.get_set('mematool', 'admin_group').isdisjoint(self.groups)
+
+  def is_finance_admin(self):
+    return self.uid in Config.get_set('mematool', 'admin_finance')
+
+
+class Member(BaseObject, Roles):
   # ldap
   str_vars = ['uid',
               'sn',
@@ -131,6 +264,41 @@ class Member(BaseObject):
                          'uidNumber',
                          'uid',
                          'jpegPhoto']
+  # only written when set by setPassword(), never deleted
+  credential_vars = ('userPassword',
+                     'sambaNTPassword')
+  interned_vars = ['gidNumber',
+                   'loginShell',
+                   'arrivalDate',
+                   'leavingDate',
+                   'conventionSigner']
+  # set by the controllers showing lists of members
+  view_vars = ['paymentGood',
+               'avatarUrl']
+  # behind the nationality property
+  __slots__ = ('_nationality',)
+
+  schema = Schema([
+    ('uid', lechecker.USERNAME),
+    ('sn', Field(N_('Invalid surname'), max_len=20)),
+    ('givenName', Field(N_('Invalid given name'), max_len=20)),
+    ('homePostalAddress', Field(N_('Invalid address'), max_len=255)),
+    ('isMinor', lechecker.BOOL.replace(error=N_('Invalid selection for "is minor"'), optional=True)),
+    ('homePhone', lechecker.PHONE.replace(optional=True)),
+    ('mobile', lechecker.PHONE.replace(error=N_('Invalid mobile number'), optional=True)),
+    ('mail', lechecker.EMAIL),
+    ('loginShell', Field(N_('Invalid login shell'), max_len=20, regex=regex.loginShell)),
+    ('arrivalDate', lechecker.DATE.replace(error=N_('Invalid "member since" date'))),
+    ('leavingDate', lechecker.DATE.replace(error=N_('Invalid "membership canceled" date'), optional=True)),
+    ('sshPublicKey', Field(N_('Invalid SSH key'), max_len=1200, regex=regex.sshKey, optional=True)),
+    ('pgpKey', lechecker.PGP.replace(optional=True)),
+    ('iButtonUID', lechecker.IBUTTON_UID.replace(optional=True)),
+    ('conventionSigner', lechecker.USERNAME.replace(error=N_('Invalid convention signer'))),
+    ('xmppID', lechecker.EMAIL.replace(error=N_('Invalid XMPP/Jabber/GTalk ID'), optional=True)),
+    ('spaceKey', lechecker.BOOL.replace(error=N_('Invalid Space-Key value'), optional=True)),
+    ('npoMember', lechecker.BOOL.replace(error=N_('Invalid NPO-Member value'), optional=True)),
+    ('nationality', lechecker.COUNTRY_CODE.replace(error=N_('Invalid nationality'))),
+  ])
 
   '''
   uid = ''   # uid
@@ -163,6 +331,7 @@ class Member(BaseObject):
 
   def __init__(self):
     super(Member, self).__init__()
+    self._nationality = ''
 
   def __repr__(self):
     return "<Member('uidNumber=%s, uid=%s, validate=%s')>" % (self.uidNumber, self.uid, self.validate)
@@ -229,30 +398,6 @@ class Member(BaseObject):
   def lockedMember(self):
     return self.is_in_group(Config.get('mematool', 'group_lockedmember'))
 
-  def is_in_group(self, group):
-    if group in self.groups:
-      return True
-
-    return False
-
-  def is_admin(self):
-    for g in Config.get('mematool', 'admin_group'):
-      if self.is_in_group(g):
-        return True
-
-    for u in Config.get('mematool', 'admin_user'):
-      if self.uid == u:
-        return True
-
-    return False
-
-  def is_finance_admin(self):
-    for u in Config.get('mematool', 'admin_finance'):
-      if self.uid == u:
-        return True
-
-    return False
-
   def setPassword(self, password):
     salt = os.urandom(4)
     h = hashlib.sha1(password)
@@ -268,137 +413,7 @@ class Member(BaseObject):
   ####################
   # checker interface
   def check(self):
-    errors = []
-    checkOK = True
-
-    try:
-      ParamChecker.checkUsername(self.uid, param=False)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(_('Invalid username'))
-
-    try:
-      ParamChecker.checkString(self.sn, min_len=0, max_len=20, param=False)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(_('Invalid surname'))
-
-    try:
-      ParamChecker.checkString(self.givenName, min_len=0, max_len=20, param=False)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(_('Invalid given name'))
-
-    try:
-      ParamChecker.checkString(self.homePostalAddress, min_len=0, max_len=255, param=False)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(_('Invalid address'))
-
-    '''optional'''
-    try:
-      ParamChecker.checkBool(self.isMinor, param=False, optional=True)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(_('Invalid selection for "is minor"'))
-
-    '''optional'''
-    try:
-      ParamChecker.checkPhone(self.homePhone, param=False, optional=True)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(ipf.message)
-
-    '''optional'''
-    try:
-      ParamChecker.checkPhone(self.mobile, param=False, optional=True)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(_('Invalid mobile number'))
-
-    try:
-      ParamChecker.checkEmail(self.mail, param=False)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(ipf.message)
-
-    try:
-      ParamChecker.checkString(self.loginShell, min_len=0, max_len=20, regex=regex.loginShell, param=False)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(_('Invalid login shell'))
-
-    try:
-      ParamChecker.checkDate(self.arrivalDate, param=False)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(_('Invalid "member since" date'))
-
-    '''optional'''
-    try:
-      ParamChecker.checkDate(self.leavingDate, param=False, optional=True)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(_('Invalid "membership canceled" date'))
-
-    '''optional'''
-    try:
-      ParamChecker.checkString(self.sshPublicKey, min_len=0, max_len=1200, regex=regex.sshKey, param=False, optional=True)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(_('Invalid SSH key'))
-
-    '''optional'''
-    try:
-      ParamChecker.checkPGP(self.pgpKey, param=False, optional=True)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(ipf.message)
-
-    '''optional'''
-    try:
-      ParamChecker.checkiButtonUID(self.iButtonUID, param=False, optional=True)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(ipf.message)
-
-    try:
-      ParamChecker.checkUsername(self.conventionSigner, param=False)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(_('Invalid convention signer'))
-
-    '''optional'''
-    try:
-      ParamChecker.checkEmail(self.xmppID, param=False, optional=True)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(_('Invalid XMPP/Jabber/GTalk ID'))
-
-    '''optional'''
-    try:
-      ParamChecker.checkBool(self.spaceKey, param=False, optional=True)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(_('Invalid Space-Key value'))
-
-    '''optional'''
-    try:
-      ParamChecker.checkBool(self.npoMember, param=False, optional=True)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(_('Invalid NPO-Member value'))
-
-    try:
-      ParamChecker.checkCountryCode(self.nationality, param=False)
-    except InvalidParameterFormat as ipf:
-      checkOK = False
-      errors.append(_('Invalid nationality'))
-
-    if checkOK:
-      return checkOK
-
-    raise InvalidParameterFormat(errors)
+    return self.schema.check(self.schema.attributes(self))
   ####################
 
   def getGravatar(self, size=20):
@@ -413,9 +428,26 @@ class Member(BaseObject):
 
     return url
 
+  @property
+  def photo_key(self):
+    '''Content hash of the photo, None if there is none'''
+    if self.jpegPhoto is None:
+      return None
+
+    key = blobstore.parse_ref(self.jpegPhoto)
+    if key is None:
+      key = hashlib.sha1(self.avatar).hexdigest()
+
+    return key
+
   @property
   def avatar(self):
+    key = blobstore.parse_ref(self.jpegPhoto)
+    if key is not None:
+      return blobstore.get_photo_store().get(key)
+
     try:
+      # stored in the directory before photos moved to the blob store
       return base64.b64decode(self.jpegPhoto)
     except:
       import sys, traceback
@@ -423,6 +455,31 @@ class Member(BaseObject):
       return None
 
 
+class SessionUser(Roles):
+  '''The part of a Member which is kept in the web session'''
+  __slots__ = ('uid', 'uidNumber', 'groups')
+
+  def __init__(self, member):
+    self.uid = member.uid
+    self.uidNumber = member.uidNumber
+    self.groups = list(member.groups)
+
+  def __repr__(self):
+    return "<SessionUser('uidNumber=%s, uid=%s')>" % (self.uidNumber, self.uid)
+
+  def __getstate__(self):
+    return dict((k, getattr(self, k)) for k in self.__slots__)
+
+  def __setstate__(self, state):
+    if isinstance(state, tuple):
+      # (None, slots), as pickled by sessions from before __getstate__,
+      # which also had the since removed admin flags
+      state = state[1]
+
+    for k in self.__slots__:
+      setattr(self, k, state[k])
+
+
 class Domain(BaseObject):
   str_vars = ['dc']
 
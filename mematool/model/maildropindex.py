@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2013 Georges Toth <georges _at_ trypill _dot_ org>
+#
+# This file is part of MeMaTool.
+#
+# MeMaTool is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MeMaTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with MeMaTool.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Reverse index of the mail aliases
+
+Finding the aliases delivering to a member takes a search through all of
+the directory. The index maps every maildrop to the aliases having it,
+it is built from a single search for all aliases and kept in the cache
+backend (see mematool.helpers.cache), so that the workers share it.
+
+The model factory updates it after every change of an alias. Two workers
+changing aliases at the same time may still lose one of the updates,
+and aliases may be changed outside of mematool, so the index is built
+again after [mematool] maildrop_index_ttl seconds.
+'''
+
+from mematool import Config
+from mematool.helpers import cache
+
+KEY = cache.make_key('maildrops')
+
+
+def _dn_key(dn):
+  return dn.lower().replace(', ', ',')
+
+
+class MaildropIndex(object):
+  def __init__(self):
+    # dn key -> (dn, maildrops)
+    self.aliases = {}
+    # maildrop (lower case) -> dn keys
+    self.targets = {}
+
+  def set(self, dn, maildrops):
+    '''Record the maildrops of the alias dn, replacing the ones it had'''
+    self.remove(dn)
+
+    key = _dn_key(dn)
+    self.aliases[key] = (dn, list(maildrops))
+    for m in maildrops:
+      self.targets.setdefault(m.lower(), set()).add(key)
+
+  def remove(self, dn):
+    key = _dn_key(dn)
+    entry = self.aliases.pop(key, None)
+    if entry is None:
+      return
+
+    for m in entry[1]:
+      keys = self.targets.get(m.lower())
+      if keys is not None:
+        keys.discard(key)
+        if not keys:
+          del self.targets[m.lower()]
+
+  def remove_maildrop(self, dn, maildrop):
+    entry = self.aliases.get(_dn_key(dn))
+    if entry is not None:
+      self.set(entry[0], [m for m in entry[1] if not m.lower() == maildrop.lower()])
+
+  def maildrops(self, target):
+    '''{alias dn: its maildrops} for the aliases delivering to target'''
+    return dict(self.aliases[k] for k in self.targets.get(target.lower(), ()))
+
+  def routes(self, *targets):
+    '''The addresses of the aliases delivering to any of targets'''
+    addresses = set()
+    for t in targets:
+      for dn in self.maildrops(t):
+        addresses.add(dn.split(',')[0].split('=', 1)[1])
+
+    return sorted(addresses)
+
+
+def store(index):
+  cache.get_cache().set(KEY, index, Config.get_int('mematool', 'maildrop_index_ttl', 600))
+
+
+def load(build):
+  '''The index, build()ing it if it isn't in the cache'''
+  index = cache.get_cache().get(KEY)
+  if index is None:
+    index = build()
+    store(index)
+
+  return index
+
+
+def update(f):
+  '''Apply f to the index, if there is one; it is built with the changes
+  otherwise'''
+  index = cache.get_cache().get(KEY)
+  if index is not None:
+    f(index)
+    store(index)
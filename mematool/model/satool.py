@@ -8,6 +8,30 @@ from sqlalchemy.ext.declarative import declarative_base
 from mematool import Config
 
 
+def get_connection_string():
+  protocol = Config.get('db', 'protocol')
+  connetionString = None
+
+  if protocol == 'sqlite':
+    connetionString = '{prot}:///{basepath}/{db}'.format(prot=protocol,
+                                                db=Config.get('db', 'db'),
+                                                basepath=Config.basePath)
+  else:
+    hostname = Config.get('db', 'host')
+    port = Config.get('db', 'port')
+
+    connetionString = '{prot}://{user}:{password}@{host}:{port}/{db}'.format(
+      prot=protocol,
+      user=Config.get('db', 'username'),
+      password=Config.get('db', 'password'),
+      host=hostname,
+      db=Config.get('db', 'db'),
+      port=port
+    )
+
+  return connetionString
+
+
 class SAEnginePlugin(plugins.SimplePlugin):
     def __init__(self, bus):
         """
@@ -30,28 +54,7 @@ class SAEnginePlugin(plugins.SimplePlugin):
       return self.base
 
     def get_connection_string(self):
-      protocol = Config.get('db', 'protocol')
-      debug = Config.get_boolean('db', 'debug', False)
-      connetionString = None
-
-      if protocol == 'sqlite':
-        connetionString = '{prot}:///{basepath}/{db}'.format(prot=protocol,
-                                                    db=Config.get('db', 'db'),
-                                                    basepath=Config.basePath)
-      else:
-        hostname = Config.get('db', 'host')
-        port = Config.get('db', 'port')
-
-        connetionString = '{prot}://{user}:{password}@{host}:{port}/{db}'.format(
-          prot=protocol,
-          user=Config.get('db', 'username'),
-          password=Config.get('db', 'password'),
-          host=hostname,
-          db=Config.get('db', 'db'),
-          port=port
-        )
-
-      return connetionString
+      return get_connection_string()
 
     def start(self):
         self.sa_engine = create_engine(self.get_connection_string(), echo=False)
@@ -3,11 +3,12 @@
 <head>
   <meta charset="UTF-8">
   <!-- Stylesheets !-->
-  <link href="/css/bootstrap.min.css" rel="stylesheet" media="screen">
-  <link href="/css/mematool_bootstrap_custom.css" rel="stylesheet" media="screen" type="text/css"/>
-  <script type="text/javascript" src="/javascript/jquery.min.js"></script>
-  <script type="text/javascript" src="/javascript/mematool.js"></script>
-  <script type="text/javascript" src="/javascript/bootstrap.min.js"></script>
+% for url in asset_bundle('css/mematool.bundle.css'):
+  <link href="${url}" rel="stylesheet" media="screen" type="text/css"/>
+% endfor
+% for url in asset_bundle('javascript/mematool.bundle.js'):
+  <script type="text/javascript" src="${url}"></script>
+% endfor
   <!-- Website title !-->
   <title>syn2cat MeMaTool</title>
 </head>
@@ -19,7 +20,7 @@
       <div class="col-md-12">
         <!-- Title -->
         <div class="page-header">
-          <h1><img src="/images/logo.png" width="" height="" alt="mematool logo" /></h1>
+          <h1><img src="${asset_url('/images/logo.png')}" width="" height="" alt="mematool logo" /></h1>
 
           <!-- NavBar -->
           <header class="navbar navbar-inverse bs-docs-nav" role="banner">
@@ -50,9 +51,9 @@
                   % endif
                 </ul>
                 <ul class="nav navbar-nav navbar-right">
-                  <li><a href="/setLang?lang=en"><img src="/images/icons/flags/en.png" alt="en"/></a></li>
-                  <li><a href="/setLang?lang=lu"><img src="/images/icons/flags/lu.png" alt="lu"/></a></li>
-                  <li><a href="/setLang?lang=de"><img src="/images/icons/flags/de.png" alt="de"/></a></li>
+                  <li><a href="/setLang?lang=en"><img src="${asset_url('/images/icons/flags/en.png')}" alt="en"/></a></li>
+                  <li><a href="/setLang?lang=lu"><img src="${asset_url('/images/icons/flags/lu.png')}" alt="lu"/></a></li>
+                  <li><a href="/setLang?lang=de"><img src="${asset_url('/images/icons/flags/de.png')}" alt="de"/></a></li>
                 </ul>
               </nav>
             </div>
@@ -132,7 +133,7 @@
 </%def>
 
 <%def name="css()">
-${css_link('/css/main.css', 'screen')}
+${css_link(asset_url('/css/main.css'), 'screen')}
 </%def>
 
 <%def name="heading()"><h1>${hasattr(c, 'heading') and c.heading or 'No Title'}</h1></%def>
@@ -158,7 +159,6 @@ ${css_link('/css/main.css', 'screen')}
 <%
   if session.has_key('flash'):
     del session['flash']
-    session.save()
 %>
 </%def>
 
@@ -177,7 +177,6 @@ ${css_link('/css/main.css', 'screen')}
   % endif
   <%
   del session['errors']
-  session.save()
   %>
 % endif
 </%def>
@@ -190,5 +189,4 @@ ${self.error_messages()}
 <%
 if session.has_key('reqparams'):
   del session['reqparams']
-  session.save()
 %>
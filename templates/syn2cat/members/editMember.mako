@@ -45,6 +45,19 @@ def getFormVar(s, c, var):
       % endif
     </div>
   </div>
+  % if c.mode == 'edit':
+  <div class="control-group">
+    <label class="control-label">${_('Mail routes')}</label>
+    <div class="controls">
+    % for a in c.mail_routes:
+    <a href="/mails/editAlias/?alias=${a}">${a}</a><br>
+    % endfor
+    % if not c.mail_routes:
+    ${_('None')}
+    % endif
+    </div>
+  </div>
+  % endif
   <div class="control-group">
     <label class="control-label">${_('Surname')}</label>
     <div class="controls">
@@ -178,7 +191,7 @@ def getFormVar(s, c, var):
 <input type="hidden" name="mode" value="${c.mode}">
 </form>
 
-<script type="text/javascript" src="/javascript/bootstrap-datepicker.js"></script>
+<script type="text/javascript" src="${asset_url('/javascript/bootstrap-datepicker.js')}"></script>
 <script>
 $('#leavingDate').datepicker({format: "yyyy-mm-dd", autoclose: true});
 $('#arrivalDate').datepicker({format: "yyyy-mm-dd", autoclose: true});
@@ -187,5 +200,4 @@ $('#arrivalDate').datepicker({format: "yyyy-mm-dd", autoclose: true});
 <%
 if 'reqparams' in session:
   del session['reqparams']
-  session.save()
 %>
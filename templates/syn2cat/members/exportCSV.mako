@@ -1,5 +1,4 @@
-% if hasattr(c, 'members') and len(c.members) > 0:
-  % for m in c.members:
+<%def name="row(m, i)">\
 ${m.uid};${m.sn};${m.givenName};${m.mail};${m.pgpKey}
-  % endfor
-% endif
+</%def>\
+${stream_rows()}\
@@ -60,5 +60,5 @@ def getFormVar(s, c, var):
 </table>
 </form>
 
-<script type="text/javascript" src="/javascript/bootstrap-datepicker.js"></script>
+<script type="text/javascript" src="${asset_url('/javascript/bootstrap-datepicker.js')}"></script>
 <script>$('#date').datepicker({format: "yyyy-mm-01", autoclose: true});</script>
@@ -27,16 +27,16 @@
   <%
   p_id = None
   validated = 'no record'
-  status = r'<img src="/images/icons/notok.png">'
+  status = '<img src="%s">' % asset_url('/images/icons/notok.png')
 
   if i in c.payments:
     p = c.payments[i]
 
     p_id = p.id
-    validated = r'<img src="/images/icons/notok.png">' if not p.verified else r'<img src="/images/icons/ok.png">'
+    validated = '<img src="%s">' % asset_url('/images/icons/notok.png') if not p.verified else '<img src="%s">' % asset_url('/images/icons/ok.png')
 
     if p.status == 0:
-      status = r'<img src="/images/icons/ok.png">'
+      status = '<img src="%s">' % asset_url('/images/icons/ok.png')
     elif p.status == 2:
       status = '-'
   %>
@@ -13,23 +13,9 @@
 </p>
 </%def>
 
-<table class="table table-striped"> 
-  <thead>
-    <tr> 
-      <th>#</th>
-      <th>${_('Username')}</th>
-      <th>${_('Surname')}</th>
-      <th>${_('Given name')}</th>
-      <th>${_('E-Mail')}</th>
-      <th>${_('Payment good')}</th>
-      <th>${_('Tools')}</th>
-    </tr>
-    <tbody>
-    <% i = 0 %>
-    % for m in c.members:
+<%def name="row(m, i)">
       <%
         paymentGood = r'<font color="red">' + _('no') + r'</font>' if not m.paymentGood else r'<font color="green">' + _('yes') + r'</font>'
-        i += 1
       %>
     <tr class="table_row">
       <td>${i}</td>
@@ -40,6 +26,20 @@
       <td>${paymentGood}</td>
       <td><a href="/payments/listPayments/?member_id=${m.uid}">${_('payments')}</a></td>
     </tr>
-    % endfor
+</%def>
+
+<table class="table table-striped"> 
+  <thead>
+    <tr> 
+      <th>#</th>
+      <th>${_('Username')}</th>
+      <th>${_('Surname')}</th>
+      <th>${_('Given name')}</th>
+      <th>${_('E-Mail')}</th>
+      <th>${_('Payment good')}</th>
+      <th>${_('Tools')}</th>
+    </tr>
+    <tbody>
+    ${stream_rows()}
   </tbody>
 </table>
@@ -43,5 +43,4 @@ def getFormVar(s, c, var):
 <%
 if 'reqparams' in session:
   del session['reqparams']
-  session.save()
 %>
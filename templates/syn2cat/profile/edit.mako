@@ -59,8 +59,8 @@ def getFormVar(s, c, var):
         </td>
         <td>
           <%
-            full_member = r'<img src="/images/icons/notok.png">' if not c.member.fullMember else r'<img src="/images/icons/ok.png">'
-            locked_member = r'<img src="/images/icons/notok.png">' if not c.member.lockedMember else r'<img src="/images/icons/ok.png">'
+            full_member = '<img src="%s">' % asset_url('/images/icons/notok.png') if not c.member.fullMember else '<img src="%s">' % asset_url('/images/icons/ok.png')
+            locked_member = '<img src="%s">' % asset_url('/images/icons/notok.png') if not c.member.lockedMember else '<img src="%s">' % asset_url('/images/icons/ok.png')
             i = 0
             first = True
           %>
@@ -222,5 +222,4 @@ def getFormVar(s, c, var):
 <%
 if 'reqparams' in session:
   del session['reqparams']
-  session.save()
 %>
@@ -12,6 +12,26 @@
       </tr>
       % endif
       ${parent.all_messages()}
+      % if c.job:
+      <tr>
+        <td colspan="2">
+          <div class="notice" id="avatar-processing">
+            ${_('Your avatar is being processed')}
+          </div>
+          <script type="text/javascript">
+            (function poll() {
+              $.getJSON('/profile/avatarStatus', {job: '${c.job}'}, function(data) {
+                if (data.status == 'pending') {
+                  setTimeout(poll, 1000);
+                } else {
+                  window.location = '/profile/editAvatar/?job=${c.job}';
+                }
+              });
+            })();
+          </script>
+        </td>
+      </tr>
+      % endif
       <tr>
         <td>
           <img src="${c.member.avatarUrl}" alt="${_('user profile image')}">
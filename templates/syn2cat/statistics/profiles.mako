@@ -0,0 +1,31 @@
+<%inherit file="/base.mako" />
+<%! import datetime %>
+
+<table class="table table-striped">
+  <thead>
+  <tr>
+    <th>${_('Date')}</th>
+    <th>${_('View')}</th>
+    <th>${_('User')}</th>
+    <th>${_('Wall time')}</th>
+    <th>${_('Tools')}</th>
+  </tr>
+  </thead>
+  <tbody>
+  % for p in c.profiles:
+  <tr>
+    <td>${datetime.datetime.fromtimestamp(p['time']).strftime('%Y-%m-%d %H:%M:%S')}</td>
+    <td title="${p['path']}">${p['view']}</td>
+    <td>${p['user'] or ''}${'' if p['requested'] else ' ({0})'.format(_('sampled'))}</td>
+    <td>${'{0:.0f} ms'.format(p['wall'] * 1000)}</td>
+    <td>
+      <a href="/statistics/profileFile?name=${p['name']}&amp;ext=prof">.prof</a>
+      <a href="/statistics/profileFile?name=${p['name']}&amp;ext=collapsed">${_('flamegraph')}</a>
+    </td>
+  </tr>
+  % endfor
+  </tbody>
+</table>
+% if not c.profiles:
+<p>${_('Add _profile=1 to the address of a page to profile it.')}</p>
+% endif
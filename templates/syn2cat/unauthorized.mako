@@ -1,3 +1,3 @@
 <%inherit file="/base.mako" />
 
-<img src="/unauthorized.gif">
+<img src="${asset_url('/unauthorized.gif')}">
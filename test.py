@@ -11,6 +11,24 @@ from sqlalchemy.ext.declarative import declarative_base
 import mematool
 from mematool import Config
 from test.mematool.model.ldapModelFactory import TestLdapModelFactory
+from test.mematool.model.ldapmodel import TestBaseObject, TestSessionUser
+from test.mematool.model.savemember import TestUpdateMember
+from test.mematool.model.identitymap import TestIdentityMap
+from test.mematool.model.maildropindex import TestMaildropIndex
+from test.mematool.helpers.sessionstore import TestLruSession
+from test.mematool.helpers.pagecache import TestGeneration, TestCachedPage
+from test.mematool.helpers.cache import TestCache
+from test.mematool.helpers.profiler import TestCollapse
+from test.mematool.helpers.metrics import TestMetrics
+from test.mematool.helpers.nplusone import TestFingerprint
+from test.mematool.helpers.slowlog import TestPhases
+from test.mematool.helpers.postfix import TestWriteMap
+from test.mematool.helpers.avatars import TestAvatars
+from test.mematool.helpers.blobstore import TestBlobStore
+from test.mematool.helpers.templating import TestCatalogVersion, TestTranslatingPreprocessor
+from test.mematool.helpers.lechecker import TestSchema
+from test.mematool.config import TestConfig
+from test.mematool.controllers.profile import TestProfileEdit
 
 
 def bootstrap():
@@ -0,0 +1,45 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from mematool import Config
+
+
+class TestConfig(unittest.TestCase):
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    self.instance = Config.instance
+    self.path = Config.path
+    self.directory = tempfile.mkdtemp()
+    self.file = os.path.join(self.directory, 'mematool.conf')
+    self.write('[mematool]\nadmin_group = [group1, group2]\nvgroup_superadmin = [group1]\nworkers = 3\ndebug = true\n')
+    Config.load(self.file)
+
+  def tearDown(self):
+    unittest.TestCase.tearDown(self)
+    shutil.rmtree(self.directory)
+    Config.instance = self.instance
+    Config.path = self.path
+
+  def write(self, content):
+    with open(self.file, 'w') as f:
+      f.write(content)
+
+  def test_typedValues(self):
+    self.assertEqual(Config.get('mematool', 'admin_group'), ['group1', 'group2'])
+    self.assertEqual(Config.get_set('mematool', 'admin_group'), frozenset(['group1', 'group2']))
+    self.assertEqual(Config.get_vgroup('superadmin'), frozenset(['group1']))
+    self.assertEqual(Config.get_int('mematool', 'workers', 2), 3)
+    self.assertEqual(Config.get_int('mematool', 'missing', 2), 2)
+    self.assertTrue(Config.get_boolean('mematool', 'debug'))
+
+  def test_reloadOnChange(self):
+    self.assertFalse(Config.reload(force=False))
+
+    self.write('[mematool]\nadmin_group = [group3]\n')
+    # the modification time has a resolution of one second on some systems
+    os.utime(self.file, (time.time() + 2, time.time() + 2))
+
+    self.assertTrue(Config.reload(force=False))
+    self.assertEqual(Config.get_set('mematool', 'admin_group'), frozenset(['group3']))
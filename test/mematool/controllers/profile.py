@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import gettext
+import unittest
+import cherrypy
+from cherrypy._cperror import HTTPRedirect
+from mematool import Config
+from mematool.helpers.i18ntool import Lang
+from mematool.model import identitymap
+from mematool.helpers import avatars
+from mematool.helpers import cache
+from mematool.model.ldapmodel import Member
+from mematool.controllers.profile import ProfileController
+
+
+class StubFactory(object):
+  def getUser(self, uid, clear_credentials=False):
+    return identitymap.cached(uid, lambda: self._load(uid))
+
+  def _load(self, uid):
+    m = Member()
+    for k, v in (('uid', uid), ('uidNumber', '1000'), ('sn', 'Doe'), ('givenName', 'Alice'),
+                 ('homePostalAddress', '1 Main Street'), ('mail', 'alice@example.com'), ('loginShell', '/bin/bash'),
+                 ('arrivalDate', '2013-01-01'), ('conventionSigner', 'admin'), ('nationality', 'LU')):
+      m.set_property(k, v)
+    m.mark_loaded()
+
+    return m
+
+
+class StubDb(object):
+  def __init__(self):
+    self.added = []
+
+  def query(self, *args):
+    return self
+
+  def filter(self, *args):
+    return self
+
+  def count(self):
+    return 0
+
+  def add(self, obj):
+    self.added.append(obj)
+
+  def commit(self):
+    pass
+
+
+class Controller(ProfileController):
+  mf = StubFactory()
+
+  def sendMail(self, *args, **kwargs):
+    pass
+
+  def render(self, template_name, template_context=None, **kwargs):
+    return template_context
+
+
+class TestProfileEdit(unittest.TestCase):
+  def setUp(self):
+    self.instance = Config.instance
+    self.path = Config.path
+    self.directory = tempfile.mkdtemp()
+    config_file = os.path.join(self.directory, 'mematool.conf')
+    with open(config_file, 'w') as f:
+      f.write('[mematool]\nname_prefix = test\n[posix]\ndefault_gid = 100\nbase_home = /home\n')
+    Config.load(config_file)
+
+    self.db = cherrypy.request.db = StubDb()
+    cherrypy.response.i18n = Lang(None, gettext.NullTranslations())
+    cherrypy.serving.session = {'username': 'alice'}
+    if not hasattr(cherrypy, 'session'):
+      # as set up by the sessions tool
+      cherrypy.session = cherrypy._ThreadLocalProxy('session')
+    identitymap.IdentityMapTool().start()
+
+  def tearDown(self):
+    identitymap.IdentityMapTool().end()
+    del cherrypy.serving.session
+    shutil.rmtree(self.directory)
+    Config.instance = self.instance
+    Config.path = self.path
+
+  def post(self, **changes):
+    params = {'sn': 'Doe', 'givenName': 'Alice', 'homePostalAddress': '1 Main Street', 'homePhone': '',
+              'mobile': '', 'mail': 'alice@example.com', 'xmppID': ''}
+    params.update(changes)
+    cherrypy.request.params = params
+
+    self.assertRaises(HTTPRedirect, Controller().doEdit)
+
+  def test_changes(self):
+    self.post(sn='Smith')
+    self.assertEqual([tm.sn for tm in self.db.added], ['Smith'])
+    self.assertEqual(cherrypy.session['flash_class'], 'success')
+
+  def test_noChanges(self):
+    self.post()
+    self.assertEqual(self.db.added, [])
+    self.assertEqual(cherrypy.session['flash_class'], 'info')
+
+  def test_failedAvatar(self):
+    cache.set_cache(cache.LruCache())
+    try:
+      avatars._set_status('job', 'alice', avatars.FAILED)
+      c = Controller().editAvatar(job='job')
+    finally:
+      cache.set_cache(None)
+
+    self.assertIsNone(c.job)
+    self.assertEqual(cherrypy.session['flash_class'], 'error')
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+import cStringIO
+from PIL import Image
+from mematool.helpers import avatars
+from mematool.helpers import cache
+
+
+class TestAvatars(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    cache.set_cache(cache.LruCache())
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+    cache.set_cache(None)
+
+  def image(self, size):
+    out = cStringIO.StringIO()
+    Image.new('RGB', size, (255, 0, 0)).save(out, format='PNG')
+
+    return out.getvalue()
+
+  def test_render(self):
+    key, jpeg = avatars.render(self.image((400, 300)), self.dir)
+    self.assertEqual(key, avatars.photo_key(jpeg))
+
+    for size in avatars.SIZES:
+      path = avatars.rendition_path(self.dir, key, size)
+      self.assertEqual(max(Image.open(path).size), size)
+
+  def test_failedRender(self):
+    key, reason = avatars._render_safely('not an image', self.dir)
+    self.assertIsNone(key)
+    self.assertTrue(reason.startswith('IOError'))
+    self.assertEqual(os.listdir(self.dir), [])
+
+  def test_status(self):
+    avatars._set_status('job', 'alice', avatars.PENDING)
+    self.assertEqual(avatars.status('job', 'alice'), avatars.PENDING)
+    self.assertIsNone(avatars.status('job', 'bob'))
+    self.assertIsNone(avatars.status('unknown'))
+
+    avatars._set_status('job', 'alice', avatars.FAILED)
+    self.assertEqual(avatars.status('job'), avatars.FAILED)
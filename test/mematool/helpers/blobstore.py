@@ -0,0 +1,27 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mematool.helpers import blobstore
+
+
+class TestBlobStore(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.store = blobstore.BlobStore(self.dir)
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_put(self):
+    key = self.store.put('data')
+    self.assertTrue(self.store.exists(key))
+    self.assertEqual(self.store.get(key), 'data')
+    self.assertEqual(self.store.put('data'), key)
+    self.assertEqual(os.listdir(os.path.dirname(self.store.path(key))), [key])
+    self.assertNotEqual(self.store.put('other'), key)
+
+  def test_ref(self):
+    self.assertEqual(blobstore.parse_ref(blobstore.make_ref('abc')), 'abc')
+    self.assertIsNone(blobstore.parse_ref('\xff\xd8 a JPEG'))
+    self.assertIsNone(blobstore.parse_ref(None))
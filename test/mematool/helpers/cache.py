@@ -0,0 +1,103 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+from mematool.helpers import cache
+
+
+class MemcachedStandIn(threading.Thread):
+  '''Serves get, set, add, delete and incr of the memcached text protocol'''
+  def __init__(self):
+    threading.Thread.__init__(self)
+    self.daemon = True
+    self.data = {}
+    self.sock = socket.socket()
+    self.sock.bind(('127.0.0.1', 0))
+    self.sock.listen(5)
+    self.address = '{0}:{1}'.format(*self.sock.getsockname())
+
+  def run(self):
+    while True:
+      con, addr = self.sock.accept()
+      f = con.makefile('rb')
+      for line in iter(f.readline, ''):
+        cmd = line.split()
+        if cmd[0] in ('set', 'add'):
+          value = f.read(int(cmd[4]) + 2)[:-2]
+          if cmd[0] == 'add' and cmd[1] in self.data:
+            con.sendall('NOT_STORED\r\n')
+          elif int(cmd[3]) < 0:
+            # expired right away
+            self.data.pop(cmd[1], None)
+            con.sendall('STORED\r\n')
+          else:
+            self.data[cmd[1]] = value
+            con.sendall('STORED\r\n')
+        elif cmd[0] == 'get':
+          if cmd[1] in self.data:
+            con.sendall('VALUE {0} 0 {1}\r\n{2}\r\n'.format(cmd[1], len(self.data[cmd[1]]), self.data[cmd[1]]))
+          con.sendall('END\r\n')
+        elif cmd[0] == 'delete':
+          con.sendall('DELETED\r\n' if self.data.pop(cmd[1], None) is not None else 'NOT_FOUND\r\n')
+        elif cmd[0] == 'incr':
+          if cmd[1] in self.data:
+            self.data[cmd[1]] = str(int(self.data[cmd[1]]) + int(cmd[2]))
+            con.sendall(self.data[cmd[1]] + '\r\n')
+          else:
+            con.sendall('NOT_FOUND\r\n')
+
+
+class TestCache(unittest.TestCase):
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    unittest.TestCase.tearDown(self)
+    shutil.rmtree(self.directory)
+
+  def check(self, c):
+    self.assertEqual(c.get('a'), None)
+    c.set('a', ('text/html', u'\xe9t\xe9'))
+    self.assertEqual(c.get('a'), ('text/html', u'\xe9t\xe9'))
+    c.delete('a')
+    self.assertEqual(c.get('a'), None)
+
+    c.set('b', 1, ttl=-1)
+    self.assertEqual(c.get('b'), None)
+
+    self.assertEqual(c.generation('test'), 0)
+    self.assertEqual(c.bump_generation('test'), 1)
+    self.assertEqual(c.bump_generation('test'), 2)
+    self.assertEqual(c.generation('test'), 2)
+
+  def test_lru(self):
+    self.check(cache.LruCache())
+
+  def test_lruEvicts(self):
+    c = cache.LruCache(max_entries=2)
+    for i in range(3):
+      c.set(str(i), i)
+
+    self.assertEqual(c.get('0'), None)
+    self.assertEqual(c.get('2'), 2)
+
+  def test_sqlite(self):
+    self.check(cache.SqliteCache(os.path.join(self.directory, 'cache.sqlite')))
+
+  def test_memcached(self):
+    server = MemcachedStandIn()
+    server.start()
+    self.check(cache.MemcachedCache([server.address]))
+
+  def test_memcachedDown(self):
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    address = '{0}:{1}'.format(*sock.getsockname())
+    sock.close()
+
+    c = cache.MemcachedCache([address])
+    c.set('a', 1)
+    self.assertEqual(c.get('a'), None)
@@ -0,0 +1,49 @@
+import unittest
+import cherrypy
+from gettext import NullTranslations
+from mematool.helpers.i18ntool import Lang
+from mematool.helpers import lechecker
+from mematool.model.ldapmodel import Member
+
+
+class TestSchema(unittest.TestCase):
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    cherrypy.response.i18n = Lang('en', NullTranslations())
+
+  def valid_member(self):
+    m = Member()
+    m.uid = 'jdoe'
+    m.sn = 'Doe'
+    m.givenName = 'John'
+    m.homePostalAddress = '1 Main Street'
+    m.mail = 'jdoe@example.com'
+    m.loginShell = '/bin/bash'
+    m.arrivalDate = '2013-01-01'
+    m.conventionSigner = 'admin'
+    m.nationality = 'LU'
+    return m
+
+  def test_validMember(self):
+    m = self.valid_member()
+    self.assertTrue(m.check())
+
+  def test_allErrorsReported(self):
+    m = self.valid_member()
+    m.uid = 'John Doe'
+    m.mail = ''
+    m.nationality = 'xx'
+    errors = m.schema.errors(m.schema.attributes(m))
+    self.assertEqual(errors, ['Invalid username', 'Invalid e-mail address', 'Invalid nationality'])
+
+  def test_password(self):
+    self.assertEqual(lechecker.PASSWORD.errors({'userPassword': 'secret123', 'userPassword2': 'secret123'}), [])
+    self.assertEqual(lechecker.PASSWORD.errors({'userPassword': 'secret123'}), ['Second password not valid'])
+    self.assertEqual(lechecker.PASSWORD.errors({'userPassword': 'short', 'userPassword2': 'other'}),
+                     ['Invalid password', 'Passwords do not match'])
+
+  def test_int(self):
+    self.assertTrue(lechecker.INT.valid('12'))
+    self.assertFalse(lechecker.INT.valid('-1'))
+    self.assertFalse(lechecker.INT.replace(max_len=1).valid('12'))
+    self.assertFalse(lechecker.INT.valid(None))
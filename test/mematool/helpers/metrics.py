@@ -0,0 +1,46 @@
+import threading
+import unittest
+import cherrypy
+from mematool.helpers import metrics
+
+
+class TestMetrics(unittest.TestCase):
+  def test_shardsAreSummed(self):
+    counter = metrics.Counter('test_calls_total', 'Calls.', ('method',))
+    histogram = metrics.Histogram('test_seconds', 'Durations.', buckets=(.1, 1))
+
+    def work():
+      for i in range(100):
+        counter.inc('get')
+        histogram.observe(.5)
+
+    threads = [threading.Thread(target=work) for i in range(4)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+
+    self.assertEqual(counter.collect(), {('get',): 400})
+    self.assertTrue(u'test_calls_total{method="get"} 400' in counter.expose())
+
+    lines = histogram.expose()
+    self.assertTrue(u'test_seconds_bucket{le="0.1"} 0' in lines)
+    self.assertTrue(u'test_seconds_bucket{le="1"} 400' in lines)
+    self.assertTrue(u'test_seconds_bucket{le="+Inf"} 400' in lines)
+    self.assertTrue(u'test_seconds_count 400' in lines)
+
+  def test_tokenRequiredFromLocalhost(self):
+    request = cherrypy.serving.request
+    ip = request.remote.ip
+    request.remote.ip = '127.0.0.1'
+    try:
+      self.assertTrue(metrics.allowed(''))
+      self.assertFalse(metrics.allowed('secret'))
+      request.headers['Authorization'] = 'Bearer secret'
+      self.assertTrue(metrics.allowed(u'secret'))
+      request.remote.ip = '192.0.2.1'
+      self.assertTrue(metrics.allowed('secret'))
+      self.assertFalse(metrics.allowed(''))
+    finally:
+      request.remote.ip = ip
+      request.headers.pop('Authorization', None)
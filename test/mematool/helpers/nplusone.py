@@ -0,0 +1,18 @@
+import unittest
+from mematool.helpers import nplusone
+
+
+class TestFingerprint(unittest.TestCase):
+  def test_sql(self):
+    self.assertEqual(nplusone.sql_fingerprint("SELECT a FROM t\n WHERE id = 5 AND name = 'x''y' AND b IN (?, ?)"),
+                     'SELECT a FROM t WHERE id = ? AND name = ? AND b IN (?)')
+
+  def test_ldap(self):
+    a = nplusone.ldap_fingerprint('search', 'uid=alice,ou=People,dc=example,dc=com', '(uid=alice)')
+    b = nplusone.ldap_fingerprint('search', 'uid=bob,ou=People,dc=example,dc=com', '(uid=bob)')
+    self.assertEqual(a, b)
+    self.assertEqual(nplusone.ldap_fingerprint('search', 'dc=com', '(jpegPhoto=*)'), 'search dc=? (jpegPhoto=*)')
+
+  def test_offenders(self):
+    queries = {'a': {'kind': 'sql', 'count': 6, 'sites': []}, 'b': {'kind': 'ldap', 'count': 5, 'sites': []}}
+    self.assertEqual([f for f, e in nplusone.offenders(queries, 5)], ['a'])
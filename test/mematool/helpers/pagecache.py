@@ -0,0 +1,79 @@
+import unittest
+import datetime
+import cherrypy
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from mematool.helpers import pagecache
+from mematool.helpers import cache
+from mematool.model.dbmodel import Base, Group, Preferences
+
+
+class TestGeneration(unittest.TestCase):
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    self.db = sessionmaker(bind=engine)()
+    cache.set_cache(cache.LruCache())
+
+  def tearDown(self):
+    unittest.TestCase.tearDown(self)
+    self.db.close()
+    cache.set_cache(None)
+
+  def test_commitBumpsGeneration(self):
+    g = pagecache.generation()
+    self.db.add(Group(gid='test'))
+    self.db.commit()
+    self.assertEqual(pagecache.generation(), g + 1)
+
+  def test_rollbackKeepsGeneration(self):
+    g = pagecache.generation()
+    self.db.add(Group(gid='test'))
+    self.db.flush()
+    self.db.rollback()
+    self.db.commit()
+    self.assertEqual(pagecache.generation(), g)
+
+  def test_unwatchedModelKeepsGeneration(self):
+    g = pagecache.generation()
+    self.db.add(Preferences(uidNumber=1, key='language', value='en', last_change=datetime.datetime.now()))
+    self.db.commit()
+    self.assertEqual(pagecache.generation(), g)
+
+
+class TestCachedPage(unittest.TestCase):
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    cache.set_cache(cache.LruCache())
+    cherrypy.serving.session = {}
+    if not hasattr(cherrypy, 'session'):
+      # as set up by the sessions tool
+      cherrypy.session = cherrypy._ThreadLocalProxy('session')
+    self.calls = 0
+
+  def tearDown(self):
+    unittest.TestCase.tearDown(self)
+    del cherrypy.serving.session
+    cache.set_cache(None)
+
+  def page(self):
+    self.calls += 1
+    pagecache.mark_rendered()
+    return 'page'
+
+  def error(self):
+    self.calls += 1
+    return 'ERROR 4x0'
+
+  def test_pageIsCached(self):
+    for i in range(2):
+      self.assertEqual(pagecache.cached_page('view', TestCachedPage.page, self), 'page')
+    self.assertEqual(self.calls, 1)
+    self.assertTrue('ETag' in cherrypy.response.headers)
+
+  def test_errorIsNotCached(self):
+    for i in range(2):
+      self.assertEqual(pagecache.cached_page('view', TestCachedPage.error, self), 'ERROR 4x0')
+    self.assertEqual(self.calls, 2)
+    self.assertFalse('ETag' in cherrypy.response.headers)
@@ -0,0 +1,31 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mematool.helpers import postfix
+
+
+class TestWriteMap(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, 'virtual')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_write(self):
+    entries = [('example.com', None), ('info@example.com', ['alice', 'bob@example.org']), ('bad key@example.com', ['alice'])]
+    self.assertEqual(postfix.write_map(entries, self.path), 2)
+
+    with open(self.path) as f:
+      self.assertEqual(f.read(), postfix.HEADER + 'example.com\texample.com\ninfo@example.com\talice, bob@example.org\n')
+
+  def test_unchanged(self):
+    entries = [('example.com', None), ('info@example.com', ['alice'])]
+    postfix.write_map(entries, self.path)
+    mtime = os.stat(self.path).st_mtime
+
+    self.assertIsNone(postfix.write_map(reversed(entries), self.path))
+    self.assertEqual(os.stat(self.path).st_mtime, mtime)
+    self.assertEqual(postfix.write_map(entries[:1], self.path), 1)
+    self.assertEqual(os.listdir(self.dir), ['virtual'])
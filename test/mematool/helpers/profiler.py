@@ -0,0 +1,23 @@
+import pstats
+import cProfile
+import unittest
+from mematool.helpers import profiler
+
+
+def leaf():
+  return sum(range(10000))
+
+
+def branch():
+  return leaf() + leaf()
+
+
+class TestCollapse(unittest.TestCase):
+  def test_stacks(self):
+    profile = cProfile.Profile()
+    profile.runcall(branch)
+    lines = profiler.collapse(pstats.Stats(profile))
+
+    stacks = [l.rsplit(' ', 1)[0].split(';') for l in lines]
+    self.assertTrue(any(s[-2:] == ['profiler.py:7:leaf', '<range>'] for s in stacks))
+    self.assertTrue(all(int(l.rsplit(' ', 1)[1]) > 0 for l in lines))
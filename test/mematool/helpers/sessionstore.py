@@ -0,0 +1,65 @@
+import unittest
+from mematool.helpers.sessionstore import LruSession
+
+
+class TestLruSession(unittest.TestCase):
+  def setUp(self):
+    unittest.TestCase.setUp(self)
+    self.writes = []
+    self._store = LruSession._store
+
+    def counting_store(session, blob, expiration_time):
+      self.writes.append(session.id)
+      self._store(session, blob, expiration_time)
+
+    LruSession._store = counting_store
+
+  def tearDown(self):
+    unittest.TestCase.tearDown(self)
+    LruSession._store = self._store
+    LruSession.cache.clear()
+
+  def new_session(self, id=None):
+    s = LruSession(id, timeout=60, clean_freq=0)
+    s.acquire_lock()
+    return s
+
+  def test_emptySessionNotStored(self):
+    s = self.new_session()
+    s.load()
+    s.save()
+    self.assertEqual(self.writes, [])
+    self.assertEqual(len(s), 0)
+
+  def test_saveOnlyWhenDirty(self):
+    s = self.new_session()
+    s['language'] = 'en'
+    s.save()
+    s.save()
+    self.assertEqual(len(self.writes), 1)
+
+    s = self.new_session(s.id)
+    self.assertEqual(s['language'], 'en')
+    s['language'] = 'en'
+    s.save()
+    self.assertEqual(len(self.writes), 1)
+
+    s = self.new_session(s.id)
+    s['language'] = 'de'
+    s.save()
+    self.assertEqual(len(self.writes), 2)
+
+  def test_leastRecentlyUsedEvicted(self):
+    LruSession.max_entries = 2
+    try:
+      ids = []
+      for i in range(3):
+        s = self.new_session()
+        s['i'] = i
+        s.save()
+        ids.append(s.id)
+
+      self.assertEqual(len(LruSession.cache), 2)
+      self.assertNotIn(ids[0], LruSession.cache)
+    finally:
+      LruSession.max_entries = 10000
@@ -0,0 +1,27 @@
+import unittest
+import cherrypy
+from mematool.helpers import slowlog
+
+
+class TestPhases(unittest.TestCase):
+  def setUp(self):
+    slowlog.SlowLogTool().start()
+
+  def tearDown(self):
+    cherrypy.serving.request.__dict__.pop('_mematool_phases', None)
+
+  def test_add(self):
+    for i in range(slowlog.SLOWEST + 5):
+      slowlog.add('ldap', i / 100.0, 'getUser')
+    slowlog.add('sql', 1.0, 'SELECT ?')
+
+    request = cherrypy.serving.request
+    self.assertEqual(request._mematool_phases['ldap'][1], slowlog.SLOWEST + 5)
+    self.assertEqual(len(request._mematool_slowest), slowlog.SLOWEST)
+    self.assertEqual(max(request._mematool_slowest), (1.0, 'sql', 'SELECT ?'))
+    self.assertEqual(min(request._mematool_slowest)[0], 0.06)
+
+  def test_outside_request(self):
+    del cherrypy.serving.request._mematool_phases
+    slowlog.add('ldap', 1.0)
+    self.assertFalse(hasattr(cherrypy.serving.request, '_mematool_phases'))
@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mematool.helpers import templating
+
+
+class Catalog(object):
+  def __init__(self, files):
+    self.files = files
+
+
+class TestCatalogVersion(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, 'mematool.mo')
+    with open(self.path, 'w') as f:
+      f.write('old')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_changedCatalog(self):
+    version = templating.catalog_version(Catalog([self.path]))
+    self.assertEqual(templating.catalog_version(Catalog([self.path])), version)
+
+    with open(self.path, 'w') as f:
+      f.write('newer')
+    self.assertNotEqual(templating.catalog_version(Catalog([self.path])), version)
+
+
+class Upper(object):
+  def ugettext(self, message):
+    return message.upper()
+
+
+class TestTranslatingPreprocessor(unittest.TestCase):
+  def test_onlyCodeIsTranslated(self):
+    preprocess = templating.translating_preprocessor(Upper())
+    source = u"<script>alert(_('text'));</script>\n${_('a')} ${f(_('b'))}\n% if x == _('c'):\n<% y = _('d') %>\n"
+
+    self.assertEqual(preprocess(source),
+                     u"<script>alert(_('text'));</script>\nA ${f(u'B')}\n% if x == u'C':\n<% y = u'D' %>\n")
@@ -0,0 +1,29 @@
+import unittest
+from mematool.model import identitymap
+
+
+class TestIdentityMap(unittest.TestCase):
+  def setUp(self):
+    self.loads = []
+    identitymap.IdentityMapTool().start()
+
+  def tearDown(self):
+    identitymap.IdentityMapTool().end()
+
+  def load(self):
+    self.loads.append(1)
+    return object()
+
+  def test_cached(self):
+    a = identitymap.cached('uid=alice', self.load)
+    self.assertIs(identitymap.cached('uid=alice', self.load), a)
+    self.assertEqual(len(self.loads), 1)
+
+    identitymap.clear()
+    self.assertIsNot(identitymap.cached('uid=alice', self.load), a)
+
+  def test_outside_request(self):
+    identitymap.IdentityMapTool().end()
+    identitymap.cached('uid=alice', self.load)
+    identitymap.cached('uid=alice', self.load)
+    self.assertEqual(len(self.loads), 2)
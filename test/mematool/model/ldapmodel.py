@@ -0,0 +1,94 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from mematool import Config
+from mematool.model.ldapmodel import Member, Alias, SessionUser
+
+
+class TestBaseObject(unittest.TestCase):
+  def test_defaults(self):
+    m = Member()
+    self.assertEqual((m.uid, m.isMinor, m.jpegPhoto, m.groups), ('', False, None, []))
+    self.assertIsNot(m.groups, Member().groups)
+    self.assertIsNot(Alias().mail, Alias().mail)
+
+  def test_slots(self):
+    m = Member()
+    self.assertFalse(hasattr(m, '__dict__'))
+    self.assertIn('sn', m.auto_update_vars)
+    self.assertNotIn('uid', m.auto_update_vars)
+
+    m.paymentGood = True
+    with self.assertRaises(AttributeError):
+      m.unknown = 1
+
+  def test_set_property(self):
+    m = Member()
+    m.set_property('loginShell', '/bin/bash')
+    m.set_property('isMinor', 'TRUE')
+    m.set_property('shadowExpire', '1')
+    self.assertEqual((m.loginShell, m.isMinor), (u'/bin/bash', True))
+    self.assertFalse(hasattr(m, 'shadowExpire'))
+
+    other = Member()
+    other.set_property('loginShell', '/bin/bash')
+    self.assertIs(m.loginShell, other.loginShell)
+
+  def test_pickle(self):
+    m = Member()
+    m.set_property('uid', 'alice')
+    m.groups.append('members')
+
+    for protocol in (0, pickle.HIGHEST_PROTOCOL):
+      copy = pickle.loads(pickle.dumps(m, protocol))
+      self.assertEqual((copy.uid, copy.groups), (u'alice', ['members']))
+
+  def test_modified(self):
+    a = Alias()
+    a.set_property('dn_mail', 'info@example.com')
+    a.maildrop.append('alice')
+    a.mark_loaded()
+    self.assertEqual(a.modified(), [])
+
+    a.dn_mail = u'info@example.com'
+    a.maildrop.append('bob')
+    self.assertEqual(a.modified(), ['maildrop'])
+    self.assertEqual(a.modified(['dn_mail', 'mail']), [])
+    self.assertEqual(a.original('maildrop'), ('alice',))
+
+
+class TestSessionUser(unittest.TestCase):
+  def setUp(self):
+    self.instance = Config.instance
+    self.path = Config.path
+    self.directory = tempfile.mkdtemp()
+    self.file = os.path.join(self.directory, 'mematool.conf')
+    self.write('[mematool]\nadmin_user = [alice]\nadmin_group = [office]\nadmin_finance = [alice]\n')
+
+    self.user = SessionUser(Member())
+    self.user.uid = 'bob'
+    self.user.groups = ['members', 'office']
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+    Config.instance = self.instance
+    Config.path = self.path
+
+  def write(self, content):
+    with open(self.file, 'w') as f:
+      f.write(content)
+    Config.load(self.file)
+
+  def test_reload(self):
+    self.assertTrue(self.user.is_admin())
+    self.assertFalse(self.user.is_finance_admin())
+
+    self.write('[mematool]\nadmin_user = [alice]\nadmin_group = [board]\nadmin_finance = [bob]\n')
+    self.assertFalse(self.user.is_admin())
+    self.assertTrue(self.user.is_finance_admin())
+
+  def test_pickle(self):
+    user = pickle.loads(pickle.dumps(self.user, 2))
+    self.assertEqual((user.uid, user.groups), ('bob', ['members', 'office']))
@@ -0,0 +1,23 @@
+import unittest
+from mematool.model.maildropindex import MaildropIndex
+
+
+class TestMaildropIndex(unittest.TestCase):
+  def setUp(self):
+    self.index = MaildropIndex()
+    self.index.set('mail=info@example.com,dc=example.com,dc=example,dc=com', ['alice', 'bob'])
+    self.index.set('mail=alice@example.com,dc=example.com,dc=example,dc=com', ['Alice', 'alice@example.org'])
+
+  def test_routes(self):
+    self.assertEqual(self.index.routes('alice'), ['alice@example.com', 'info@example.com'])
+    self.assertEqual(self.index.routes('bob', 'alice@example.org'), ['alice@example.com', 'info@example.com'])
+    self.assertEqual(self.index.routes('carol'), [])
+
+  def test_changes(self):
+    self.index.remove_maildrop('mail=info@example.com, dc=example.com,dc=example,dc=com', 'alice')
+    self.assertEqual(self.index.maildrops('bob').values(), [['bob']])
+    self.assertEqual(self.index.routes('alice'), ['alice@example.com'])
+
+    self.index.remove('MAIL=alice@example.com,dc=example.com,dc=example,dc=com')
+    self.assertEqual(self.index.routes('alice'), [])
+    self.assertEqual(self.index.targets.keys(), ['bob'])
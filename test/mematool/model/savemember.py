@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+import cherrypy
+from mematool import Config
+from mematool.model.ldapmodel import Member
+from mematool.model.ldapModelFactory import LdapModelFactory
+
+
+class RecordingConnection(object):
+  def __init__(self):
+    self.modifications = []
+
+  def modify_s(self, dn, mod_attrs):
+    self.modifications.append((dn, mod_attrs))
+
+
+class TestUpdateMember(unittest.TestCase):
+  def setUp(self):
+    self.instance = Config.instance
+    self.path = Config.path
+    self.directory = tempfile.mkdtemp()
+    config_file = os.path.join(self.directory, 'mematool.conf')
+    with open(config_file, 'w') as f:
+      f.write('[mematool]\n[ldap]\nbasedn_users = ou=People,dc=example,dc=com\n[posix]\ndefault_gid = 100\nbase_home = /home\n')
+    Config.load(config_file)
+
+    cherrypy.request.db = None
+    self.con = RecordingConnection()
+    self.mf = LdapModelFactory(self.con)
+    self.member = Member()
+    for k, v in (('uid', 'alice'), ('uidNumber', '1000'), ('sn', 'Doe'), ('userPassword', '{SSHA}old'), ('sambaNTPassword', 'OLD')):
+      self.member.set_property(k, v)
+    self.member.mark_loaded()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+    Config.instance = self.instance
+    Config.path = self.path
+
+  def test_emptyPassword(self):
+    # as posted by the edit form when the password isn't changed
+    self.member.userPassword = ''
+    self.member.sn = u'Smith'
+    self.mf._updateMember(self.member)
+
+    self.assertEqual(self.con.modifications, [('uid=alice,ou=People,dc=example,dc=com', [(2, 'sn', 'Smith'), (2, 'cn', ' Smith')])])
+
+  def test_newPassword(self):
+    self.member.userPassword = '{SSHA}new'
+    self.member.sambaNTPassword = 'NEW'
+    self.mf._updateMember(self.member, is_admin=False)
+
+    self.assertEqual(self.con.modifications[0][1], [(2, 'userPassword', '{SSHA}new'), (2, 'sambaNTPassword', 'NEW')])